@@ -0,0 +1,483 @@
+"""
+Riot Games API 非同期クライアント - aiohttp / asyncio用
+"""
+import asyncio
+import functools
+import json
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+try:
+    import aiohttp
+    HAS_AIOHTTP = True
+except ImportError:
+    HAS_AIOHTTP = False
+
+try:
+    from http_pool import DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT
+    from rate_limiter import RateLimiter, default_limiter
+    from key_pool import KeyPool
+    from scheduler import RequestScheduler, default_scheduler, get_request_context, PRIORITY_INTERACTIVE
+    from single_flight import AsyncSingleFlight
+    from response_cache import ResponseCache, default_cache
+    from resilience import (CircuitBreakerRegistry, default_breakers, backoff_delay, is_retryable_status,
+                            DEFAULT_BACKOFF_BASE, DEFAULT_BACKOFF_CAP)
+    from client_metrics import ClientMetrics, default_metrics
+    from identity_cache import IdentityCache, get_default_identity_cache
+    from match_store import MatchStore, get_default_store
+    from match_sync import MatchIdSync, get_default_match_sync
+    from transport import HttpTransport, Transport, get_default_transport
+    from timeline import MatchTimeline, parse_timeline
+except ImportError:
+    from api.http_pool import DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT
+    from api.rate_limiter import RateLimiter, default_limiter
+    from api.key_pool import KeyPool
+    from api.scheduler import RequestScheduler, default_scheduler, get_request_context, PRIORITY_INTERACTIVE
+    from api.single_flight import AsyncSingleFlight
+    from api.response_cache import ResponseCache, default_cache
+    from api.resilience import (CircuitBreakerRegistry, default_breakers, backoff_delay, is_retryable_status,
+                                DEFAULT_BACKOFF_BASE, DEFAULT_BACKOFF_CAP)
+    from api.client_metrics import ClientMetrics, default_metrics
+    from api.identity_cache import IdentityCache, get_default_identity_cache
+    from api.match_store import MatchStore, get_default_store
+    from api.match_sync import MatchIdSync, get_default_match_sync
+    from api.transport import HttpTransport, Transport, get_default_transport
+    from api.timeline import MatchTimeline, parse_timeline
+
+
+class AsyncRiotAPIClient:
+    """
+    Riot Games API非同期クライアント
+
+    RiotAPIClientと同じメソッドをコルーチンとして提供する。
+    ホストごとに1つのコネクタ（keep-alive接続プール）を共有し、
+    同時実行数はセマフォで制限する。試合IDの差分同期・試合データ永続ストアは同期クライアントと共有し、
+    記録・再生のトランスポートが設定されていればaiohttpの代わりにそれを使う。
+
+    使い方:
+        async with AsyncRiotAPIClient() as client:
+            account = await client.get_account_by_riot_id("Hide on bush", "KR1")
+    """
+
+    def __init__(self, api_key: Optional[str] = None, region: str = "jp1", routing: str = "asia",
+                 max_concurrency: int = 50, limit_per_host: int = 20,
+                 connect_timeout: float = DEFAULT_CONNECT_TIMEOUT, read_timeout: float = DEFAULT_READ_TIMEOUT,
+                 rate_limiter: Optional[RateLimiter] = None, cache: Optional[ResponseCache] = None,
+                 breakers: Optional[CircuitBreakerRegistry] = None, api_keys: Optional[List[str]] = None,
+                 metrics: Optional[ClientMetrics] = None, identities: Optional[IdentityCache] = None,
+                 scheduler: Optional[RequestScheduler] = None, priority: str = PRIORITY_INTERACTIVE,
+                 match_store: Optional[MatchStore] = None, transport: Optional[Transport] = None):
+        """
+        初期化
+
+        Args:
+            api_key: Riot Games APIキー
+            region: リージョン (jp1, kr, na1, euw1, etc.)
+            routing: ルーティング (asia, americas, europe, sea)
+            max_concurrency: クライアント全体の同時リクエスト数上限
+            limit_per_host: ホストごとの同時接続数上限
+            connect_timeout: 接続タイムアウト（秒）
+            read_timeout: 読み取りタイムアウト（秒）
+            rate_limiter: レートリミッター（省略時はプロセス共有のもの）
+            cache: レスポンスキャッシュ（省略時はプロセス共有のもの）
+            breakers: ホスト別サーキットブレーカー（省略時はプロセス共有のもの）
+            api_keys: 分散して使うAPIキーのリスト（api_keyともに省略時はRIOT_API_KEYS / RIOT_API_KEY）
+            metrics: 送信結果の集計（省略時はプロセス共有のもの）
+            identities: Riot ID・サモナーIDの解決結果のキャッシュ（省略時はプロセス共有のもの）
+            scheduler: リクエストスケジューラー（省略時はプロセス共有のもの）
+            priority: 既定の優先度クラス（request_contextで上書き可能）
+            match_store: 試合データ永続ストア（省略時はプロセス共有のもの）
+            transport: 送信に使うトランスポート（省略時はRIOT_TRANSPORT_RECORD / RIOT_TRANSPORT_REPLAYに従う。
+                HttpTransportならaiohttpで送信する）
+        """
+        if not HAS_AIOHTTP:
+            raise ImportError("AsyncRiotAPIClientにはaiohttpが必要です")
+        self.rate_limiter = rate_limiter or default_limiter
+        # 同期クライアントと同じスケジューラーを通し、優先度クラス・ユーザー間の割り当てを共有する
+        key_pool = KeyPool(api_keys or [api_key]) if (api_keys or api_key) else None
+        if scheduler is None:
+            if key_pool is None and self.rate_limiter is default_limiter:
+                scheduler = default_scheduler
+            else:
+                scheduler = RequestScheduler(self.rate_limiter, key_pool=key_pool)
+        self.scheduler = scheduler
+        self.key_pool = scheduler.key_pool
+        self.priority = priority
+        self.api_key = self.key_pool.primary_key()
+        self.region = region
+        self.routing = routing
+        self.base_url = f"https://{region}.api.riotgames.com"
+        self.routing_url = f"https://{routing}.api.riotgames.com"
+        self.headers = {
+            "X-Riot-Token": self.api_key
+        }
+        self.max_concurrency = max_concurrency
+        self.limit_per_host = limit_per_host
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.single_flight = AsyncSingleFlight()
+        self.cache = cache or default_cache
+        self.breakers = breakers or default_breakers
+        self.metrics = metrics or default_metrics
+        self.identities = identities or get_default_identity_cache()
+        self.match_store = match_store or get_default_store()
+        # 試合IDの同期状態（ストアを明示しなければ同期クライアントとプロセス内で共有する）
+        self.match_sync = MatchIdSync(match_store) if match_store else get_default_match_sync()
+        self.transport = transport or get_default_transport()
+        self.backoff_base = DEFAULT_BACKOFF_BASE
+        self.backoff_cap = DEFAULT_BACKOFF_CAP
+        self._sessions: Dict[str, "aiohttp.ClientSession"] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        """全ホストのセッションを閉じる"""
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        for session in sessions:
+            await session.close()
+
+    def _get_session(self, url: str) -> "aiohttp.ClientSession":
+        """URLのホストに対応するセッション（コネクタ）を取得"""
+        parts = urlsplit(url)
+        key = f"{parts.scheme}://{parts.netloc}"
+        session = self._sessions.get(key)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit_per_host=self.limit_per_host, ttl_dns_cache=300)
+            session = aiohttp.ClientSession(
+                connector=connector,
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.read_timeout)
+            )
+            self._sessions[key] = session
+        return session
+
+    async def _send(self, url: str, headers: Optional[Dict]):
+        """
+        GETリクエストを送信
+
+        Returns:
+            (ステータスコード, レスポンスヘッダー, 本文)
+        """
+        if isinstance(self.transport, HttpTransport):
+            async with self._get_session(url).get(url, headers=headers) as response:
+                return response.status, response.headers, await response.read()
+        # 記録・再生のトランスポートは同期APIなのでスレッドプールで呼ぶ
+        response = await asyncio.get_running_loop().run_in_executor(None, functools.partial(
+            self.transport.get, url, headers=headers, timeout=(self.connect_timeout, self.read_timeout)))
+        return response.status_code, response.headers, response.content
+
+    async def _acquire_rate_limit(self, url: str):
+        """
+        優先度クラス順に送信枠を確保（スケジューラーを待たずに確認し、待機はイベントループ上で行う）
+
+        Returns:
+            送信後にscheduler.releaseへ渡すチケット（api_keyが送信に使うキー）
+        """
+        priority, user = get_request_context()
+        ticket = self.scheduler.enqueue(url, priority or self.priority, user)
+        try:
+            while True:
+                retry_in = self.scheduler.try_acquire(ticket)
+                if retry_in <= 0:
+                    return ticket
+                await asyncio.sleep(retry_in)
+        except BaseException:
+            # 待機中に取り消された場合はキューから外す（割り当て済みなら枠を返す）
+            self.scheduler.cancel(ticket)
+            raise
+
+    async def _make_request(self, url: str, retries: int = 3) -> Optional[Dict]:
+        """
+        APIリクエストを実行（キャッシュを優先し、同一URLへの同時リクエストは1回の上流呼び出しにまとめる）
+
+        Args:
+            url: リクエストURL
+            retries: リトライ回数
+
+        Returns:
+            レスポンスJSON（合流した呼び出し元間で共有されるため変更しないこと）
+        """
+        cached = self.cache.get(url)
+        if cached is not None:
+            return cached
+        return await self.single_flight.do(url, lambda: self._fetch(url, retries))
+
+    async def _fetch(self, url: str, retries: int = 3) -> Optional[Dict]:
+        """
+        APIリクエストを実行
+
+        Args:
+            url: リクエストURL
+            retries: リトライ回数
+
+        Returns:
+            レスポンスJSON
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async with self._semaphore:
+            for attempt in range(retries):
+                # 不調なホストへは送信せず即座に失敗させる
+                if not self.breakers.allow(url):
+                    print(f"Circuit open: ホストの回復待ちのため送信しません - {url}")
+                    return None
+                ticket = await self._acquire_rate_limit(url)
+                api_key = ticket.api_key
+                key = api_key.label if api_key is not None else None
+                headers = {"X-Riot-Token": api_key.key} if api_key is not None else None
+                started = time.monotonic()
+                try:
+                    try:
+                        status, response_headers, body = await self._send(url, headers)
+                    finally:
+                        self.scheduler.release(ticket)
+                except (aiohttp.ClientError, asyncio.TimeoutError, requests.RequestException) as e:
+                    self.metrics.observe(url, 'error', time.monotonic() - started)
+                    self.breakers.record_failure(url)
+                    print(f"Request error: {e}")
+                    if await self._backoff(attempt, retries):
+                        self.metrics.record_retry(url, 'error')
+                        continue
+                    return None
+                self.metrics.observe(url, status, time.monotonic() - started)
+                self.rate_limiter.update(url, response_headers, key)
+
+                if is_retryable_status(status):
+                    self.breakers.record_failure(url)
+                    print(f"Error: {status} - {body[:200]!r}")
+                    if await self._backoff(attempt, retries):
+                        self.metrics.record_retry(url, '5xx')
+                        continue
+                    return None
+                # ホストは応答している（404/429も含む）
+                self.breakers.record_success(url)
+
+                if status in (401, 403):
+                    # キーの失効・取り消し。ほかに使えるキーがあれば差し替えて再試行
+                    print(f"Error: {status} - {body[:200]!r}")
+                    self.key_pool.record_auth_failure(api_key, status)
+                    if api_key is not None and any(k is not api_key for k in self.key_pool.active_keys()):
+                        self.metrics.record_retry(url, 'auth')
+                        continue
+                    return None
+                self.key_pool.record_success(api_key)
+
+                if status == 200:
+                    try:
+                        data = json.loads(body)
+                    except ValueError as e:
+                        print(f"Invalid JSON: {e}")
+                        return None
+                    self.cache.put(url, data, len(body))
+                    return data
+                elif status == 429:  # Rate limit
+                    self.rate_limiter.on_rate_limited(url, response_headers, key)
+                    self.metrics.record_retry(url, '429')
+                    continue
+                elif status == 404:
+                    return None
+                else:
+                    print(f"Error: {status} - {body[:200]!r}")
+                    return None
+        return None
+
+    async def _backoff(self, attempt: int, retries: int) -> bool:
+        """
+        再試行が残っていればジッター付き指数バックオフで待機
+
+        Args:
+            attempt: 現在の試行回数（0始まり）
+            retries: リトライ回数
+
+        Returns:
+            再試行する場合True
+        """
+        if attempt >= retries - 1:
+            return False
+        await asyncio.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_cap))
+        return True
+
+    async def get_account_by_riot_id(self, game_name: str, tag_line: str) -> Optional[Dict]:
+        """
+        Riot ID (game_name#tag_line) からアカウント情報を取得
+
+        Args:
+            game_name: ゲーム内名前
+            tag_line: タグライン
+
+        Returns:
+            アカウント情報（解決済みのRiot IDはAPIを呼ばずに返す）
+        """
+        account = self.identities.get_account(game_name, tag_line, self.key_pool.project_label())
+        if account is not None:
+            return account
+        url = f"{self.routing_url}/riot/account/v1/accounts/by-riot-id/{game_name}/{tag_line}"
+        account = await self._make_request(url)
+        if account:
+            self.identities.put_account(game_name, tag_line, account, self.key_pool.project_label())
+        return account
+
+    async def get_summoner_by_puuid(self, puuid: str) -> Optional[Dict]:
+        """
+        PUUIDからサモナー情報を取得
+
+        Args:
+            puuid: プレイヤーUUID
+
+        Returns:
+            サモナー情報
+        """
+        url = f"{self.base_url}/lol/summoner/v4/summoners/by-puuid/{puuid}"
+        summoner = await self._make_request(url)
+        if summoner:
+            self.identities.put_summoner(summoner, self.region, self.key_pool.project_label())
+        return summoner
+
+    async def get_summoner_id(self, puuid: str) -> Optional[str]:
+        """
+        PUUIDからサモナーIDを取得
+
+        Args:
+            puuid: プレイヤーUUID
+
+        Returns:
+            サモナーID（解決済みならAPIを呼ばない）
+        """
+        summoner_id = self.identities.get_summoner_id(puuid, self.region, self.key_pool.project_label())
+        if summoner_id is None:
+            summoner = await self.get_summoner_by_puuid(puuid)
+            summoner_id = summoner.get('id') if summoner else None
+        return summoner_id
+
+    # queue_filter=True で対象にするキュー
+    # 420: ランクソロ, 440: ランクフレックス, 400: ノーマルドラフト, 430: ノーマルブラインド
+    HISTORY_QUEUES = (420, 440, 400, 430)
+
+    async def get_match_history(self, puuid: str, count: int = 20, queue_filter: bool = True) -> Optional[List[str]]:
+        """
+        マッチ履歴のIDリストを取得（新しい順）
+
+        同期クライアントと同じ差分同期を使い、2回目以降は前回以降の試合IDだけをstartTimeで取得する。
+        差分同期は同期APIなのでスレッドプールで実行し、ids エンドポイントの呼び出しはこのループで行う
+
+        Args:
+            puuid: プレイヤーUUID
+            count: 取得する試合数
+            queue_filter: ランク・ノーマルのみに限定するか
+
+        Returns:
+            マッチIDのリスト
+        """
+        queues = self.HISTORY_QUEUES if queue_filter else ()
+        loop = asyncio.get_running_loop()
+        base_url = f"{self.routing_url}/lol/match/v5/matches/by-puuid/{puuid}/ids"
+        queue_params = ''.join(f"&queue={queue}" for queue in queues)
+
+        def fetch_page(start: int, page_count: int, start_time: Optional[int] = None) -> Optional[List[str]]:
+            url = f"{base_url}?start={start}&count={page_count}{queue_params}"
+            if start_time is not None:
+                url += f"&startTime={start_time}"
+            return asyncio.run_coroutine_threadsafe(self._make_request(url), loop).result()
+
+        return await loop.run_in_executor(
+            None, functools.partial(self.match_sync.recent, puuid, queues, count, fetch_page))
+
+    async def get_match_detail(self, match_id: str) -> Optional[Dict]:
+        """
+        試合の詳細情報を取得
+
+        Args:
+            match_id: マッチID
+
+        Returns:
+            試合詳細情報
+        """
+        url = f"{self.routing_url}/lol/match/v5/matches/{match_id}"
+        if self.match_store is None:
+            return await self._make_request(url)
+
+        # 保存済みの試合はネットワークに出ずに返す（終了した試合は不変）
+        match_data = self.match_store.get(match_id)
+        if match_data is None:
+            match_data = await self._make_request(url)
+            if match_data:
+                self.match_store.put(match_data)
+        return match_data
+
+    async def get_match_timeline(self, match_id: str) -> Optional[MatchTimeline]:
+        """
+        試合のタイムラインを取得（フレームの数値配列とイベントの表に変換して返す）
+
+        Args:
+            match_id: マッチID
+
+        Returns:
+            MatchTimeline（取得できなければNone）
+        """
+        url = f"{self.routing_url}/lol/match/v5/matches/{match_id}/timeline"
+        timeline_data = await self._make_request(url)
+        if not timeline_data:
+            return None
+        return parse_timeline(timeline_data)
+
+    async def get_current_game(self, puuid: str) -> Optional[Dict]:
+        """
+        現在のゲーム情報を取得
+
+        Args:
+            puuid: プレイヤーUUID
+
+        Returns:
+            現在のゲーム情報
+        """
+        url = f"{self.base_url}/lol/spectator/v5/active-games/by-summoner/{puuid}"
+        return await self._make_request(url)
+
+    async def get_ranked_stats(self, summoner_id: str) -> Optional[List[Dict]]:
+        """
+        ランク情報を取得
+
+        Args:
+            summoner_id: サモナーID（暗号化されたサモナーID）
+
+        Returns:
+            ランク情報のリスト
+        """
+        url = f"{self.base_url}/lol/league/v4/entries/by-summoner/{summoner_id}"
+        return await self._make_request(url)
+
+    async def get_ranked_stats_by_puuid(self, puuid: str) -> Optional[List[Dict]]:
+        """
+        PUUIDからランク情報を取得（league-v4 by-puuid、サモナー情報の取得は不要）
+
+        Args:
+            puuid: プレイヤーUUID
+
+        Returns:
+            ランク情報のリスト
+        """
+        url = f"{self.base_url}/lol/league/v4/entries/by-puuid/{puuid}"
+        return await self._make_request(url)
+
+    async def get_champion_mastery(self, puuid: str) -> Optional[List[Dict]]:
+        """
+        チャンピオンマスタリー情報を取得
+
+        Args:
+            puuid: プレイヤーUUID
+
+        Returns:
+            チャンピオンマスタリー情報
+        """
+        url = f"{self.base_url}/lol/champion-mastery/v4/champion-masteries/by-puuid/{puuid}"
+        return await self._make_request(url)
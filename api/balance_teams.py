@@ -49,7 +49,6 @@ class handler(BaseHTTPRequestHandler):
                     return
                 
                 puuid = account['puuid']
-                summoner = riot_client.get_summoner_by_puuid(puuid)
                 
                 # ランク情報取得
                 rank_score = 0
@@ -0,0 +1,317 @@
+"""
+クライアントメトリクス - 上流エンドポイント別のレイテンシ・ステータス・再試行と各層の状態を集計
+"""
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from rate_limiter import default_limiter, get_method_name
+    from response_cache import default_cache
+    from match_store import get_default_store
+    from single_flight import default_flight
+    from http_pool import get_pool_stats
+    from resilience import default_breakers
+    from scheduler import default_scheduler
+    from key_pool import default_key_pool
+    from transport import get_default_transport
+    from identity_cache import get_default_identity_cache
+except ImportError:
+    from api.rate_limiter import default_limiter, get_method_name
+    from api.response_cache import default_cache
+    from api.match_store import get_default_store
+    from api.single_flight import default_flight
+    from api.http_pool import get_pool_stats
+    from api.resilience import default_breakers
+    from api.scheduler import default_scheduler
+    from api.key_pool import default_key_pool
+    from api.transport import get_default_transport
+    from api.identity_cache import get_default_identity_cache
+
+
+# レイテンシのヒストグラムの境界（秒）。上限なしの+Infは自動で加える
+DEFAULT_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Prometheusテキスト形式のContent-Type
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_process_started_at = time.time()
+
+
+class _Histogram:
+    """1エンドポイント分のレイテンシ分布"""
+
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class ClientMetrics:
+    """
+    Riot APIクライアントの送信結果の集計
+
+    クライアントの_fetchが1回送信するごとにobserveを、再試行するごとに
+    record_retryを呼ぶ。エンドポイントはレート制限と同じメソッド名
+    （match-v5:match など）でまとめる。
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS):
+        """
+        初期化
+
+        Args:
+            buckets: レイテンシのヒストグラムの境界（秒、昇順）
+        """
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._latency: Dict[str, _Histogram] = {}
+        self._statuses: Dict[str, Dict[str, int]] = {}
+        self._retries: Dict[str, Dict[str, int]] = {}
+
+    def observe(self, url: str, status, duration: float):
+        """
+        1回の送信結果を記録
+
+        Args:
+            url: リクエストURL
+            status: HTTPステータス（接続エラー・タイムアウトは 'error'）
+            duration: 送信から応答までの秒数
+        """
+        method = get_method_name(url)
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if duration <= bound:
+                index = i
+                break
+        with self._lock:
+            histogram = self._latency.get(method)
+            if histogram is None:
+                histogram = self._latency[method] = _Histogram(len(self.buckets) + 1)
+            histogram.counts[index] += 1
+            histogram.sum += duration
+            histogram.count += 1
+            statuses = self._statuses.setdefault(method, {})
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    def record_retry(self, url: str, reason: str):
+        """
+        再試行を記録
+
+        Args:
+            url: リクエストURL
+            reason: 再試行の理由（error / 5xx / 429 / auth）
+        """
+        method = get_method_name(url)
+        with self._lock:
+            retries = self._retries.setdefault(method, {})
+            retries[reason] = retries.get(reason, 0) + 1
+
+    def snapshot(self) -> Dict:
+        """
+        エンドポイントごとの集計を取得
+
+        Returns:
+            {メソッド名: {count, sum, avg, buckets: {境界: 累積件数}, statuses, retries}}
+        """
+        with self._lock:
+            methods = set(self._latency) | set(self._retries)
+            result = {}
+            for method in sorted(methods):
+                histogram = self._latency.get(method)
+                entry = {'count': 0, 'sum': 0.0, 'avg': 0.0, 'buckets': {}}
+                if histogram is not None:
+                    cumulative = 0
+                    buckets = {}
+                    for bound, count in zip(self.buckets + (float('inf'),), histogram.counts):
+                        cumulative += count
+                        buckets[_format_bound(bound)] = cumulative
+                    entry = {
+                        'count': histogram.count,
+                        'sum': round(histogram.sum, 4),
+                        'avg': round(histogram.sum / histogram.count, 4) if histogram.count else 0.0,
+                        'buckets': buckets,
+                    }
+                entry['statuses'] = dict(self._statuses.get(method, {}))
+                entry['retries'] = dict(self._retries.get(method, {}))
+                result[method] = entry
+        return result
+
+    def reset(self):
+        """集計をすべて消去"""
+        with self._lock:
+            self._latency.clear()
+            self._statuses.clear()
+            self._retries.clear()
+
+
+def _format_bound(bound: float) -> str:
+    """ヒストグラムの境界をPrometheusのle表記にする"""
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+# プロセス内で共有するメトリクス
+default_metrics = ClientMetrics()
+
+
+def collect_metrics(metrics: Optional[ClientMetrics] = None) -> Dict:
+    """
+    クライアント層全体のメトリクスを取得
+
+    Vercelではインスタンスごとの値になる（インスタンス間では集計されない）
+
+    Args:
+        metrics: 送信結果の集計（省略時はプロセス共有のもの）
+
+    Returns:
+        upstream/rate_limits/cache/match_store/identities/single_flight/scheduler/circuit_breakers/api_keys/
+        http_pool/transport
+    """
+    metrics = metrics or default_metrics
+    store = get_default_store()
+    store_stats = None
+    if store is not None:
+        store_stats = store.get_stats()
+        lookups = store_stats['hits'] + store_stats['misses']
+        store_stats['hit_ratio'] = round(store_stats['hits'] / lookups, 4) if lookups else 0.0
+    return {
+        'uptime_seconds': round(time.time() - _process_started_at, 1),
+        'upstream': metrics.snapshot(),
+        'rate_limiter': dict(default_limiter.stats),
+        'rate_limits': default_limiter.get_status(),
+        'cache': default_cache.get_stats(),
+        'match_store': store_stats,
+        'identities': get_default_identity_cache().get_stats(),
+        'single_flight': dict(default_flight.stats),
+        'scheduler': default_scheduler.get_stats(),
+        'circuit_breakers': default_breakers.get_status(),
+        'api_keys': default_key_pool.get_status(),
+        'http_pool': get_pool_stats(),
+        # 記録・再生中のみ（通常の送信ではNone）
+        'transport': dict(getattr(get_default_transport(), 'stats', None) or {}) or None,
+    }
+
+
+def _escape(value) -> str:
+    """ラベル値をエスケープ"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels) -> str:
+    """{name="value",...} 形式のラベル"""
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+_BREAKER_STATE_VALUES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+
+def render_prometheus(data: Optional[Dict] = None) -> str:
+    """
+    メトリクスをPrometheusのテキスト形式にする
+
+    Args:
+        data: collect_metricsの結果（省略時は現在の値を取得）
+
+    Returns:
+        テキスト形式のメトリクス
+    """
+    data = data if data is not None else collect_metrics()
+    lines: List[str] = []
+
+    def metric(name: str, kind: str, help_text: str, samples):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for suffix, labels, value in samples:
+            lines.append(f'{name}{suffix}{_labels(**labels)} {value}')
+
+    upstream = data['upstream']
+    histogram_samples = []
+    for method, entry in upstream.items():
+        if not entry['count']:
+            continue
+        for bound, count in entry['buckets'].items():
+            histogram_samples.append(('_bucket', {'method': method, 'le': bound}, count))
+        histogram_samples.append(('_sum', {'method': method}, entry['sum']))
+        histogram_samples.append(('_count', {'method': method}, entry['count']))
+    metric('riot_upstream_request_duration_seconds', 'histogram',
+           'Latency of requests to the Riot API by endpoint', histogram_samples)
+    metric('riot_upstream_responses_total', 'counter', 'Responses from the Riot API by endpoint and status',
+           [('', {'method': method, 'status': status}, count)
+            for method, entry in upstream.items() for status, count in entry['statuses'].items()])
+    metric('riot_upstream_retries_total', 'counter', 'Retried requests by endpoint and reason',
+           [('', {'method': method, 'reason': reason}, count)
+            for method, entry in upstream.items() for reason, count in entry['retries'].items()])
+
+    limiter = data['rate_limiter']
+    metric('riot_rate_limited_total', 'counter', '429 responses received', [('', {}, limiter['rate_limited'])])
+    metric('riot_rate_limit_delayed_total', 'counter', 'Requests that waited for a rate limit slot',
+           [('', {}, limiter['delayed'])])
+    metric('riot_rate_limit_wait_seconds_total', 'counter', 'Total time spent waiting for rate limit slots',
+           [('', {}, round(limiter['total_wait'], 4))])
+    metric('riot_rate_limit_rejected_total', 'counter', 'Requests abandoned while waiting for a rate limit slot',
+           [('', {}, limiter['rejected'])])
+    limit_samples = []
+    headroom_samples = []
+    for scope, buckets in data['rate_limits'].items():
+        for bucket, windows in buckets.items():
+            for window, state in windows.items():
+                labels = {'scope': scope, 'bucket': bucket, 'window': window}
+                limit_samples.append(('', labels, state['limit']))
+                headroom_samples.append(('', labels, state['headroom']))
+    metric('riot_rate_limit_limit', 'gauge', 'Rate limit reported by the Riot API response headers', limit_samples)
+    metric('riot_rate_limit_headroom', 'gauge', 'Requests left in the current rate limit window', headroom_samples)
+
+    cache = data['cache']
+    metric('riot_cache_hits_total', 'counter', 'Response cache hits', [('', {}, cache['hits'])])
+    metric('riot_cache_misses_total', 'counter', 'Response cache misses', [('', {}, cache['misses'])])
+    metric('riot_cache_hit_ratio', 'gauge', 'Response cache hit ratio', [('', {}, cache['hit_ratio'])])
+    metric('riot_cache_entries', 'gauge', 'Response cache entries', [('', {}, cache['entries'])])
+    metric('riot_cache_bytes', 'gauge', 'Response cache size in bytes', [('', {}, cache['bytes'])])
+
+    store = data['match_store']
+    if store is not None:
+        metric('riot_match_store_hits_total', 'counter', 'Match store hits', [('', {}, store['hits'])])
+        metric('riot_match_store_misses_total', 'counter', 'Match store misses', [('', {}, store['misses'])])
+        metric('riot_match_store_hit_ratio', 'gauge', 'Match store hit ratio', [('', {}, store['hit_ratio'])])
+
+    identities = data['identities']
+    metric('riot_identity_cache_hits_total', 'counter', 'Riot ID and summoner ID lookups served without the API',
+           [('', {}, identities['hits'] + identities['store_hits'])])
+    metric('riot_identity_cache_misses_total', 'counter', 'Riot ID and summoner ID lookups that needed the API',
+           [('', {}, identities['misses'])])
+
+    flight = data['single_flight']
+    metric('riot_single_flight_coalesced_total', 'counter', 'Requests served by an in-flight identical request',
+           [('', {}, flight['coalesced'])])
+
+    scheduler = data['scheduler']
+    metric('riot_scheduler_queue_depth', 'gauge', 'Requests waiting for a send slot by priority class',
+           [('', {'class': p}, s['queue_depth']) for p, s in scheduler.items()])
+    metric('riot_scheduler_in_flight', 'gauge', 'Requests in flight by priority class',
+           [('', {'class': p}, s['in_flight']) for p, s in scheduler.items()])
+    metric('riot_scheduler_max_wait_seconds', 'gauge', 'Longest wait for a send slot by priority class',
+           [('', {'class': p}, s['max_wait']) for p, s in scheduler.items()])
+
+    breakers = data['circuit_breakers']
+    metric('riot_circuit_breaker_state', 'gauge', 'Circuit breaker state (0=closed, 1=half_open, 2=open)',
+           [('', {'host': host}, _BREAKER_STATE_VALUES.get(s['state'], 0)) for host, s in breakers.items()])
+    metric('riot_circuit_breaker_failures_total', 'counter', 'Failures recorded by the circuit breaker',
+           [('', {'host': host}, s['failures']) for host, s in breakers.items()])
+
+    keys = data['api_keys']
+    metric('riot_api_key_active', 'gauge', 'Whether the API key is in rotation',
+           [('', {'key': k['label']}, int(k['active'])) for k in keys])
+    metric('riot_api_key_requests_total', 'counter', 'Requests sent with the API key',
+           [('', {'key': k['label']}, k['requests']) for k in keys])
+
+    pool = data['http_pool']
+    metric('riot_http_new_connections_total', 'counter', 'New HTTP connections by host',
+           [('', {'host': host}, s['new_connections']) for host, s in pool.items()])
+    metric('riot_http_reused_connections_total', 'counter', 'Reused HTTP connections by host',
+           [('', {'host': host}, s['reused_connections']) for host, s in pool.items()])
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,54 @@
+"""
+並行実行ユーティリティ - ブロッキングなAPI呼び出しをスレッドプールで並列化
+"""
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+
+def iter_concurrent(func: Callable[[Any], Any], items: Iterable[Any],
+                    max_workers: int = 8) -> Iterator[Tuple[Any, Any, Optional[Exception]]]:
+    """
+    itemsそれぞれにfuncを並列適用し、完了した順に結果を返す
+
+    各ワーカーは呼び出し元のコンテキスト（スケジューラーの優先度クラスなど）を引き継ぐ
+
+    Args:
+        func: 各要素に適用する関数
+        items: 入力要素
+        max_workers: 最大ワーカー数
+
+    Yields:
+        (入力要素, 結果, 例外) のタプル。成功時の例外はNone
+    """
+    items = list(items)
+    if not items:
+        return
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as executor:
+        futures = {executor.submit(contextvars.copy_context().run, func, item): item for item in items}
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                yield item, future.result(), None
+            except Exception as e:
+                yield item, None, e
+
+
+def map_concurrent(func: Callable[[Any], Any], items: Iterable[Any],
+                   max_workers: int = 8) -> List[Tuple[Any, Any, Optional[Exception]]]:
+    """
+    itemsそれぞれにfuncを並列適用し、入力順で結果を返す
+
+    Args:
+        func: 各要素に適用する関数
+        items: 入力要素
+        max_workers: 最大ワーカー数
+
+    Returns:
+        (入力要素, 結果, 例外) のタプルのリスト
+    """
+    items = list(items)
+    results = {}
+    for index, result, error in iter_concurrent(lambda i: func(items[i]), range(len(items)), max_workers):
+        results[index] = (items[index], result, error)
+    return [results[i] for i in range(len(items))]
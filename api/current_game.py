@@ -83,17 +83,20 @@ class handler(BaseHTTPRequestHandler):
                 self.send_error_response({'error': 'ゲーム中ではありません'}, 404)
                 return
             
-            # 各プレイヤーの情報を取得
+            # 各プレイヤーの情報を並列取得
+            participants = current_game.get('participants', [])
+            participants_info = riot_client.get_participants_info(
+                [participant['puuid'] for participant in participants], include_summoner=True
+            )
+            
             players = []
-            for participant in current_game.get('participants', []):
-                player_puuid = participant['puuid']
-                summoner = riot_client.get_summoner_by_puuid(player_puuid)
+            for participant in participants:
+                player_info = participants_info[participant['puuid']]
+                summoner = player_info['summoner']
                 
-                ranked_stats = []
                 rank_info = "Unranked"
-                rank_score = 0
                 
-                ranked_stats = riot_client.get_ranked_stats_by_puuid(player_puuid) or []
+                ranked_stats = player_info['ranked_stats'] or []
                 if ranked_stats:
                     for rank in ranked_stats:
                         if rank['queueType'] == 'RANKED_SOLO_5x5':
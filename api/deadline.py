@@ -0,0 +1,134 @@
+"""
+リクエストの時間予算 - Vercelの実行時間制限内で打ち切り、途中結果を返すための期限管理
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+from typing import Dict, Optional
+
+
+# 1リクエストあたりの時間予算（秒）。Vercelの実行時間制限（既定10秒）より短くする
+DEFAULT_REQUEST_BUDGET = float(os.environ.get('RIOT_REQUEST_BUDGET', 8))
+
+# レスポンスの組み立て・送信のために残しておく時間（秒）
+DEFAULT_RESERVE = 0.5
+
+# continuationトークンの署名鍵。未設定ならAPIキーから導出する（インスタンス間で共通にするため）
+_TOKEN_SECRET = (os.environ.get('RIOT_CONTINUATION_SECRET') or
+                 'continuation:' + (os.environ.get('RIOT_API_KEYS') or os.environ.get('RIOT_API_KEY') or ''))
+
+# continuationトークンの有効期間（秒）。期限を過ぎたトークンは使い回せない
+CONTINUATION_TOKEN_TTL = float(os.environ.get('RIOT_CONTINUATION_TTL', 600))
+
+
+class DeadlineExceeded(Exception):
+    """時間予算を使い切ったため処理しなかった"""
+
+
+class Deadline:
+    """
+    リクエスト受付時に作成する期限
+
+    ハンドラーからクライアントへ渡し、HTTPタイムアウト・レート制限の待機・
+    再試行のバックオフを残り時間以内に収める。
+    """
+
+    def __init__(self, budget: float = DEFAULT_REQUEST_BUDGET, reserve: float = DEFAULT_RESERVE):
+        """
+        初期化
+
+        Args:
+            budget: 時間予算（秒）
+            reserve: expired()判定で残しておく時間（秒）
+        """
+        self.budget = budget
+        self.reserve = reserve
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + budget
+
+    def remaining(self) -> float:
+        """残り時間（秒、負にはならない）"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def elapsed(self) -> float:
+        """経過時間（秒）"""
+        return time.monotonic() - self.started_at
+
+    def expired(self) -> bool:
+        """残り時間が予備時間以下になったか判定"""
+        return self.expires_at - time.monotonic() <= self.reserve
+
+    def usable(self) -> float:
+        """予備時間を除いて使える残り時間（秒）"""
+        return max(0.0, self.remaining() - self.reserve)
+
+    def clamp(self, seconds: float) -> float:
+        """
+        待機時間・タイムアウトを使える残り時間以内に収める
+
+        Args:
+            seconds: 本来の秒数
+
+        Returns:
+            min(seconds, 使える残り時間)
+        """
+        return min(seconds, self.usable())
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _sign(payload: str) -> str:
+    digest = hmac.new(_TOKEN_SECRET.encode('utf-8'), payload.encode('ascii'), hashlib.sha256).digest()
+    return _b64encode(digest)
+
+
+def encode_continuation_token(data: Dict, ttl: float = CONTINUATION_TOKEN_TTL) -> str:
+    """
+    続きの取得に必要な情報をURLに載せられる署名付きトークンにする
+
+    Args:
+        data: JSONに変換できる辞書
+        ttl: 有効期間（秒）
+
+    Returns:
+        URLセーフなBase64文字列（本体.HMAC-SHA256署名）
+    """
+    body = dict(data, exp=int(time.time() + ttl))
+    payload = _b64encode(json.dumps(body, separators=(',', ':')).encode('utf-8'))
+    return f"{payload}.{_sign(payload)}"
+
+
+def decode_continuation_token(token: str) -> Optional[Dict]:
+    """
+    トークンの署名を検証して復元
+
+    Args:
+        token: encode_continuation_tokenで作成した文字列
+
+    Returns:
+        復元した辞書（署名が一致しない・期限切れ・不正なトークンならNone）
+    """
+    if not isinstance(token, str):
+        return None
+    payload, _, signature = token.partition('.')
+    try:
+        if not hmac.compare_digest(signature, _sign(payload)):
+            return None
+        data = json.loads(_b64decode(payload))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(data, dict):
+        return None
+    expires_at = data.pop('exp', None)
+    if not isinstance(expires_at, int) or expires_at < time.time():
+        return None
+    return data
@@ -0,0 +1,185 @@
+"""
+HTTP接続プール - Riot APIホストごとのkeep-aliveセッションをプロセス内で共有
+"""
+import os
+import threading
+import time
+import weakref
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+# プール設定（環境変数で上書き可能）
+_config = {
+    'pool_connections': int(os.environ.get('RIOT_HTTP_POOL_CONNECTIONS', 4)),
+    'pool_maxsize': int(os.environ.get('RIOT_HTTP_POOL_MAXSIZE', 16)),
+    'idle_timeout': float(os.environ.get('RIOT_HTTP_IDLE_TIMEOUT', 60)),
+}
+
+# リクエストタイムアウト（秒）。requestsには (接続, 読み取り) のタプルで渡す
+DEFAULT_CONNECT_TIMEOUT = float(os.environ.get('RIOT_HTTP_CONNECT_TIMEOUT', 3.05))
+DEFAULT_READ_TIMEOUT = float(os.environ.get('RIOT_HTTP_READ_TIMEOUT', 10))
+
+_lock = threading.Lock()
+_sessions: Dict[str, Dict] = {}
+_stats: Dict[str, Dict[str, int]] = {}
+
+
+def _host_stats(host: str) -> Dict[str, int]:
+    """ホスト別カウンタを取得（_lock保持中に呼ぶ）"""
+    return _stats.setdefault(host, {'requests': 0, 'new_connections': 0, 'evictions': 0})
+
+
+def _record(host: str, key: str, amount: int = 1):
+    """ホスト別カウンタを加算"""
+    with _lock:
+        _host_stats(host)[key] += amount
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    """新規接続数を記録するコネクションプール"""
+
+    def _new_conn(self):
+        _record(self.host, 'new_connections')
+        return super()._new_conn()
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    """新規接続数を記録するコネクションプール（TLS）"""
+
+    def _new_conn(self):
+        _record(self.host, 'new_connections')
+        return super()._new_conn()
+
+
+class _CountingAdapter(HTTPAdapter):
+    """リクエスト数を記録するアダプタ"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _CountingHTTPConnectionPool,
+            'https': _CountingHTTPSConnectionPool,
+        }
+
+    def send(self, request, **kwargs):
+        _record(urlsplit(request.url).hostname or '', 'requests')
+        return super().send(request, **kwargs)
+
+
+def _close_adapters(adapters):
+    """破棄したセッションの接続を閉じる（セッションが参照されなくなった時・プロセス終了時に呼ばれる）"""
+    for adapter in adapters:
+        adapter.close()
+
+
+def _new_session() -> requests.Session:
+    """プール設定を反映したセッションを作成"""
+    session = requests.Session()
+    adapter = _CountingAdapter(
+        pool_connections=_config['pool_connections'],
+        pool_maxsize=_config['pool_maxsize']
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    # 破棄したセッションを別スレッドが使用中の場合があるので、プールから外す時には閉じず、
+    # 最後の参照が消えた時点（またはプロセス終了時）に接続を閉じる
+    weakref.finalize(session, _close_adapters, list(session.adapters.values()))
+    return session
+
+
+def get_session(url: str) -> requests.Session:
+    """
+    URLのホストに対応する共有セッションを取得
+
+    アイドル時間が上限を超えたセッションは破棄して作り直す
+    （サーバー側で切断済みの接続を再利用しないため）。
+    破棄したセッションは使用中のリクエストが終わってから閉じられる
+
+    Args:
+        url: リクエストURL
+
+    Returns:
+        ホスト単位で共有されるセッション
+    """
+    parts = urlsplit(url)
+    key = f"{parts.scheme}://{parts.netloc}"
+    now = time.monotonic()
+
+    with _lock:
+        entry = _sessions.get(key)
+        if entry and now - entry['last_used'] > _config['idle_timeout']:
+            entry = None
+            _host_stats(parts.hostname or '')['evictions'] += 1
+        if entry is None:
+            entry = {'session': _new_session(), 'last_used': now}
+            _sessions[key] = entry
+        entry['last_used'] = now
+        session = entry['session']
+    return session
+
+
+def evict_idle() -> int:
+    """
+    アイドル時間が上限を超えたセッションをすべてプールから外す
+
+    使用中のリクエストがあれば、それが終わってセッションが参照されなくなった時点で閉じられる
+
+    Returns:
+        破棄したセッション数
+    """
+    now = time.monotonic()
+    with _lock:
+        stale_keys = [k for k, e in _sessions.items() if now - e['last_used'] > _config['idle_timeout']]
+        for k in stale_keys:
+            del _sessions[k]
+            _host_stats(urlsplit(k).hostname or '')['evictions'] += 1
+    return len(stale_keys)
+
+
+def configure_pool(pool_connections: Optional[int] = None, pool_maxsize: Optional[int] = None,
+                   idle_timeout: Optional[float] = None):
+    """
+    プール設定を変更（既存セッションはプールから外し、次回作り直す）
+
+    Args:
+        pool_connections: ホストごとに保持するコネクションプール数
+        pool_maxsize: 1プールあたりの最大接続数
+        idle_timeout: セッションを破棄するまでのアイドル秒数
+    """
+    with _lock:
+        if pool_connections is not None:
+            _config['pool_connections'] = pool_connections
+        if pool_maxsize is not None:
+            _config['pool_maxsize'] = pool_maxsize
+        if idle_timeout is not None:
+            _config['idle_timeout'] = idle_timeout
+        _sessions.clear()
+
+
+def close_all():
+    """全セッションを閉じる（プロセス終了前など、使用中のリクエストがない時に呼ぶ）"""
+    with _lock:
+        sessions = [e['session'] for e in _sessions.values()]
+        _sessions.clear()
+    for session in sessions:
+        session.close()
+
+
+def get_pool_stats() -> Dict[str, Dict[str, int]]:
+    """
+    ホスト別の接続統計を取得
+
+    Returns:
+        {ホスト: {requests, new_connections, reused_connections, evictions}}
+    """
+    with _lock:
+        result = {}
+        for host, stats in _stats.items():
+            result[host] = dict(stats)
+            result[host]['reused_connections'] = max(stats['requests'] - stats['new_connections'], 0)
+        return result
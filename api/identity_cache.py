@@ -0,0 +1,232 @@
+"""
+プレイヤー識別子キャッシュ - Riot ID → PUUID → サモナーIDの解決結果を長期間保持する
+"""
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+try:
+    from match_store import MatchStore, get_default_store
+except ImportError:
+    from api.match_store import MatchStore, get_default_store
+
+
+# Riot ID → PUUIDの保持期間（秒）。Riot IDは変更できるため無期限にはしない
+RIOT_ID_TTL = 7 * 24 * 3600
+
+# PUUID → サモナーIDの保持期間（秒）。同じリージョンでは変わらない
+SUMMONER_ID_TTL = 30 * 24 * 3600
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_riot_id(game_name: str, tag_line: str) -> str:
+    """
+    Riot IDをキャッシュのキーに正規化
+
+    全角英数字・半角カナなどをNFKCで統一し、大文字小文字を区別せず、
+    前後の空白を除いて連続する空白を1つにまとめる（Riot IDの照合も大文字小文字を区別しない）
+
+    Args:
+        game_name: ゲーム内名前
+        tag_line: タグライン
+
+    Returns:
+        "game_name#tag_line" 形式の正規化済みキー
+    """
+    def normalize(value: str) -> str:
+        value = unicodedata.normalize('NFKC', value or '').casefold()
+        return _WHITESPACE.sub(' ', value).strip()
+    return f"{normalize(game_name)}#{normalize(tag_line).lstrip('#')}"
+
+
+class IdentityCache:
+    """
+    Riot ID → アカウント（PUUID）、PUUID → サモナーIDの対応表
+
+    メモリ上のLRUに保持し、ストアがあればSQLiteにも保存するため、
+    プロセスの再起動後もアカウント・サモナーの解決にAPIを呼ばない。
+    PUUID・サモナーIDはAPIプロジェクトごとに暗号化され、サモナーIDはプラットフォームごとに
+    異なるため、キーにはプロジェクトのラベル（KeyPool.project_label）とプラットフォームを含める
+    """
+
+    def __init__(self, store: Optional[MatchStore] = None, riot_id_ttl: float = RIOT_ID_TTL,
+                 summoner_id_ttl: float = SUMMONER_ID_TTL, max_entries: int = 50000):
+        """
+        初期化
+
+        Args:
+            store: 解決結果を読み書きするストア（Noneならメモリ上のみ）
+            riot_id_ttl: Riot ID → PUUIDの保持期間（秒）
+            summoner_id_ttl: PUUID → サモナーIDの保持期間（秒）
+            max_entries: メモリ上に保持する件数の上限（種類ごと）
+        """
+        self.store = store
+        self.riot_id_ttl = riot_id_ttl
+        self.summoner_id_ttl = summoner_id_ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # {(プロジェクト, 正規化したRiot ID): ({puuid, gameName, tagLine}, 解決時刻)}
+        self._accounts: "OrderedDict[Tuple[str, str], tuple]" = OrderedDict()
+        # {(プロジェクト, プラットフォーム, PUUID): (サモナーID, 解決時刻)}
+        self._summoner_ids: "OrderedDict[Tuple[str, str, str], tuple]" = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0, 'store_hits': 0, 'writes': 0}
+
+    def get_account(self, game_name: str, tag_line: str, project: str = '') -> Optional[Dict]:
+        """
+        解決済みのアカウント情報を取得
+
+        Args:
+            game_name: ゲーム内名前
+            tag_line: タグライン
+            project: 問い合わせに使うAPIプロジェクトのラベル
+
+        Returns:
+            {puuid, gameName, tagLine}（未解決・期限切れならNone）
+        """
+        riot_id = normalize_riot_id(game_name, tag_line)
+        key = (project, riot_id)
+        account = self._lookup(self._accounts, key, self.riot_id_ttl)
+        if account is not None:
+            return dict(account)
+        if self.store is not None:
+            row = self.store.get_riot_id(riot_id, project)
+            if row is not None and time.time() - row['resolved_at'] < self.riot_id_ttl:
+                account = {'puuid': row['puuid'], 'gameName': row['gameName'], 'tagLine': row['tagLine']}
+                self._remember(self._accounts, key, account, row['resolved_at'])
+                self._count('store_hits')
+                return dict(account)
+        self._count('misses')
+        return None
+
+    def put_account(self, game_name: str, tag_line: str, account: Dict, project: str = ''):
+        """
+        account-v1の応答を保存
+
+        Args:
+            game_name: 問い合わせたゲーム内名前
+            tag_line: 問い合わせたタグライン
+            account: account-v1の応答（puuid, gameName, tagLine）
+            project: 問い合わせに使ったAPIプロジェクトのラベル
+        """
+        puuid = account.get('puuid') if account else None
+        if not puuid:
+            return
+        entry = {'puuid': puuid, 'gameName': account.get('gameName'), 'tagLine': account.get('tagLine')}
+        now = time.time()
+        keys = {normalize_riot_id(game_name, tag_line)}
+        # 正式な表記でも引けるようにする
+        if entry['gameName'] and entry['tagLine']:
+            keys.add(normalize_riot_id(entry['gameName'], entry['tagLine']))
+        for riot_id in keys:
+            self._remember(self._accounts, (project, riot_id), entry, now)
+            if self.store is not None:
+                self.store.put_riot_id(riot_id, project, puuid, entry['gameName'], entry['tagLine'], now)
+        self._count('writes')
+
+    def get_summoner_id(self, puuid: str, platform: str, project: str = '') -> Optional[str]:
+        """
+        PUUIDに対応するサモナーIDを取得
+
+        Args:
+            puuid: プレイヤーUUID
+            platform: プラットフォーム（jp1, kr など）
+            project: 問い合わせに使うAPIプロジェクトのラベル
+
+        Returns:
+            暗号化されたサモナーID（未解決・期限切れならNone）
+        """
+        key = (project, platform, puuid)
+        summoner_id = self._lookup(self._summoner_ids, key, self.summoner_id_ttl)
+        if summoner_id is not None:
+            return summoner_id
+        if self.store is not None:
+            row = self.store.get_summoner_id(puuid, platform, project)
+            if row is not None and time.time() - row['resolved_at'] < self.summoner_id_ttl:
+                self._remember(self._summoner_ids, key, row['summoner_id'], row['resolved_at'])
+                self._count('store_hits')
+                return row['summoner_id']
+        self._count('misses')
+        return None
+
+    def put_summoner(self, summoner: Dict, platform: str, project: str = ''):
+        """
+        summoner-v4の応答からPUUID → サモナーIDを保存
+
+        Args:
+            summoner: summoner-v4の応答（id, puuid を含む）
+            platform: 問い合わせたプラットフォーム
+            project: 問い合わせに使ったAPIプロジェクトのラベル
+        """
+        puuid = summoner.get('puuid') if summoner else None
+        summoner_id = summoner.get('id') if summoner else None
+        if not puuid or not summoner_id:
+            return
+        key = (project, platform, puuid)
+        with self._lock:
+            known = self._summoner_ids.get(key)
+        if known is not None and known[0] == summoner_id:
+            return
+        now = time.time()
+        self._remember(self._summoner_ids, key, summoner_id, now)
+        if self.store is not None:
+            self.store.put_summoner_id(puuid, platform, project, summoner_id, now)
+        self._count('writes')
+
+    def _lookup(self, entries: OrderedDict, key: tuple, ttl: float):
+        """メモリ上の値を取得（期限切れは破棄）"""
+        with self._lock:
+            entry = entries.get(key)
+            if entry is None:
+                return None
+            value, resolved_at = entry
+            if time.time() - resolved_at >= ttl:
+                del entries[key]
+                return None
+            entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return value
+
+    def _remember(self, entries: OrderedDict, key: tuple, value, resolved_at: float):
+        """メモリ上に保存（上限を超えたら古いものから外す）"""
+        with self._lock:
+            entries[key] = (value, resolved_at)
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def get_stats(self) -> Dict:
+        """
+        統計を取得
+
+        Returns:
+            hits/misses/store_hits/writes/hit_ratio/accounts/summoner_ids
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            hits = stats['hits'] + stats['store_hits']
+            lookups = hits + stats['misses']
+            stats['hit_ratio'] = round(hits / lookups, 4) if lookups else 0.0
+            stats['accounts'] = len(self._accounts)
+            stats['summoner_ids'] = len(self._summoner_ids)
+        return stats
+
+
+_default_identities = None
+_default_identities_lock = threading.Lock()
+
+
+def get_default_identity_cache() -> IdentityCache:
+    """プロセス共有の識別子キャッシュを取得（試合データ永続ストアがあれば保存先に使う）"""
+    global _default_identities
+    with _default_identities_lock:
+        if _default_identities is None:
+            _default_identities = IdentityCache(get_default_store())
+        return _default_identities
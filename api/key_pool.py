@@ -0,0 +1,204 @@
+"""
+APIキープール - 複数のRiot APIキーに送信を分散し、キーごとにレート制限を管理する
+
+PUUID・サモナーIDなどの識別子はAPIプロジェクトごとに暗号化されており、別のプロジェクトの
+キーでは使えない（試合詳細に含まれるPUUIDも同様）。そのため1つのプールには同じプロジェクトの
+キーだけを登録する。識別子のキャッシュはプロジェクトのラベルで区別する。
+"""
+import hashlib
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from rate_limiter import RateLimiter
+except ImportError:
+    from api.rate_limiter import RateLimiter
+
+
+# 連続でこの回数401/403を返したキーはローテーションから外す
+DEFAULT_AUTH_FAILURE_THRESHOLD = 3
+
+
+def key_label(api_key: str) -> str:
+    """
+    APIキーを識別するラベル（ログ・統計に出してもよい値）
+
+    Args:
+        api_key: APIキー
+
+    Returns:
+        "key-" + SHA-256の先頭8桁
+    """
+    return 'key-' + hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:8]
+
+
+def load_keys_from_env() -> List[str]:
+    """
+    環境変数からキーを読み込む
+
+    RIOT_API_KEYS（カンマ区切り）とRIOT_API_KEYの両方を、重複を除いて順に使う
+
+    Returns:
+        APIキーのリスト
+    """
+    keys = [k.strip() for k in os.environ.get('RIOT_API_KEYS', '').split(',')]
+    keys.append((os.environ.get('RIOT_API_KEY') or '').strip())
+    return list(dict.fromkeys(k for k in keys if k))
+
+
+def load_project_from_env() -> Optional[str]:
+    """環境変数 RIOT_API_PROJECT からプロジェクトのラベルを読み込む（未設定ならNone）"""
+    return (os.environ.get('RIOT_API_PROJECT') or '').strip() or None
+
+
+class ApiKey:
+    """プール内のAPIキー1つ"""
+
+    __slots__ = ('key', 'label', 'active', 'disabled_reason', 'requests', 'auth_failures')
+
+    def __init__(self, key: str):
+        self.key = key
+        self.label = key_label(key)
+        self.active = True
+        self.disabled_reason: Optional[str] = None
+        self.requests = 0
+        self.auth_failures = 0
+
+
+class KeyPool:
+    """
+    APIキーのプール
+
+    リクエストごとに、そのエンドポイントのレート制限の残り回数が最も多い
+    キーを選ぶ。401/403を繰り返すキー（失効・取り消し）は自動で外す。
+    どのキーで解決した識別子も他のキーでそのまま使えるよう、キーはすべて同じ
+    APIプロジェクトのもの（同じアプリの新旧キーなど）であること。
+    """
+
+    def __init__(self, keys: Optional[List[str]] = None,
+                 auth_failure_threshold: int = DEFAULT_AUTH_FAILURE_THRESHOLD, project: Optional[str] = None):
+        """
+        初期化
+
+        Args:
+            keys: APIキーのリスト（すべて同じAPIプロジェクトのもの。省略時は最初に使うときに環境変数から読み込む）
+            auth_failure_threshold: ローテーションから外す連続401/403回数
+            project: APIプロジェクトのラベル（省略時はRIOT_API_PROJECT、それもなければ先頭のキーのラベル）
+        """
+        self.auth_failure_threshold = auth_failure_threshold
+        self.project = project
+        self._lock = threading.Lock()
+        self._keys: Optional[List[ApiKey]] = None
+        if keys is not None:
+            self._keys = [ApiKey(k) for k in dict.fromkeys(keys) if k]
+
+    def _all(self) -> List[ApiKey]:
+        """全キーを取得（未読み込みなら環境変数から読み込む）"""
+        if self._keys is None:
+            with self._lock:
+                if self._keys is None:
+                    self._keys = [ApiKey(k) for k in load_keys_from_env()]
+        return self._keys
+
+    def active_keys(self) -> List[ApiKey]:
+        """ローテーション中のキーを取得"""
+        return [k for k in self._all() if k.active]
+
+    def project_label(self) -> str:
+        """
+        識別子のキャッシュを区別するAPIプロジェクトのラベル
+
+        Returns:
+            指定されたラベル、RIOT_API_PROJECT、先頭のキーのラベルの順（キーがなければ空文字）
+        """
+        if self.project is None:
+            keys = self._all()
+            self.project = load_project_from_env() or (keys[0].label if keys else '')
+        return self.project
+
+    def primary_key(self) -> Optional[str]:
+        """ローテーション中の先頭のキーを取得（キーがなければNone）"""
+        keys = self.active_keys()
+        return keys[0].key if keys else None
+
+    def acquire(self, url: str, rate_limiter: RateLimiter, reserve: float = 0.0) -> Tuple[float, Optional[ApiKey]]:
+        """
+        残り回数が最も多いキーで送信枠を確保
+
+        Args:
+            url: リクエストURL
+            rate_limiter: キーごとの送信枠を管理するレートリミッター
+            reserve: 各ウィンドウの上限のうち使わずに残す割合
+
+        Returns:
+            (待機秒数, キー)。確保できた場合は (0, キー)、どのキーも空いていなければ
+            (最も早く空くまでの秒数, None)。キーが1つもない場合はキーなしで確保し、キーはNone
+        """
+        keys = self.active_keys()
+        if not keys:
+            return rate_limiter.try_acquire(url, reserve), None
+        if len(keys) > 1:
+            # 直近で401/403を返したキーは後回しにし、残り回数の多い順に試す
+            keys = sorted(keys, key=lambda k: (k.auth_failures, -rate_limiter.headroom(url, reserve, k.label)))
+        min_wait = None
+        for api_key in keys:
+            wait = rate_limiter.try_acquire(url, reserve, api_key.label)
+            if wait <= 0:
+                api_key.requests += 1
+                return 0.0, api_key
+            min_wait = wait if min_wait is None else min(min_wait, wait)
+        return min_wait, None
+
+    def record_success(self, api_key: Optional[ApiKey]):
+        """キーが受け付けられたことを記録"""
+        if api_key is not None:
+            api_key.auth_failures = 0
+
+    def record_auth_failure(self, api_key: Optional[ApiKey], status: int) -> bool:
+        """
+        401/403を記録し、しきい値に達したキーをローテーションから外す
+
+        最後の1つのキーは外さない（外しても送信できるキーがなくなるだけのため）
+
+        Args:
+            api_key: 応答を受けたキー
+            status: HTTPステータス
+
+        Returns:
+            キーを外した場合True
+        """
+        if api_key is None:
+            return False
+        with self._lock:
+            api_key.auth_failures += 1
+            if not api_key.active or api_key.auth_failures < self.auth_failure_threshold:
+                return False
+            if sum(1 for k in self._all() if k.active) <= 1:
+                return False
+            api_key.active = False
+            api_key.disabled_reason = f"HTTP {status}"
+        print(f"API key {api_key.label} removed from rotation (HTTP {status})")
+        return True
+
+    def get_status(self) -> List[Dict]:
+        """
+        キーごとの状態を取得（キー本体は含めない）
+
+        Returns:
+            [{label, active, requests, auth_failures, disabled_reason}]
+        """
+        return [
+            {
+                'label': k.label,
+                'active': k.active,
+                'requests': k.requests,
+                'auth_failures': k.auth_failures,
+                'disabled_reason': k.disabled_reason,
+            }
+            for k in self._all()
+        ]
+
+
+# プロセス内で共有するキープール（RIOT_API_KEYS / RIOT_API_KEY）
+default_key_pool = KeyPool()
@@ -0,0 +1,239 @@
+"""
+レーン戦分析 - タイムラインのフレーム配列から、対面とのゴールド・経験値・CS差（10分/15分）、
+最初のアイテム完成の目安時刻、ゴールドリードの推移を全参加者分まとめて計算
+
+複数試合はフレーム数を揃えて1つの配列に積み、NumPyの配列演算で一度に計算する。
+NumPyがない環境では1試合ずつ同じ値を計算する。
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+try:
+    from timeline import MatchTimeline, FIELD_INDEX
+    from records import MatchRecord
+except ImportError:
+    from api.timeline import MatchTimeline, FIELD_INDEX
+    from api.records import MatchRecord
+
+
+# 対面との差を求める時刻（分）
+CHECKPOINT_MINUTES = (10, 15)
+
+# 最初のアイテム完成の目安にする累計ゴールド（初期ゴールド500 + レジェンダリーアイテム1つ分）
+FIRST_ITEM_GOLD = 3300
+
+_TEAM_IDS = (100, 200)
+
+# 差を求める項目: (出力名, FRAME_FIELDSの項目)。csはレーンとジャングルの合計
+_DIFF_FIELDS = (('gold_diff', 'total_gold'), ('xp_diff', 'xp'), ('cs_diff', 'cs'))
+
+
+def _lane_layout(timeline: MatchTimeline, match: MatchRecord) -> Optional[Tuple[List, List[int], List[int]]]:
+    """
+    タイムラインの参加者ID順に、試合レコードの参加者・対面の位置・チームIDを並べる
+
+    Returns:
+        (参加者レコードのリスト, 対面の位置（いなければ-1）のリスト, チームIDのリスト)。
+        タイムラインと試合の参加者が一致しなければNone
+    """
+    participants = []
+    for puuid in timeline.puuids:
+        participant = match.find_participant(puuid)
+        if participant is None:
+            return None
+        participants.append(participant)
+    opponents = []
+    for participant in participants:
+        opponent = -1
+        if participant.position:
+            for index, other in enumerate(participants):
+                if other.position == participant.position and other.team_id != participant.team_id:
+                    opponent = index
+                    break
+        opponents.append(opponent)
+    return participants, opponents, [participant.team_id for participant in participants]
+
+
+def _checkpoint_frames(timestamps: Sequence[int]) -> List[Optional[int]]:
+    """各時刻ちょうど以降の最初のフレーム（試合がその時刻まで続かなければNone）"""
+    frames = []
+    for minute in CHECKPOINT_MINUTES:
+        target = minute * 60000
+        frames.append(next((i for i, timestamp in enumerate(timestamps) if timestamp >= target), None))
+    return frames
+
+
+def _build_result(participants, opponents, checkpoint_values, first_item_frames, timestamps,
+                  team_lead, lane_leads) -> Dict:
+    """計算結果をレスポンスの形式にする"""
+    players = []
+    for index, participant in enumerate(participants):
+        opponent = opponents[index]
+        checkpoints = {}
+        for minute, values in zip(CHECKPOINT_MINUTES, checkpoint_values):
+            if values is None or opponent < 0:
+                checkpoints[f'at_{minute}'] = None
+            else:
+                checkpoints[f'at_{minute}'] = {name: values[name][index] for name, _ in _DIFF_FIELDS}
+        first_item = first_item_frames[index]
+        players.append({
+            'puuid': participant.puuid,
+            'champion': participant.champion,
+            'position': participant.position,
+            'team_id': participant.team_id,
+            'opponent_puuid': participants[opponent].puuid if opponent >= 0 else None,
+            **checkpoints,
+            'first_item_minute': round(timestamps[first_item] / 60000, 1) if first_item is not None else None,
+            'lane_gold_lead': lane_leads[index] if opponent >= 0 else None,
+        })
+    return {
+        'checkpoints': list(CHECKPOINT_MINUTES),
+        'timestamps': list(timestamps),
+        'team_gold_lead': team_lead,
+        'players': players,
+    }
+
+
+def _laning_scalar(timeline: MatchTimeline, layout) -> Dict:
+    """1試合分を計算（NumPyなし）"""
+    participants, opponents, team_ids = layout
+    gold = timeline.series('total_gold')
+    xp = timeline.series('xp')
+    cs = [[m + j for m, j in zip(lane, jungle)]
+          for lane, jungle in zip(timeline.series('minions_killed'), timeline.series('jungle_minions_killed'))]
+    series = {'total_gold': gold, 'xp': xp, 'cs': cs}
+    count = len(participants)
+
+    checkpoint_values = []
+    for frame in _checkpoint_frames(timeline.timestamps):
+        if frame is None:
+            checkpoint_values.append(None)
+            continue
+        checkpoint_values.append({
+            name: [series[field][frame][i] - series[field][frame][opponents[i]] if opponents[i] >= 0 else 0
+                   for i in range(count)]
+            for name, field in _DIFF_FIELDS
+        })
+    first_item_frames = [
+        next((frame for frame, row in enumerate(gold) if row[i] >= FIRST_ITEM_GOLD), None) for i in range(count)
+    ]
+    team_lead = [sum(value for value, team in zip(row, team_ids) if team == _TEAM_IDS[0]) -
+                 sum(value for value, team in zip(row, team_ids) if team == _TEAM_IDS[1]) for row in gold]
+    lane_leads = [[row[i] - row[opponents[i]] for row in gold] if opponents[i] >= 0 else None for i in range(count)]
+    return _build_result(participants, opponents, checkpoint_values, first_item_frames, timeline.timestamps,
+                         team_lead, lane_leads)
+
+
+def calculate_laning_metrics_batch(items: Sequence[Tuple[Optional[MatchTimeline], MatchRecord]]) -> List[Optional[Dict]]:
+    """
+    複数試合のレーン戦分析をまとめて計算
+
+    Args:
+        items: (タイムライン, 試合レコード) のリスト（タイムラインがNoneの試合は結果もNone）
+
+    Returns:
+        入力順の結果のリスト。各結果は
+        {checkpoints, timestamps, team_gold_lead（青-赤）, players: [{puuid, champion, position, team_id,
+        opponent_puuid, at_10/at_15: {gold_diff, xp_diff, cs_diff}, first_item_minute, lane_gold_lead}]}
+        （タイムラインと試合の参加者が一致しない・フレームがない試合はNone）
+    """
+    results: List[Optional[Dict]] = [None] * len(items)
+    batch = []
+    for position, (timeline, match) in enumerate(items):
+        if timeline is None or not timeline.frame_count:
+            continue
+        layout = _lane_layout(timeline, match)
+        if layout is None:
+            continue
+        if not HAS_NUMPY:
+            results[position] = _laning_scalar(timeline, layout)
+            continue
+        batch.append((position, timeline, layout))
+    if not batch:
+        return results
+
+    # 参加者数ごとに、フレーム数を最長の試合に揃えて (試合, フレーム, 参加者, 項目) の配列に積む。
+    # 足りないフレームは最後のフレームの値で埋める（どの計算結果も実在するフレームの範囲だけを使う）
+    groups: Dict[int, List] = {}
+    for entry in batch:
+        groups.setdefault(entry[1].participant_count, []).append(entry)
+    for count, group in groups.items():
+        max_frames = max(timeline.frame_count for _, timeline, _ in group)
+        n = len(group)
+        frames = np.empty((n, max_frames, count, 3), dtype=np.int64)
+        timestamps = np.empty((n, max_frames), dtype=np.int64)
+        opponents = np.empty((n, count), dtype=np.intp)
+        blue = np.empty((n, count), dtype=bool)
+        red = np.empty((n, count), dtype=bool)
+        frame_counts = np.empty(n, dtype=np.intp)
+        for row, (_, timeline, (_, lane_opponents, team_ids)) in enumerate(group):
+            values = timeline.frame_array()
+            length = timeline.frame_count
+            frames[row, :length, :, 0] = values[:, :, FIELD_INDEX['total_gold']]
+            frames[row, :length, :, 1] = values[:, :, FIELD_INDEX['xp']]
+            frames[row, :length, :, 2] = (values[:, :, FIELD_INDEX['minions_killed']] +
+                                          values[:, :, FIELD_INDEX['jungle_minions_killed']])
+            frames[row, length:] = frames[row, length - 1]
+            timestamps[row, :length] = timeline.timestamps
+            timestamps[row, length:] = timestamps[row, length - 1]
+            opponents[row] = lane_opponents
+            blue[row] = [team == _TEAM_IDS[0] for team in team_ids]
+            red[row] = [team == _TEAM_IDS[1] for team in team_ids]
+            frame_counts[row] = length
+
+        rows = np.arange(n)[:, None]
+        has_opponent = opponents >= 0
+        safe_opponents = np.where(has_opponent, opponents, 0)
+        # 全試合・全参加者の対面との差を1回で計算する (試合, フレーム, 参加者, 項目)
+        diffs = frames - frames[rows, :, safe_opponents].transpose(0, 2, 1, 3)
+        diffs[~np.broadcast_to(has_opponent[:, None, :, None], diffs.shape)] = 0
+
+        # 各時刻ちょうど以降の最初のフレーム（試合がその時刻まで続かなければ無効）
+        checkpoints = []
+        for minute in CHECKPOINT_MINUTES:
+            reached = timestamps >= minute * 60000
+            frame = reached.argmax(axis=1)
+            valid = reached.any(axis=1)
+            checkpoints.append((diffs[np.arange(n), frame], valid))
+
+        gold = frames[..., 0]
+        reached_item = gold >= FIRST_ITEM_GOLD
+        first_item = reached_item.argmax(axis=1)
+        has_item = reached_item.any(axis=1)
+        team_lead = (gold * blue[:, None, :]).sum(axis=2) - (gold * red[:, None, :]).sum(axis=2)
+        lane_leads = diffs[..., 0]
+
+        for row, (position, timeline, (participants, lane_opponents, _)) in enumerate(group):
+            length = int(frame_counts[row])
+            checkpoint_values = []
+            for values, valid in checkpoints:
+                if not valid[row]:
+                    checkpoint_values.append(None)
+                    continue
+                checkpoint_values.append({name: values[row, :, column].tolist()
+                                          for column, (name, _) in enumerate(_DIFF_FIELDS)})
+            first_item_frames = [int(frame) if has else None
+                                 for frame, has in zip(first_item[row].tolist(), has_item[row].tolist())]
+            results[position] = _build_result(
+                participants, lane_opponents, checkpoint_values, first_item_frames, timeline.timestamps,
+                team_lead[row, :length].tolist(), lane_leads[row, :length].T.tolist())
+    return results
+
+
+def calculate_laning_metrics(timeline: Optional[MatchTimeline], match: MatchRecord) -> Optional[Dict]:
+    """
+    1試合のレーン戦分析
+
+    Args:
+        timeline: 試合タイムライン
+        match: 試合レコード
+
+    Returns:
+        calculate_laning_metrics_batch の1試合分の結果
+    """
+    return calculate_laning_metrics_batch([(timeline, match)])[0]
@@ -11,12 +11,18 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 try:
     from riot_client import RiotAPIClient
-    from utils import get_player_stats, format_game_duration, calculate_performance_score, get_detailed_match_info
+    from utils import format_game_duration
+    from records import extract_match_record
+    from scoring import get_match_participants_stats
+    from laning import calculate_laning_metrics
 except ImportError:
     # フォールバック: 親ディレクトリから読み込み
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     from api.riot_client import RiotAPIClient
-    from api.utils import get_player_stats, format_game_duration, calculate_performance_score, get_detailed_match_info
+    from api.utils import format_game_duration
+    from api.records import extract_match_record
+    from api.scoring import get_match_participants_stats
+    from api.laning import calculate_laning_metrics
 
 
 class handler(BaseHTTPRequestHandler):
@@ -32,13 +38,15 @@ class handler(BaseHTTPRequestHandler):
             match_id = params.get('match_id', [None])[0]
             region = params.get('region', ['jp1'])[0]
             routing = params.get('routing', ['asia'])[0]
+            include_timeline = params.get('timeline', ['0'])[0].lower() in ('1', 'true')
+            include_laning = params.get('laning', ['0'])[0].lower() in ('1', 'true')
             
             if not match_id:
                 self.send_error_response({'error': 'マッチIDが必要です'}, 400)
                 return
             
             # 共通処理を実行
-            self._process_match_detail(match_id, region, routing)
+            self._process_match_detail(match_id, region, routing, include_timeline, include_laning)
             
         except Exception as e:
             print(f"Error in match_detail GET: {e}")
@@ -55,19 +63,21 @@ class handler(BaseHTTPRequestHandler):
             match_id = data.get('match_id')
             region = data.get('region', 'jp1')
             routing = data.get('routing', 'asia')
+            include_timeline = bool(data.get('timeline', False))
+            include_laning = bool(data.get('laning', False))
             
             if not match_id:
                 self.send_error_response({'error': 'マッチIDが必要です'}, 400)
                 return
             
             # 共通処理を実行
-            self._process_match_detail(match_id, region, routing)
+            self._process_match_detail(match_id, region, routing, include_timeline, include_laning)
             
         except Exception as e:
             print(f"Error in match_detail POST: {e}")
             self.send_error_response({'error': str(e)}, 500)
     
-    def _process_match_detail(self, match_id, region, routing):
+    def _process_match_detail(self, match_id, region, routing, include_timeline=False, include_laning=False):
         """試合詳細取得の共通処理"""
         try:
             # Riot APIクライアント初期化
@@ -79,38 +89,47 @@ class handler(BaseHTTPRequestHandler):
                 self.send_error_response({'error': '試合データが見つかりませんでした'}, 404)
                 return
             
+            # 軽量レコードに変換（試合JSON全体はここで解放する）
+            match = extract_match_record(match_data)
+            del match_data
+            
             # 詳細な試合情報を取得
-            detailed_info = get_detailed_match_info(match_data)
-            
-            # 全参加者の詳細統計を取得
-            participants = []
-            for participant in match_data.get("info", {}).get("participants", []):
-                puuid = participant.get("puuid")
-                player_stats = get_player_stats(match_data, puuid)
-                
-                if player_stats:
-                    performance_score = calculate_performance_score(player_stats)
-                    
-                    participants.append({
-                        'puuid': puuid,
-                        'riot_id': f"{participant.get('riotIdGameName', 'Unknown')}#{participant.get('riotIdTagline', 'NA1')}",
-                        'stats': player_stats,
-                        'performance_score': performance_score
-                    })
-            
-            # チーム別に分類
-            blue_team = [p for p in participants if p['stats']['team_id'] == 100]
-            red_team = [p for p in participants if p['stats']['team_id'] == 200]
+            detailed_info = match.detailed_info()
             
-            # 成功レスポンス
-            self.send_success_response({
+            # 全参加者の詳細統計を取得（スコアは全員分を1回で計算）
+            participants = [
+                {
+                    'puuid': participant.puuid,
+                    'riot_id': f"{participant.riot_id_game_name}#{participant.riot_id_tagline}",
+                    'stats': player_stats,
+                    'performance_score': player_stats['performance_analysis']
+                }
+                for participant, player_stats in zip(match.participants, get_match_participants_stats(match))
+            ]
+            
+            # チーム別に分類（抽出時に作成したチームごとの行番号を使う）
+            blue_team = [participants[index] for index in match.team_rows.get(100, ())]
+            red_team = [participants[index] for index in match.team_rows.get(200, ())]
+            
+            response = {
                 'match_info': detailed_info,
                 'participants': {
                     'blue_team': blue_team,
                     'red_team': red_team
                 },
                 'total_participants': len(participants)
-            })
+            }
+            
+            # タイムライン（ゴールド・経験値・CSの推移とイベント）とレーン戦分析は指定された場合のみ取得
+            if include_timeline or include_laning:
+                timeline = riot_client.get_match_timeline(match_id)
+                if include_timeline:
+                    response['timeline'] = timeline.to_response() if timeline else None
+                if include_laning:
+                    response['laning'] = calculate_laning_metrics(timeline, match)
+            
+            # 成功レスポンス
+            self.send_success_response(response)
             
         except Exception as e:
             print(f"Error in _process_match_detail: {e}")
@@ -4,6 +4,7 @@ Vercel Serverless Function: 戦績取得API
 from http.server import BaseHTTPRequestHandler
 import json
 import os
+import re
 import sys
 
 # APIモジュールのパスを追加
@@ -12,7 +13,10 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 # 安全なインポート
 try:
     from riot_client import RiotAPIClient
-    from utils import get_player_stats, format_game_duration
+    from utils import get_record_stats, format_game_duration
+    from records import extract_match_record
+    from deadline import Deadline, encode_continuation_token, decode_continuation_token
+    from percentiles import patch_of
     IMPORTS_OK = True
 except ImportError as e:
     print(f"Import error: {e}")
@@ -23,22 +27,29 @@ except ImportError as e:
         def __init__(self, *args, **kwargs):
             pass
     
-    def get_player_stats(*args):
+    def get_record_stats(*args, **kwargs):
         return {}
     
+    def extract_match_record(match_data):
+        return None
+    
+    def patch_of(game_version):
+        return ''
+    
     def format_game_duration(seconds):
         return f"{seconds//60}:{seconds%60:02d}"
 
 # 新機能のインポート（オプショナル）
 try:
-    from utils import calculate_performance_score, get_detailed_match_info
+    from utils import calculate_performance_score
     HAS_ADVANCED_FEATURES = True and IMPORTS_OK
 except ImportError:
     HAS_ADVANCED_FEATURES = False
-    def calculate_performance_score(stats):
+    def calculate_performance_score(stats, patch=None):
         return 50  # デフォルト値
-    def get_detailed_match_info(match_data):
-        return {}
+
+# continuationトークンに載せられる試合IDの形式（例: JP1_123456789）
+MATCH_ID_PATTERN = re.compile(r'^[A-Z0-9]+_\d+$')
 
 
 class handler(BaseHTTPRequestHandler):
@@ -56,13 +67,14 @@ class handler(BaseHTTPRequestHandler):
             count = int(params.get('count', [20])[0])
             region = params.get('region', ['jp1'])[0]
             routing = params.get('routing', ['asia'])[0]
+            continuation = params.get('continuation', [None])[0]
             
             if not game_name or not tag_line:
                 self.send_error_response({'error': 'ゲーム名とタグラインが必要です'}, 400)
                 return
             
             # 共通処理を実行
-            self._process_match_history(game_name, tag_line, count, region, routing)
+            self._process_match_history(game_name, tag_line, count, region, routing, continuation)
             
         except Exception as e:
             print(f"Error in match_history GET: {e}")
@@ -81,20 +93,27 @@ class handler(BaseHTTPRequestHandler):
             count = data.get('count', 20)
             region = data.get('region', 'jp1')
             routing = data.get('routing', 'asia')
+            continuation = data.get('continuation')
             
             if not game_name or not tag_line:
                 self.send_error_response({'error': 'ゲーム名とタグラインが必要です'}, 400)
                 return
             
             # 共通処理を実行
-            self._process_match_history(game_name, tag_line, count, region, routing)
+            self._process_match_history(game_name, tag_line, count, region, routing, continuation)
             
         except Exception as e:
             print(f"Error in match_history POST: {e}")
             self.send_error_response({'error': str(e)}, 500)
     
-    def _process_match_history(self, game_name, tag_line, count, region, routing):
-        """戦績取得の共通処理"""
+    def _process_match_history(self, game_name, tag_line, count, region, routing, continuation=None):
+        """
+        戦績取得の共通処理
+        
+        時間予算（Deadline）を使い切りそうになったら試合の取得を打ち切り、
+        処理済みの試合だけを partial: true と continuation トークン付きで返す。
+        トークンを付けて再リクエストすると残りの試合を取得する。
+        """
         try:
             print(f"Processing match history for {game_name}#{tag_line}")  # デバッグログ
             
@@ -107,13 +126,29 @@ class handler(BaseHTTPRequestHandler):
                 }, 503)
                 return
             
+            # リクエスト全体の時間予算
+            deadline = Deadline()
+            
             # Riot APIクライアント初期化
             print("Initializing Riot API client...")
-            riot_client = RiotAPIClient(region=region, routing=routing)
+            riot_client = RiotAPIClient(region=region, routing=routing, deadline=deadline)
+            
+            # 続きの取得の場合はトークンを検証
+            token = None
+            if continuation:
+                token = decode_continuation_token(continuation)
+                match_ids = token.get('match_ids') if token else None
+                if (not isinstance(match_ids, list) or
+                        not all(isinstance(m, str) and MATCH_ID_PATTERN.match(m) for m in match_ids)):
+                    self.send_error_response({'error': 'continuationトークンが不正です'}, 400)
+                    return
             
             # アカウント情報取得
             print("Getting account info...")
             account = riot_client.get_account_by_riot_id(game_name, tag_line)
+            if not account and deadline.expired():
+                self.send_error_response({'error': '時間内に処理できませんでした。再度お試しください'}, 503)
+                return
             if not account:
                 print("Account not found")
                 self.send_error_response({'error': 'プレイヤーが見つかりませんでした'}, 404)
@@ -121,6 +156,9 @@ class handler(BaseHTTPRequestHandler):
             
             puuid = account['puuid']
             print(f"Found account with PUUID: {puuid[:8]}...")
+            if token and token.get('puuid') != puuid:
+                self.send_error_response({'error': 'continuationトークンが別のプレイヤーのものです'}, 400)
+                return
             
             # サモナー情報取得
             print("Getting summoner info...")
@@ -134,61 +172,79 @@ class handler(BaseHTTPRequestHandler):
                 print(f"Ranked stats error: {e}")
                 ranked_stats = []
             
-            # 試合履歴取得
-            print("Getting match history...")
-            match_ids = riot_client.get_match_history(puuid, count)
-            if not match_ids:
-                print("No match history found")
-                self.send_error_response({'error': '試合履歴が見つかりませんでした'}, 404)
-                return
+            # 試合履歴取得（続きの取得ならトークンに残った試合ID）
+            # countを超えた分は処理せず、次のcontinuationトークンに引き継ぐ
+            remaining_ids = []
+            if token:
+                target_ids = token['match_ids'][:count]
+                remaining_ids = token['match_ids'][count:]
+            else:
+                print("Getting match history...")
+                match_ids = riot_client.get_match_history(puuid, count)
+                if not match_ids and deadline.expired():
+                    self.send_error_response({'error': '時間内に処理できませんでした。再度お試しください'}, 503)
+                    return
+                if not match_ids:
+                    print("No match history found")
+                    self.send_error_response({'error': '試合履歴が見つかりませんでした'}, 404)
+                    return
+                target_ids = match_ids[:count]
             
             matches = []
-            print(f"Processing {len(match_ids)} matches...")
-            for i, match_id in enumerate(match_ids[:count]):
+            failed_matches = []
+            pending_ids = []
+            print(f"Processing {len(target_ids)} matches...")
+            # 試合詳細を並列取得（入力順で返る）
+            # 各ワーカーで軽量レコードに変換し、試合JSON全体はすぐ解放する
+            for result in riot_client.get_match_details_bulk(target_ids, transform=extract_match_record):
+                match_id = result['match_id']
+                match = result['match_data']
+                # 期限切れで取得・処理できなかった試合は次回に回す
+                if result['deadline_exceeded']:
+                    pending_ids.append(match_id)
+                    continue
+                if result['error']:
+                    failed_matches.append({'match_id': match_id, 'error': result['error']})
+                    continue
                 try:
-                    print(f"Processing match {i+1}/{count}: {match_id}")
-                    match_data = riot_client.get_match_detail(match_id)
-                    if match_data:
-                        player_stats = get_player_stats(match_data, puuid)
-                        if player_stats:
-                            match_entry = {
-                                'match_id': match_id,
-                                'game_duration': format_game_duration(
-                                    match_data['info']['gameDuration']
-                                ),
-                                'game_mode': match_data['info']['gameMode'],
-                                'game_creation': match_data['info']['gameCreation'],
-                                'stats': player_stats
-                            }
-                            
-                            # 新機能があれば追加
-                            if HAS_ADVANCED_FEATURES:
-                                try:
-                                    # パフォーマンススコアを計算
-                                    performance_score = calculate_performance_score(player_stats)
-                                    match_entry['performance_score'] = performance_score
-                                    
-                                    # 詳細な試合情報を取得
-                                    detailed_info = get_detailed_match_info(match_data)
-                                    match_entry['detailed_info'] = detailed_info
-                                    
-                                    # 追加情報
-                                    match_entry['queue_id'] = match_data['info'].get('queueId')
-                                    match_entry['game_version'] = match_data['info'].get('gameVersion')
-                                    match_entry['map_id'] = match_data['info'].get('mapId')
-                                except Exception as e:
-                                    print(f"Advanced features error: {e}")
-                            
-                            matches.append(match_entry)
-                        else:
-                            print(f"No player stats found for match {match_id}")
+                    player = match.find_participant(puuid)
+                    if player:
+                        patch = patch_of(match.game_version)
+                        player_stats = get_record_stats(player, patch=patch)
+                        match_entry = {
+                            'match_id': match_id,
+                            'game_duration': format_game_duration(match.game_duration),
+                            'game_mode': match.game_mode,
+                            'game_creation': match.game_creation,
+                            'stats': player_stats
+                        }
+                        
+                        # 新機能があれば追加
+                        if HAS_ADVANCED_FEATURES:
+                            try:
+                                # パフォーマンススコアを計算
+                                performance_score = calculate_performance_score(player, patch)
+                                match_entry['performance_score'] = performance_score
+                                
+                                # 詳細な試合情報を取得
+                                match_entry['detailed_info'] = match.detailed_info()
+                                
+                                # 追加情報
+                                match_entry['queue_id'] = match.queue_id
+                                match_entry['game_version'] = match.game_version
+                                match_entry['map_id'] = match.map_id
+                            except Exception as e:
+                                print(f"Advanced features error: {e}")
+                        
+                        matches.append(match_entry)
                     else:
-                        print(f"No match data for {match_id}")
+                        failed_matches.append({'match_id': match_id, 'error': 'プレイヤー統計が見つかりませんでした'})
                 except Exception as e:
-                    print(f"Error processing match {match_id}: {e}")
-                    continue
+                    failed_matches.append({'match_id': match_id, 'error': str(e)})
             
-            print(f"Successfully processed {len(matches)} matches")
+            pending_ids.extend(remaining_ids)
+            print(f"Successfully processed {len(matches)} matches ({len(failed_matches)} failed, "
+                  f"{len(pending_ids)} deferred, {deadline.elapsed():.2f}s)")
             
             # 成功レスポンス
             response_data = {
@@ -199,8 +255,15 @@ class handler(BaseHTTPRequestHandler):
                     'profile_icon_id': summoner.get('profileIconId') if summoner else 0
                 },
                 'ranked_stats': ranked_stats,
-                'matches': matches
+                'matches': matches,
+                'failed_matches': failed_matches,
+                'partial': bool(pending_ids)
             }
+            if pending_ids:
+                response_data['continuation'] = encode_continuation_token({
+                    'puuid': puuid,
+                    'match_ids': pending_ids
+                })
             
             print("Sending response...")
             self.send_success_response(response_data)
@@ -0,0 +1,572 @@
+"""
+試合データ永続ストア - 終了した試合をSQLiteに保存し、Riot APIからの取得を1回にする
+"""
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from typing import Callable, Dict, List, Optional
+
+
+# 既定のDBパス（Vercelでは書き込み可能な/tmpを使う）
+if os.environ.get('VERCEL'):
+    _DEFAULT_DB_PATH = '/tmp/lol_matches.sqlite3'
+else:
+    _DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'matches.sqlite3')
+
+DEFAULT_DB_PATH = os.environ.get('RIOT_MATCH_DB', _DEFAULT_DB_PATH)
+
+# プロジェクト・プラットフォームで区別していない旧形式の識別子キャッシュ。
+# APIから解決し直せるため、作り直す
+_LEGACY_IDENTITY_TABLES = (('riot_ids', 'project'), ('summoner_ids', 'platform'))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS matches (
+    match_id TEXT PRIMARY KEY,
+    queue_id INTEGER,
+    game_creation INTEGER,
+    game_version TEXT,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_matches_queue_id ON matches(queue_id);
+CREATE INDEX IF NOT EXISTS idx_matches_game_creation ON matches(game_creation);
+CREATE INDEX IF NOT EXISTS idx_matches_game_version ON matches(game_version);
+CREATE TABLE IF NOT EXISTS match_participants (
+    puuid TEXT NOT NULL,
+    match_id TEXT NOT NULL,
+    game_creation INTEGER,
+    PRIMARY KEY (puuid, match_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_participants_puuid_creation ON match_participants(puuid, game_creation);
+CREATE TABLE IF NOT EXISTS match_id_sync (
+    puuid TEXT NOT NULL,
+    queue_key TEXT NOT NULL,
+    match_ids TEXT NOT NULL,
+    complete INTEGER NOT NULL,
+    synced_at REAL NOT NULL,
+    PRIMARY KEY (puuid, queue_key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS riot_ids (
+    project TEXT NOT NULL,
+    riot_id TEXT NOT NULL,
+    puuid TEXT NOT NULL,
+    game_name TEXT,
+    tag_line TEXT,
+    resolved_at REAL NOT NULL,
+    PRIMARY KEY (project, riot_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS percentile_sketches (
+    sketch_key TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS percentile_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    last_rowid INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS summoner_ids (
+    project TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    puuid TEXT NOT NULL,
+    summoner_id TEXT NOT NULL,
+    resolved_at REAL NOT NULL,
+    PRIMARY KEY (project, platform, puuid)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS timelines (
+    match_id TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS player_aggregates (
+    puuid TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS player_aggregate_matches (
+    puuid TEXT NOT NULL,
+    match_id TEXT NOT NULL,
+    PRIMARY KEY (puuid, match_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS player_aggregate_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    last_rowid INTEGER NOT NULL
+);
+"""
+
+
+class MatchStore:
+    """
+    試合詳細（match-v5）の永続ストア
+
+    本文はzlib圧縮したJSONで保存し、puuid / queueId / gameCreation / gameVersion
+    にインデックスを張る。WALモードで開くため、同じホスト上のFlaskアプリ・
+    Discord Bot・local_server.pyから同時に読み書きできる。
+    接続はスレッドごとに作成する。
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        """
+        初期化
+
+        Args:
+            db_path: SQLiteファイルのパス
+        """
+        self.db_path = db_path
+        self._local = threading.local()
+        # statsは複数スレッドから更新されるのでこのロックの下で扱う
+        self._lock = threading.Lock()
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        for table, column in _LEGACY_IDENTITY_TABLES:
+            columns = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+            if columns and column not in columns:
+                conn.execute(f'DROP TABLE {table}')
+        conn.executescript(_SCHEMA)
+        conn.commit()
+        self.stats = {'hits': 0, 'misses': 0, 'writes': 0}
+
+    def get_stats(self) -> Dict:
+        """
+        ヒット・ミス・書き込み件数のスナップショットを取得
+
+        Returns:
+            {hits, misses, writes}
+        """
+        with self._lock:
+            return dict(self.stats)
+
+    def _connect(self) -> sqlite3.Connection:
+        """スレッドごとの接続を取得"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=10000')
+            self._local.conn = conn
+        return conn
+
+    def get(self, match_id: str) -> Optional[Dict]:
+        """
+        保存済みの試合詳細を取得
+
+        Args:
+            match_id: マッチID
+
+        Returns:
+            試合詳細情報（未保存ならNone）
+        """
+        row = self._connect().execute(
+            'SELECT data FROM matches WHERE match_id = ?', (match_id,)
+        ).fetchone()
+        with self._lock:
+            self.stats['misses' if row is None else 'hits'] += 1
+        if row is None:
+            return None
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, match_data: Dict) -> bool:
+        """
+        試合詳細を保存（保存済みなら何もしない）
+
+        Args:
+            match_data: 試合詳細情報
+
+        Returns:
+            新たに保存した場合True
+        """
+        metadata = match_data.get('metadata', {})
+        info = match_data.get('info', {})
+        match_id = metadata.get('matchId')
+        if not match_id:
+            return False
+
+        blob = zlib.compress(json.dumps(match_data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        game_creation = info.get('gameCreation')
+        participants = metadata.get('participants') or [p.get('puuid') for p in info.get('participants', [])]
+
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO matches (match_id, queue_id, game_creation, game_version, data) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (match_id, info.get('queueId'), game_creation, info.get('gameVersion'), blob)
+            )
+            if cursor.rowcount == 0:
+                return False
+            conn.executemany(
+                'INSERT OR IGNORE INTO match_participants (puuid, match_id, game_creation) VALUES (?, ?, ?)',
+                [(puuid, match_id, game_creation) for puuid in participants if puuid]
+            )
+        with self._lock:
+            self.stats['writes'] += 1
+        return True
+
+    def has(self, match_id: str) -> bool:
+        """試合が保存済みか判定"""
+        row = self._connect().execute(
+            'SELECT 1 FROM matches WHERE match_id = ?', (match_id,)
+        ).fetchone()
+        return row is not None
+
+    def get_match_ids_by_puuid(self, puuid: str, queue_ids: Optional[List[int]] = None,
+                               limit: int = 20, before: Optional[int] = None) -> List[str]:
+        """
+        プレイヤーの保存済み試合IDを新しい順に取得
+
+        Args:
+            puuid: プレイヤーUUID
+            queue_ids: 対象キューID（省略時はすべて）
+            limit: 取得件数
+            before: このgameCreation（ミリ秒）より前の試合のみ
+
+        Returns:
+            マッチIDのリスト
+        """
+        sql = ('SELECT p.match_id FROM match_participants p JOIN matches m ON m.match_id = p.match_id '
+               'WHERE p.puuid = ?')
+        params: list = [puuid]
+        if queue_ids:
+            sql += f" AND m.queue_id IN ({','.join('?' * len(queue_ids))})"
+            params.extend(queue_ids)
+        if before is not None:
+            sql += ' AND p.game_creation < ?'
+            params.append(before)
+        sql += ' ORDER BY p.game_creation DESC LIMIT ?'
+        params.append(limit)
+        return [row[0] for row in self._connect().execute(sql, params)]
+
+    def get_game_creation(self, match_id: str) -> Optional[int]:
+        """保存済みの試合のgameCreation（ミリ秒）を取得（未保存ならNone）"""
+        row = self._connect().execute(
+            'SELECT game_creation FROM matches WHERE match_id = ?', (match_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def get_match_id_sync(self, puuid: str, queue_key: str) -> Optional[Dict]:
+        """
+        試合IDの同期状態を取得
+
+        Args:
+            puuid: プレイヤーUUID
+            queue_key: キュー条件（match_sync.queue_key）
+
+        Returns:
+            {match_ids, complete, synced_at}（未保存ならNone）
+        """
+        row = self._connect().execute(
+            'SELECT match_ids, complete, synced_at FROM match_id_sync WHERE puuid = ? AND queue_key = ?',
+            (puuid, queue_key)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'match_ids': json.loads(row[0]), 'complete': bool(row[1]), 'synced_at': row[2]}
+
+    def put_match_id_sync(self, puuid: str, queue_key: str, match_ids: List[str], complete: bool, synced_at: float):
+        """
+        試合IDの同期状態を保存
+
+        Args:
+            puuid: プレイヤーUUID
+            queue_key: キュー条件（match_sync.queue_key）
+            match_ids: 取得済みの試合ID（新しい順）
+            complete: 最も古い試合まで取得済みか
+            synced_at: 最後に新しい試合を確認した時刻（エポック秒）
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO match_id_sync (puuid, queue_key, match_ids, complete, synced_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (puuid, queue_key, json.dumps(match_ids, separators=(',', ':')), int(complete), synced_at)
+            )
+
+    def get_riot_id(self, riot_id: str, project: str) -> Optional[Dict]:
+        """
+        解決済みのRiot IDを取得
+
+        Args:
+            riot_id: 正規化したRiot ID（identity_cache.normalize_riot_id）
+            project: 解決に使ったAPIプロジェクトのラベル
+
+        Returns:
+            {puuid, gameName, tagLine, resolved_at}（未保存ならNone）
+        """
+        row = self._connect().execute(
+            'SELECT puuid, game_name, tag_line, resolved_at FROM riot_ids WHERE project = ? AND riot_id = ?',
+            (project, riot_id)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'puuid': row[0], 'gameName': row[1], 'tagLine': row[2], 'resolved_at': row[3]}
+
+    def put_riot_id(self, riot_id: str, project: str, puuid: str, game_name: Optional[str], tag_line: Optional[str],
+                    resolved_at: float):
+        """
+        Riot IDの解決結果を保存
+
+        Args:
+            riot_id: 正規化したRiot ID
+            project: 解決に使ったAPIプロジェクトのラベル
+            puuid: プレイヤーUUID
+            game_name: account-v1が返したゲーム内名前
+            tag_line: account-v1が返したタグライン
+            resolved_at: 解決した時刻（エポック秒）
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO riot_ids (project, riot_id, puuid, game_name, tag_line, resolved_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (project, riot_id, puuid, game_name, tag_line, resolved_at)
+            )
+
+    def get_summoner_id(self, puuid: str, platform: str, project: str) -> Optional[Dict]:
+        """
+        解決済みのサモナーIDを取得
+
+        Args:
+            puuid: プレイヤーUUID
+            platform: プラットフォーム（jp1, kr など）
+            project: 解決に使ったAPIプロジェクトのラベル
+
+        Returns:
+            {summoner_id, resolved_at}（未保存ならNone）
+        """
+        row = self._connect().execute(
+            'SELECT summoner_id, resolved_at FROM summoner_ids WHERE project = ? AND platform = ? AND puuid = ?',
+            (project, platform, puuid)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'summoner_id': row[0], 'resolved_at': row[1]}
+
+    def put_summoner_id(self, puuid: str, platform: str, project: str, summoner_id: str, resolved_at: float):
+        """
+        PUUIDに対応するサモナーIDを保存
+
+        Args:
+            puuid: プレイヤーUUID
+            platform: プラットフォーム
+            project: 解決に使ったAPIプロジェクトのラベル
+            summoner_id: 暗号化されたサモナーID
+            resolved_at: 解決した時刻（エポック秒）
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO summoner_ids (project, platform, puuid, summoner_id, resolved_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (project, platform, puuid, summoner_id, resolved_at)
+            )
+
+    def get_matches_after(self, rowid: int, limit: int = 200) -> List[tuple]:
+        """
+        指定した行番号より後に保存した試合を保存順に取得
+
+        Args:
+            rowid: この行番号より後の試合を返す（0なら先頭から）
+            limit: 最大件数
+
+        Returns:
+            (行番号, 試合詳細情報) のリスト
+        """
+        rows = self._connect().execute(
+            'SELECT rowid, data FROM matches WHERE rowid > ? ORDER BY rowid LIMIT ?', (rowid, limit)
+        ).fetchall()
+        return [(row[0], json.loads(zlib.decompress(row[1]))) for row in rows]
+
+    def get_percentile_watermark(self) -> int:
+        """パーセンタイル分布に取り込み済みの最後の行番号（未作成なら0）"""
+        row = self._connect().execute('SELECT last_rowid FROM percentile_state WHERE id = 1').fetchone()
+        return row[0] if row else 0
+
+    def get_percentile_sketches(self) -> tuple:
+        """
+        保存済みのパーセンタイル分布を取得
+
+        Returns:
+            ({キー: シリアライズしたスケッチ}, 取り込み済みの最後の行番号)
+        """
+        conn = self._connect()
+        # 分布と行番号を同じスナップショットから読む
+        conn.execute('BEGIN')
+        try:
+            sketches = dict(conn.execute('SELECT sketch_key, data FROM percentile_sketches').fetchall())
+            row = conn.execute('SELECT last_rowid FROM percentile_state WHERE id = 1').fetchone()
+        finally:
+            conn.rollback()
+        return sketches, (row[0] if row else 0)
+
+    def put_percentile_sketches(self, sketches: Dict[str, str], last_rowid: int, expected_rowid: int) -> bool:
+        """
+        パーセンタイル分布を保存（他のプロセスが先に進めていた場合は保存しない）
+
+        Args:
+            sketches: 更新したスケッチ {キー: シリアライズしたスケッチ}
+            last_rowid: 取り込み済みの最後の行番号
+            expected_rowid: 読み込んだ時点の行番号（保存済みの値と一致する場合のみ保存する）
+
+        Returns:
+            保存した場合True
+        """
+        conn = self._connect()
+        # 確認と書き込みの間に他のプロセスが書き込まないよう、最初に書き込みロックを取る
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT last_rowid FROM percentile_state WHERE id = 1').fetchone()
+            if (row[0] if row else 0) != expected_rowid:
+                conn.rollback()
+                return False
+            conn.executemany(
+                'INSERT OR REPLACE INTO percentile_sketches (sketch_key, data) VALUES (?, ?)',
+                list(sketches.items())
+            )
+            conn.execute('INSERT OR REPLACE INTO percentile_state (id, last_rowid) VALUES (1, ?)', (last_rowid,))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return True
+
+    def get_timeline(self, match_id: str) -> Optional[bytes]:
+        """
+        保存済みのタイムラインを取得
+
+        Args:
+            match_id: マッチID
+
+        Returns:
+            timeline.MatchTimeline.to_bytes の形式のバイト列（未保存ならNone）
+        """
+        row = self._connect().execute('SELECT data FROM timelines WHERE match_id = ?', (match_id,)).fetchone()
+        return row[0] if row else None
+
+    def put_timeline(self, match_id: str, data: bytes):
+        """
+        タイムラインを保存
+
+        Args:
+            match_id: マッチID
+            data: timeline.MatchTimeline.to_bytes の形式のバイト列
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO timelines (match_id, data) VALUES (?, ?)', (match_id, data))
+
+    def get_player_aggregate(self, puuid: str) -> Optional[Dict]:
+        """
+        プレイヤーの集計を取得
+
+        Args:
+            puuid: プレイヤーUUID
+
+        Returns:
+            集計（player_aggregates.PlayerAggregate.to_dict の形式。未保存ならNone）
+        """
+        row = self._connect().execute('SELECT data FROM player_aggregates WHERE puuid = ?', (puuid,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update_player_aggregates(self, entries: Dict[str, List[Dict]],
+                                 apply: Callable[[Optional[Dict], List[Dict]], Dict], updated_at: float) -> Dict[str, int]:
+        """
+        まだ集計していない試合だけをプレイヤーの集計に加えて保存
+
+        集計済みの試合の確認・読み込み・書き込みを1つのトランザクションで行うため、
+        複数のプロセスが同じ試合を加えても二重に数えない
+
+        Args:
+            entries: {PUUID: 試合ごとの集計項目（match_id を含む）のリスト}
+            apply: (保存済みの集計, 新しい試合の集計項目) -> 更新後の集計
+            updated_at: 更新時刻（エポック秒）
+
+        Returns:
+            {PUUID: 新しく加えた試合数}
+        """
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            counts = {}
+            for puuid, player_entries in entries.items():
+                added = []
+                for entry in player_entries:
+                    cursor = conn.execute(
+                        'INSERT OR IGNORE INTO player_aggregate_matches (puuid, match_id) VALUES (?, ?)',
+                        (puuid, entry['match_id'])
+                    )
+                    if cursor.rowcount:
+                        added.append(entry)
+                if added:
+                    row = conn.execute('SELECT data FROM player_aggregates WHERE puuid = ?', (puuid,)).fetchone()
+                    data = apply(json.loads(row[0]) if row else None, added)
+                    conn.execute(
+                        'INSERT OR REPLACE INTO player_aggregates (puuid, data, updated_at) VALUES (?, ?, ?)',
+                        (puuid, json.dumps(data, separators=(',', ':')), updated_at)
+                    )
+                counts[puuid] = len(added)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return counts
+
+    def get_player_aggregate_watermark(self) -> int:
+        """プレイヤー集計に取り込み済みの最後の行番号（未作成なら0）"""
+        row = self._connect().execute('SELECT last_rowid FROM player_aggregate_state WHERE id = 1').fetchone()
+        return row[0] if row else 0
+
+    def put_player_aggregate_watermark(self, last_rowid: int, expected_rowid: int) -> bool:
+        """
+        プレイヤー集計に取り込み済みの行番号を進める（他のプロセスが先に進めていた場合は更新しない）
+
+        Args:
+            last_rowid: 取り込み済みの最後の行番号
+            expected_rowid: 取り込みを始めた時点の行番号
+
+        Returns:
+            更新した場合True
+        """
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT last_rowid FROM player_aggregate_state WHERE id = 1').fetchone()
+            if (row[0] if row else 0) != expected_rowid:
+                conn.rollback()
+                return False
+            conn.execute('INSERT OR REPLACE INTO player_aggregate_state (id, last_rowid) VALUES (1, ?)', (last_rowid,))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return True
+
+    def count(self) -> int:
+        """保存済み試合数を取得"""
+        return self._connect().execute('SELECT COUNT(*) FROM matches').fetchone()[0]
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_store() -> Optional[MatchStore]:
+    """
+    プロセス共有のストアを取得
+
+    RIOT_MATCH_DBが空文字の場合や、DBを開けない環境（読み取り専用FSなど）ではNone
+
+    Returns:
+        MatchStore または None
+    """
+    global _default_store
+    if not DEFAULT_DB_PATH:
+        return None
+    with _default_store_lock:
+        if _default_store is None:
+            try:
+                _default_store = MatchStore(DEFAULT_DB_PATH)
+            except (sqlite3.Error, OSError) as e:
+                print(f"Match store unavailable: {e}")
+                _default_store = False
+        return _default_store or None
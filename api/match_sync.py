@@ -0,0 +1,306 @@
+"""
+試合IDの差分同期 - プレイヤーごとに取得済みの試合IDを保持し、startTimeで新しい試合IDだけを取得する
+"""
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    from match_store import MatchStore, get_default_store
+except ImportError:
+    from api.match_store import MatchStore, get_default_store
+
+
+# ids エンドポイントの count の上限
+MAX_PAGE_SIZE = 100
+
+# 1プレイヤーあたりに保持する試合IDの上限
+MAX_TRACKED_IDS = 1000
+
+# 前回の同期からこの秒数以内なら再取得しない（レスポンスキャッシュのTTLと同じ）
+DEFAULT_REFRESH_INTERVAL = 60
+
+# 最新の試合の開始時刻が分からない場合に、前回の同期時刻から遡る秒数。
+# 同期時点で進行中だった試合（試合IDの一覧にまだ載っていない）を取りこぼさないよう、
+# 最長の試合時間より長くする
+IN_PROGRESS_MARGIN = 2 * 60 * 60
+
+# fetch_page(start, count, start_time) -> 試合IDのリスト（失敗時None）
+PageFetcher = Callable[[int, int, Optional[int]], Optional[List[str]]]
+
+
+class _SyncState:
+    """1プレイヤー・1キュー条件分の同期状態"""
+
+    __slots__ = ('match_ids', 'complete', 'synced_at')
+
+    def __init__(self, match_ids: List[str], complete: bool, synced_at: float):
+        # 新しい順。先頭から途切れなく並ぶ（間に取得していない試合はない）
+        self.match_ids = match_ids
+        # 最も古い試合まで取得済みか
+        self.complete = complete
+        # 最後に新しい試合を確認した時刻（エポック秒）
+        self.synced_at = synced_at
+
+
+def queue_key(queue_ids: Sequence[int]) -> str:
+    """キュー条件を同期状態のキーにする（条件なしは空文字）"""
+    return ','.join(str(q) for q in queue_ids)
+
+
+class MatchIdSync:
+    """
+    プレイヤーごとの試合IDの差分同期
+
+    初回は先頭から取得し、2回目以降は最新の既知の試合の開始時刻（ウォーターマーク）を
+    startTimeに指定して、それ以降の試合IDだけを取得する。アクティブなプレイヤーの
+    更新は小さな1回の呼び出しで済む。古い試合IDは iter_match_ids で必要になった分だけ
+    start/countでページ送りして取得する。
+    状態はメモリ上に保持し、ストアがあればSQLiteにも保存する。
+    """
+
+    def __init__(self, store: Optional[MatchStore] = None, refresh_interval: float = DEFAULT_REFRESH_INTERVAL,
+                 max_players: int = 10000):
+        """
+        初期化
+
+        Args:
+            store: 同期状態と試合の開始時刻を読み書きするストア（Noneならメモリ上のみ）
+            refresh_interval: 前回の同期からこの秒数以内なら再取得しない
+            max_players: メモリ上に保持するプレイヤー数の上限
+        """
+        self.store = store
+        self.refresh_interval = refresh_interval
+        self.max_players = max_players
+        self._lock = threading.Lock()
+        self._states: "OrderedDict[Tuple[str, str], _SyncState]" = OrderedDict()
+        # {キー: [ロック, 待機・実行中の数]}。同じプレイヤー・キュー条件の取得を1つずつ行う
+        self._key_locks: Dict[Tuple[str, str], list] = {}
+        self.stats = {'full_fetches': 0, 'incremental_fetches': 0, 'skipped': 0, 'older_pages': 0}
+
+    def recent(self, puuid: str, queue_ids: Sequence[int], count: int, fetch_page: PageFetcher) -> Optional[List[str]]:
+        """
+        新しい順に最大count件の試合IDを取得
+
+        Args:
+            puuid: プレイヤーUUID
+            queue_ids: 対象キューID（空ならすべて）
+            count: 取得件数
+            fetch_page: ids エンドポイントを呼び出す関数
+
+        Returns:
+            マッチIDのリスト（初回の取得に失敗した場合None。更新に失敗した場合は既知の試合ID）
+        """
+        key = (puuid, queue_key(queue_ids))
+        state = self._refresh(key, count, fetch_page)
+        if state is None:
+            return None
+        if len(state.match_ids) < count and not state.complete:
+            self._fetch_older(key, state, count - len(state.match_ids), fetch_page)
+        return state.match_ids[:count]
+
+    def iter_match_ids(self, puuid: str, queue_ids: Sequence[int], fetch_page: PageFetcher,
+                       page_size: int = 20) -> Iterator[str]:
+        """
+        新しい順に試合IDを返すジェネレーター
+
+        既知の試合IDを返し終えたら、次のページを start/count で取得する。
+        保持する上限（MAX_TRACKED_IDS件）まで返したら終了する
+
+        Args:
+            puuid: プレイヤーUUID
+            queue_ids: 対象キューID（空ならすべて）
+            fetch_page: ids エンドポイントを呼び出す関数
+            page_size: 1回に取得する件数（最大100）
+        """
+        page_size = min(page_size, MAX_PAGE_SIZE)
+        key = (puuid, queue_key(queue_ids))
+        state = self._refresh(key, page_size, fetch_page)
+        if state is None:
+            return
+        index = 0
+        while True:
+            match_ids = state.match_ids
+            while index < len(match_ids):
+                yield match_ids[index]
+                index += 1
+            if state.complete or not self._fetch_older(key, state, page_size, fetch_page):
+                return
+
+    @contextmanager
+    def _serialized(self, key: Tuple[str, str]):
+        """同じキーの取得・更新を直列化する（使われなくなったロックは外す）"""
+        with self._lock:
+            entry = self._key_locks.get(key)
+            if entry is None:
+                entry = self._key_locks[key] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._key_locks[key]
+
+    def _refresh(self, key: Tuple[str, str], count: int, fetch_page: PageFetcher) -> Optional[_SyncState]:
+        """既知の試合IDより新しい試合IDを取得して状態を更新"""
+        # 同時に呼ばれた場合、後の呼び出しは先の更新を待ってから同期時刻を確かめ直す
+        with self._serialized(key):
+            return self._refresh_locked(key, count, fetch_page)
+
+    def _refresh_locked(self, key: Tuple[str, str], count: int, fetch_page: PageFetcher) -> Optional[_SyncState]:
+        """_refreshの本体（キーのロック保持中に呼ぶ）"""
+        state = self._load(key)
+        now = time.time()
+        if state is None:
+            match_ids = fetch_page(0, min(count, MAX_PAGE_SIZE), None)
+            if match_ids is None:
+                return None
+            self.stats['full_fetches'] += 1
+            state = _SyncState(list(dict.fromkeys(match_ids)), len(match_ids) < min(count, MAX_PAGE_SIZE), now)
+            self._save(key, state)
+            return state
+        if now - state.synced_at < self.refresh_interval:
+            self.stats['skipped'] += 1
+            return state
+
+        start_time = self._watermark(state)
+        known = set(state.match_ids)
+        page_size = min(max(count, 1), MAX_PAGE_SIZE)
+        new_ids: List[str] = []
+        start = 0
+        contiguous = False
+        while True:
+            page = fetch_page(start, page_size, start_time)
+            if page is None:
+                # 更新できなければ既知の試合IDで応答する
+                return state
+            for match_id in page:
+                if match_id in known:
+                    contiguous = True
+                    break
+                new_ids.append(match_id)
+            # startTime以降をすべて取得し終えたか、既知の試合IDに到達した
+            if contiguous or len(page) < page_size:
+                contiguous = True
+                break
+            if len(new_ids) >= count:
+                break
+            start += page_size
+        self.stats['incremental_fetches'] += 1
+
+        with self._lock:
+            if contiguous:
+                merged = list(dict.fromkeys(new_ids + state.match_ids))
+                state.match_ids = merged[:MAX_TRACKED_IDS]
+                if len(merged) > MAX_TRACKED_IDS:
+                    state.complete = False
+            else:
+                # 前回から試合数が多すぎて既知の試合IDまで辿れなかった。古い側は取り直す
+                state.match_ids = new_ids
+                state.complete = False
+            state.synced_at = now
+        self._save(key, state)
+        return state
+
+    def _fetch_older(self, key: Tuple[str, str], state: _SyncState, count: int, fetch_page: PageFetcher) -> bool:
+        """
+        既知の試合IDより古いページを取得して状態に追加
+
+        Returns:
+            試合IDを追加できた場合True
+        """
+        with self._serialized(key):
+            return self._fetch_older_locked(key, state, count, fetch_page)
+
+    def _fetch_older_locked(self, key: Tuple[str, str], state: _SyncState, count: int,
+                            fetch_page: PageFetcher) -> bool:
+        """_fetch_olderの本体（キーのロック保持中に呼ぶ）"""
+        if state.complete or len(state.match_ids) >= MAX_TRACKED_IDS:
+            return False
+        count = min(count, MAX_PAGE_SIZE)
+        page = fetch_page(len(state.match_ids), count, None)
+        if page is None:
+            return False
+        self.stats['older_pages'] += 1
+        with self._lock:
+            # ページ取得中に新しい試合が終わると開始位置がずれるため、重複を除く
+            known = set(state.match_ids)
+            added = [match_id for match_id in page if match_id not in known]
+            state.match_ids = state.match_ids + added
+            if len(page) < count:
+                state.complete = True
+        self._save(key, state)
+        return bool(added)
+
+    def _watermark(self, state: _SyncState) -> int:
+        """startTimeに指定する時刻（エポック秒）"""
+        if state.match_ids and self.store is not None:
+            creation = self.store.get_game_creation(state.match_ids[0])
+            if creation:
+                return creation // 1000
+        return int(state.synced_at - IN_PROGRESS_MARGIN)
+
+    def _load(self, key: Tuple[str, str]) -> Optional[_SyncState]:
+        """同期状態を取得（メモリになければストアから読み込む）"""
+        with self._lock:
+            state = self._states.get(key)
+            if state is not None:
+                self._states.move_to_end(key)
+                return state
+        if self.store is None:
+            return None
+        row = self.store.get_match_id_sync(*key)
+        if row is None:
+            return None
+        state = _SyncState(row['match_ids'], row['complete'], row['synced_at'])
+        self._remember(key, state)
+        return state
+
+    def _save(self, key: Tuple[str, str], state: _SyncState):
+        """同期状態を保存"""
+        self._remember(key, state)
+        if self.store is not None:
+            self.store.put_match_id_sync(key[0], key[1], state.match_ids, state.complete, state.synced_at)
+
+    def _remember(self, key: Tuple[str, str], state: _SyncState):
+        """メモリ上の同期状態を更新（上限を超えたら古いものから外す）"""
+        with self._lock:
+            self._states[key] = state
+            self._states.move_to_end(key)
+            while len(self._states) > self.max_players:
+                self._states.popitem(last=False)
+
+    def get_status(self, puuid: str, queue_ids: Sequence[int] = ()) -> Optional[Dict]:
+        """
+        プレイヤーの同期状態を取得
+
+        Returns:
+            {known_ids, complete, synced_at, newest}（未同期ならNone）
+        """
+        state = self._load((puuid, queue_key(queue_ids)))
+        if state is None:
+            return None
+        return {
+            'known_ids': len(state.match_ids),
+            'complete': state.complete,
+            'synced_at': state.synced_at,
+            'newest': state.match_ids[0] if state.match_ids else None,
+        }
+
+
+_default_sync = None
+_default_sync_lock = threading.Lock()
+
+
+def get_default_match_sync() -> MatchIdSync:
+    """プロセス共有の同期状態を取得（試合データ永続ストアがあれば保存先に使う）"""
+    global _default_sync
+    with _default_sync_lock:
+        if _default_sync is None:
+            _default_sync = MatchIdSync(get_default_store())
+        return _default_sync
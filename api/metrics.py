@@ -0,0 +1,55 @@
+"""
+Vercel Serverless Function: クライアントメトリクスAPI
+
+レイテンシ・ステータス・再試行・レート制限の残り回数・キャッシュヒット率を返す。
+値はこのインスタンスが処理したリクエスト分のみ（インスタンス間では集計されない）
+"""
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    from client_metrics import collect_metrics, render_prometheus, PROMETHEUS_CONTENT_TYPE
+except ImportError:
+    from api.client_metrics import collect_metrics, render_prometheus, PROMETHEUS_CONTENT_TYPE
+
+
+class handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        """メトリクスを返す（?format=prometheus でテキスト形式）"""
+        try:
+            query = parse_qs(urlparse(self.path).query)
+            data = collect_metrics()
+            if query.get('format', [''])[0] == 'prometheus':
+                body = render_prometheus(data).encode('utf-8')
+                content_type = PROMETHEUS_CONTENT_TYPE
+            else:
+                body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+                content_type = 'application/json'
+
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Cache-Control', 'no-store')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
+            self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+            self.end_headers()
+            self.wfile.write(body)
+
+        except Exception as e:
+            self.send_response(500)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            self.wfile.write(json.dumps({'error': str(e)}).encode('utf-8'))
+
+    def do_OPTIONS(self):
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.end_headers()
@@ -0,0 +1,425 @@
+"""
+参加者データセット - 保存済みの試合の参加者を統計ごとの型付き配列（列ファイル）に追記し、
+メモリマップで読み込んで全件の集計を配列演算で行う
+"""
+import json
+import os
+import threading
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    from match_store import MatchStore, DEFAULT_DB_PATH, get_default_store
+    from records import MatchRecord, extract_match_record
+except ImportError:
+    from api.match_store import MatchStore, DEFAULT_DB_PATH, get_default_store
+    from api.records import MatchRecord, extract_match_record
+
+
+# 保存先ディレクトリ（空文字なら使用しない）
+DEFAULT_DATASET_PATH = os.environ.get(
+    'RIOT_PARTICIPANT_DATASET',
+    os.path.join(os.path.dirname(DEFAULT_DB_PATH), 'participants') if DEFAULT_DB_PATH else ''
+)
+
+# 列の定義: (列名, 型)。参加者の項目は get_player_stats と同じ名前にする
+SCHEMA = (
+    # 試合
+    ('match_rowid', '<i8'),        # 試合データ永続ストアの行番号
+    ('game_creation', '<i8'),      # ミリ秒
+    ('game_duration', '<i4'),      # 秒
+    ('queue_id', '<i2'),
+    ('patch', '<i2'),              # パッチ 14.3 → 1403
+    ('team_id', '<i2'),
+    # 基本情報
+    ('champion_id', '<i2'),
+    ('champion_level', 'u1'),
+    ('position', 'u1'),            # POSITION_CODES
+    ('win', 'u1'),
+    ('kills', '<i2'),
+    ('deaths', '<i2'),
+    ('assists', '<i2'),
+    # ファーム・経済
+    ('cs', '<i2'),
+    ('minions_killed', '<i2'),
+    ('neutral_minions_killed', '<i2'),
+    ('gold', '<i4'),
+    ('gold_spent', '<i4'),
+    # ダメージ
+    ('total_damage_dealt', '<i4'),
+    ('total_damage_to_champions', '<i4'),
+    ('total_damage_taken', '<i4'),
+    ('damage_self_mitigated', '<i4'),
+    # ビジョン
+    ('vision_score', '<i2'),
+    ('wards_placed', '<i2'),
+    ('wards_killed', '<i2'),
+    ('control_wards_purchased', '<i2'),
+    # オブジェクト
+    ('turret_kills', 'u1'),
+    ('inhibitor_kills', 'u1'),
+    ('dragon_kills', 'u1'),
+    ('baron_kills', 'u1'),
+)
+
+# ポジション（teamPosition）の符号。0は不明
+POSITION_CODES = {'TOP': 1, 'JUNGLE': 2, 'MIDDLE': 3, 'BOTTOM': 4, 'UTILITY': 5}
+POSITION_NAMES = {code: name for name, code in POSITION_CODES.items()}
+
+_MATCH_COLUMNS = frozenset(('match_rowid', 'game_creation', 'queue_id', 'patch'))
+
+# 1回の追記でストアから読み込む試合数
+SYNC_CHUNK = 500
+
+_META_FILE = 'meta.json'
+_LOCK_FILE = '.lock'
+
+
+def encode_patch(game_version: Optional[str]) -> int:
+    """gameVersion（例: 14.3.558.1234）を整数（1403）に変換（不明なら0）"""
+    try:
+        major, minor = str(game_version).split('.')[:2]
+        return int(major) * 100 + int(minor)
+    except (ValueError, TypeError):
+        return 0
+
+
+def _participant_values(rowid: int, match: MatchRecord, patch: int):
+    """試合1件分の参加者を列の順の値のタプルで返す"""
+    match_values = {'match_rowid': rowid, 'game_creation': match.game_creation or 0,
+                    'queue_id': match.queue_id or 0, 'patch': patch}
+    for participant in match.participants:
+        values = []
+        for name, _ in SCHEMA:
+            if name in _MATCH_COLUMNS:
+                value = match_values[name]
+            elif name == 'position':
+                value = POSITION_CODES.get(participant.position, 0)
+            elif name == 'game_duration':
+                value = participant.raw_game_duration
+            else:
+                value = getattr(participant, name)
+            values.append(int(value) if value else 0)
+        yield values
+
+
+class ParticipantDataset:
+    """
+    参加者の列指向データセット（追記のみ）
+
+    列ごとに1つのリトルエンディアンの生配列ファイル（<列名>.bin）を持ち、
+    meta.json に確定した行数と取り込み済みの試合データ永続ストアの行番号を記録する。
+    追記は列ファイルに書き足してから meta.json を置き換えるため、途中で止まっても
+    読み込み側は確定した行数までしか見ない（次の追記の前に余分な末尾を切り詰める）。
+    読み込みは np.memmap で行い、スライスはコピーせずにファイルを参照する。
+    """
+
+    def __init__(self, path: str):
+        """
+        初期化
+
+        Args:
+            path: 保存先ディレクトリ（なければ作成）
+        """
+        if not HAS_NUMPY:
+            raise RuntimeError('参加者データセットにはNumPyが必要です')
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._maps: Dict[str, "np.memmap"] = {}
+        self._meta = self._read_meta()
+
+    def _column_path(self, name: str) -> str:
+        return os.path.join(self.path, f'{name}.bin')
+
+    def _read_meta(self) -> Dict:
+        try:
+            with open(os.path.join(self.path, _META_FILE), encoding='utf-8') as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return {'rows': 0, 'last_rowid': 0, 'columns': [name for name, _ in SCHEMA]}
+        if meta.get('columns') != [name for name, _ in SCHEMA]:
+            raise ValueError(f'参加者データセットの列が一致しません: {self.path}')
+        return meta
+
+    def _write_meta(self, meta: Dict):
+        temp_path = os.path.join(self.path, _META_FILE + '.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, os.path.join(self.path, _META_FILE))
+
+    @property
+    def rows(self) -> int:
+        """確定した行数"""
+        return self._meta['rows']
+
+    @property
+    def last_rowid(self) -> int:
+        """取り込み済みの試合データ永続ストアの最後の行番号"""
+        return self._meta['last_rowid']
+
+    def refresh(self):
+        """他のプロセスが追記した行を読めるよう meta.json を読み直す"""
+        meta = self._read_meta()
+        with self._lock:
+            if meta['rows'] != self._meta['rows']:
+                self._maps.clear()
+            self._meta = meta
+
+    def append_matches(self, matches: Iterable[Tuple[int, MatchRecord]]) -> int:
+        """
+        試合の全参加者を追記
+
+        Args:
+            matches: (試合データ永続ストアの行番号, 試合レコード) の行番号順のリスト
+
+        Returns:
+            追記した行数
+        """
+        rows = []
+        last_rowid = None
+        for rowid, match in matches:
+            rows.extend(_participant_values(rowid, match, encode_patch(match.game_version)))
+            last_rowid = rowid
+        if last_rowid is None:
+            return 0
+        # 行のタプルから列ごとの配列へ1回で変換する
+        table = np.array(rows, dtype=np.int64).reshape(len(rows), len(SCHEMA))
+        return self._append(table, last_rowid)
+
+    def _append(self, table: "np.ndarray", last_rowid: int) -> int:
+        with self._lock, _FileLock(os.path.join(self.path, _LOCK_FILE)):
+            meta = self._read_meta()
+            if last_rowid <= meta['last_rowid']:
+                # 他のプロセスが先に取り込んだ
+                self._meta = meta
+                return 0
+            for index, (name, dtype) in enumerate(SCHEMA):
+                column_path = self._column_path(name)
+                size = meta['rows'] * np.dtype(dtype).itemsize
+                with open(column_path, 'ab') as f:
+                    # 確定していない末尾（前回の追記が途中で止まった分）を除く
+                    if f.tell() != size:
+                        f.truncate(size)
+                    f.write(table[:, index].astype(dtype).tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+            meta = dict(meta, rows=meta['rows'] + len(table), last_rowid=last_rowid)
+            self._write_meta(meta)
+            self._meta = meta
+            self._maps.clear()
+        return len(table)
+
+    def sync_from_store(self, store: MatchStore, chunk: int = SYNC_CHUNK, max_matches: Optional[int] = None) -> int:
+        """
+        試合データ永続ストアの新しい試合を取り込む
+
+        Args:
+            store: 試合データ永続ストア
+            chunk: 1回の追記で取り込む試合数
+            max_matches: 取り込む試合数の上限（Noneならすべて）
+
+        Returns:
+            取り込んだ試合数
+        """
+        self.refresh()
+        total = 0
+        while max_matches is None or total < max_matches:
+            limit = chunk if max_matches is None else min(chunk, max_matches - total)
+            matches = store.get_matches_after(self.last_rowid, limit)
+            if not matches:
+                break
+            self.append_matches((rowid, extract_match_record(match_data)) for rowid, match_data in matches)
+            total += len(matches)
+        return total
+
+    def column(self, name: str) -> "np.ndarray":
+        """
+        列をメモリマップで取得（読み取り専用）
+
+        Args:
+            name: 列名（SCHEMAの列名）
+
+        Returns:
+            確定した行数分の配列
+        """
+        with self._lock:
+            mapped = self._maps.get(name)
+            if mapped is None:
+                dtype = dict(SCHEMA)[name]
+                rows = self._meta['rows']
+                if rows:
+                    mapped = np.memmap(self._column_path(name), dtype=dtype, mode='r', shape=(rows,))
+                else:
+                    mapped = np.empty(0, dtype=dtype)
+                self._maps[name] = mapped
+            return mapped
+
+    def columns(self, names: Optional[Sequence[str]] = None, start: int = 0,
+                stop: Optional[int] = None) -> Dict[str, "np.ndarray"]:
+        """
+        複数の列の範囲を取得（コピーしない）
+
+        Args:
+            names: 列名のリスト（省略時はすべて）
+            start: 先頭の行
+            stop: 末尾の行（含まない。省略時は最後まで）
+
+        Returns:
+            {列名: 配列}
+        """
+        names = names or [name for name, _ in SCHEMA]
+        return {name: self.column(name)[start:stop] for name in names}
+
+    def group_means(self, by: str, values: Sequence[str], mask: Optional["np.ndarray"] = None) -> Dict[int, Dict]:
+        """
+        列の値ごとに平均を集計
+
+        Args:
+            by: 集計の単位にする列（position / champion_id / queue_id / patch など）
+            values: 平均を求める列
+            mask: 対象の行のbool配列（省略時はすべて）
+
+        Returns:
+            {列の値: {'count': 行数, 列名: 平均}}
+        """
+        keys = self.column(by)
+        if mask is not None:
+            keys = keys[mask]
+        groups, inverse = _group_index(keys)
+        counts = np.bincount(inverse, minlength=len(groups))
+        present = np.flatnonzero(counts)
+        result = {int(groups[i]): {'count': int(counts[i])} for i in present.tolist()}
+        for name in values:
+            column = self.column(name)
+            if mask is not None:
+                column = column[mask]
+            sums = np.bincount(inverse, weights=column, minlength=len(groups))
+            for i in present.tolist():
+                result[int(groups[i])][name] = round(float(sums[i] / counts[i]), 2)
+        return result
+
+    def summary(self) -> Dict:
+        """
+        ポジション別の代表的な統計（行数・勝率・KDA・分あたりCS/ゴールド/ダメージ）
+
+        Returns:
+            {rows, matches, positions: {ポジション名: 統計}}
+        """
+        data = self.columns(['position', 'win', 'kills', 'deaths', 'assists', 'cs', 'gold',
+                             'total_damage_to_champions', 'game_duration'])
+        minutes = np.maximum(data['game_duration'] / 60, 1)
+        kda = (data['kills'].astype(np.float64) + data['assists']) / np.maximum(data['deaths'], 1)
+        per_minute = {
+            'kda': kda,
+            'cs_per_minute': data['cs'] / minutes,
+            'gold_per_minute': data['gold'] / minutes,
+            'damage_per_minute': data['total_damage_to_champions'] / minutes,
+        }
+        # ポジションの符号は小さい整数のため、bincountで全ポジションを1回の走査で集計する
+        codes = data['position']
+        counts = np.bincount(codes, minlength=len(POSITION_CODES) + 1)
+        wins = np.bincount(codes, weights=data['win'], minlength=len(counts))
+        sums = {name: np.bincount(codes, weights=values, minlength=len(counts)) for name, values in per_minute.items()}
+        positions = {}
+        for code in np.flatnonzero(counts).tolist():
+            count = int(counts[code])
+            stats = {'rows': count, 'win_rate': round(float(wins[code] / count) * 100, 1)}
+            for name, total in sums.items():
+                stats[name] = round(float(total[code] / count), 2)
+            positions[POSITION_NAMES.get(code, 'UNKNOWN')] = stats
+        # 行は試合データ永続ストアの行番号順に並ぶため、値が変わる位置の数で試合数が分かる
+        match_rowids = self.column('match_rowid')
+        return {
+            'rows': self.rows,
+            'matches': int(np.count_nonzero(np.diff(match_rowids))) + 1 if self.rows else 0,
+            'positions': positions,
+        }
+
+
+def _group_index(keys: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    集計の単位の値と、各行がどの単位に属するかの番号
+
+    値の範囲が狭い整数列（ポジション・チャンピオンID・キューIDなど）は並べ替えずに
+    最小値からの差を番号にする。範囲が広い列は np.unique で番号を付ける
+    """
+    if len(keys) and np.issubdtype(keys.dtype, np.integer):
+        low, high = int(keys.min()), int(keys.max())
+        if high - low <= 1 << 16:
+            return np.arange(low, high + 1), keys.astype(np.intp) - low
+    return np.unique(keys, return_inverse=True)
+
+
+class _FileLock:
+    """追記中に他のプロセスが追記しないためのファイルロック（fcntlがない環境ではプロセス内のみ）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self._file = open(self.path, 'a')
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+
+_default_dataset = None
+_default_dataset_lock = threading.Lock()
+
+
+def get_default_dataset() -> Optional[ParticipantDataset]:
+    """
+    プロセス共有のデータセットを取得
+
+    RIOT_PARTICIPANT_DATASETが空文字の場合や、NumPyがない・保存先を作成できない環境ではNone
+
+    Returns:
+        ParticipantDataset または None
+    """
+    global _default_dataset
+    if not DEFAULT_DATASET_PATH or not HAS_NUMPY:
+        return None
+    with _default_dataset_lock:
+        if _default_dataset is None:
+            try:
+                _default_dataset = ParticipantDataset(DEFAULT_DATASET_PATH)
+            except (OSError, ValueError) as e:
+                print(f"Participant dataset disabled: {e}")
+                return None
+        return _default_dataset
+
+
+if __name__ == '__main__':
+    # 試合データ永続ストアの新しい試合を取り込み、ポジション別の統計を表示する
+    import time
+
+    dataset = get_default_dataset()
+    store = get_default_store()
+    if dataset is None or store is None:
+        raise SystemExit('試合データ永続ストアまたは参加者データセットが使用できません')
+    started = time.perf_counter()
+    ingested = dataset.sync_from_store(store)
+    print(f"Ingested {ingested} matches in {time.perf_counter() - started:.2f}s")
+    started = time.perf_counter()
+    print(json.dumps(dataset.summary(), ensure_ascii=False, indent=2))
+    print(f"Summary over {dataset.rows} rows in {time.perf_counter() - started:.3f}s")
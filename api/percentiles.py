@@ -0,0 +1,455 @@
+"""
+パーセンタイル分布 - 保存済みの試合の総合スコアから、(ポジション, チャンピオン, パッチ) ごとの
+分位点スケッチ（KLL）を作り、スコアのパーセンタイルを履歴を走査せずに求める
+"""
+import bisect
+import json
+import math
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+try:
+    from match_store import MatchStore, get_default_store
+    from records import extract_match_record
+except ImportError:
+    from api.match_store import MatchStore, get_default_store
+    from api.records import extract_match_record
+
+
+# スケッチの精度パラメータ（最上位の圧縮器の容量。順位の誤差はおよそ 1.7/k）
+DEFAULT_K = 200
+
+# パーセンタイルを返すのに必要な最小サンプル数（足りなければ粗いキーに切り替える）
+MIN_SAMPLES = 30
+
+# 保存済みの試合を取り込みに行く間隔（秒）と、1回に取り込む最大試合数
+REFRESH_INTERVAL = 30
+REFRESH_BATCH = 200
+
+# サーバーレス環境（Vercel）ではレスポンスを返すとスレッドが止まるため、バックグラウンドでは
+# 取り込まず、参照時にこの秒数の範囲で同期的に取り込む（1回に読む試合数も小さくする）
+SYNC_REFRESH_BUDGET = float(os.environ.get('RIOT_PERCENTILE_SYNC_BUDGET', 0.2))
+SYNC_REFRESH_BATCH = 20
+DEFAULT_REFRESH_BUDGET = SYNC_REFRESH_BUDGET if os.environ.get('VERCEL') else None
+
+# キーの「すべて」を表す値
+ANY = '*'
+
+
+class KLLSketch:
+    """
+    KLL分位点スケッチ
+
+    レベルhの要素は重み2^hを持つ。レベルが容量を超えると整列して1つおきに上のレベルへ
+    送る（残す側は交互に切り替えるため、同じ入力からは同じスケッチができる）。
+    同じkのスケッチはレベルごとに連結して圧縮し直すことで統合できる。
+    """
+
+    __slots__ = ('k', 'levels', 'count', '_flip', '_cdf')
+
+    def __init__(self, k: int = DEFAULT_K):
+        self.k = k
+        self.levels: List[List[float]] = [[]]
+        self.count = 0
+        self._flip = False
+        # (値の昇順リスト, 累積重みのリスト)。更新で破棄する
+        self._cdf = None
+
+    def _capacity(self, level: int) -> int:
+        """レベルの容量（上のレベルほど大きく、最上位がk）"""
+        depth = len(self.levels) - level - 1
+        return max(int(math.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def update(self, value: float):
+        """値を1つ追加"""
+        self.levels[0].append(value)
+        self.count += 1
+        self._cdf = None
+        if len(self.levels[0]) >= self._capacity(0):
+            self._compress()
+
+    def merge(self, other: "KLLSketch"):
+        """別のスケッチを統合"""
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+        self.count += other.count
+        self._cdf = None
+        self._compress()
+
+    def _compress(self):
+        """容量を超えたレベルを上のレベルへ圧縮"""
+        while sum(len(items) for items in self.levels) > sum(self._capacity(h) for h in range(len(self.levels))):
+            for level, items in enumerate(self.levels):
+                if len(items) < self._capacity(level):
+                    continue
+                if level + 1 == len(self.levels):
+                    self.levels.append([])
+                items.sort()
+                # 奇数個なら1つをこのレベルに残す
+                keep = [items.pop()] if len(items) % 2 else []
+                self._flip = not self._flip
+                self.levels[level + 1].extend(items[int(self._flip)::2])
+                self.levels[level] = keep
+                break
+
+    def _build_cdf(self):
+        weighted = sorted((value, 1 << level) for level, items in enumerate(self.levels) for value in items)
+        values = [value for value, _ in weighted]
+        cumulative = []
+        total = 0
+        for _, weight in weighted:
+            total += weight
+            cumulative.append(total)
+        self._cdf = (values, cumulative)
+        return self._cdf
+
+    def rank(self, value: float) -> float:
+        """value以下の割合（0〜1）"""
+        if not self.count:
+            return 0.0
+        values, cumulative = self._cdf or self._build_cdf()
+        index = bisect.bisect_right(values, value)
+        return cumulative[index - 1] / cumulative[-1] if index else 0.0
+
+    def quantile(self, q: float) -> Optional[float]:
+        """割合qの分位点"""
+        if not self.count:
+            return None
+        values, cumulative = self._cdf or self._build_cdf()
+        target = q * cumulative[-1]
+        index = bisect.bisect_left(cumulative, target)
+        return values[min(index, len(values) - 1)]
+
+    def to_json(self) -> str:
+        """保存用の文字列に変換"""
+        return json.dumps({
+            'k': self.k, 'n': self.count, 'f': int(self._flip),
+            'levels': [[round(value, 4) for value in items] for items in self.levels],
+        }, separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, data: str) -> "KLLSketch":
+        """保存した文字列から復元"""
+        payload = json.loads(data)
+        sketch = cls(payload['k'])
+        sketch.levels = payload['levels'] or [[]]
+        sketch.count = payload['n']
+        sketch._flip = bool(payload.get('f'))
+        return sketch
+
+
+def patch_of(game_version: Optional[str]) -> str:
+    """gameVersion（例: 14.3.558.1234）からパッチ（14.3）を取得"""
+    if not game_version:
+        return ''
+    return '.'.join(str(game_version).split('.')[:2])
+
+
+def _patch_order(patch: str) -> Tuple:
+    """パッチの新旧比較用のキー"""
+    try:
+        return tuple(int(part) for part in patch.split('.'))
+    except ValueError:
+        return ()
+
+
+def sketch_keys(position: Optional[str], champion: Optional[str], patch: str) -> List[str]:
+    """1人分のスコアを加えるキー（細かい順）"""
+    position = position or ''
+    champion = champion or ''
+    return [
+        f"{position}|{champion}|{patch}",
+        f"{position}|{champion}|{ANY}",
+        f"{position}|{ANY}|{patch}",
+        f"{position}|{ANY}|{ANY}",
+        f"{ANY}|{ANY}|{ANY}",
+    ]
+
+
+class PercentileIndex:
+    """
+    総合スコアのパーセンタイル分布
+
+    試合データ永続ストアに保存された試合を行番号の順に取り込み、参加者ごとの総合スコアを
+    (ポジション, チャンピオン, パッチ) と、それを粗くしたキーのスケッチに加える。
+    スケッチと取り込み済みの行番号はストアに保存し、プロセス間で共有する。
+    取り込みはバックグラウンドのスレッドで行い、percentile はスケッチを引くだけで返る
+    （サーバーレス環境では参照時に短い時間の範囲で同期的に取り込む）。
+    """
+
+    def __init__(self, store: Optional[MatchStore] = None, k: int = DEFAULT_K, min_samples: int = MIN_SAMPLES,
+                 refresh_interval: float = REFRESH_INTERVAL, refresh_batch: int = REFRESH_BATCH,
+                 refresh_budget: Optional[float] = DEFAULT_REFRESH_BUDGET):
+        """
+        初期化
+
+        Args:
+            store: 試合データ永続ストア（Noneなら add で加えたスコアのみ）
+            k: スケッチの精度パラメータ
+            min_samples: パーセンタイルを返すのに必要な最小サンプル数
+            refresh_interval: ストアの新しい試合を確認する間隔（秒）
+            refresh_batch: 1回に取り込む最大試合数
+            refresh_budget: 参照時に同期的に取り込む場合の時間（秒）。Noneならバックグラウンドで取り込む
+        """
+        self.store = store
+        self.k = k
+        self.min_samples = min_samples
+        self.refresh_interval = refresh_interval
+        self.refresh_batch = refresh_batch
+        self.refresh_budget = refresh_budget
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._sketches: Dict[str, KLLSketch] = {}
+        self._dirty = set()
+        self._loaded = False
+        self._initialized = False
+        self._refreshing = False
+        self._checked_at = float('-inf')
+        self.last_rowid = 0
+        self.current_patch = ''
+        self.stats = {'lookups': 0, 'fallbacks': 0, 'ingested_matches': 0, 'ingested_scores': 0}
+
+    def add(self, score: float, position: Optional[str], champion: Optional[str], patch: str = ''):
+        """
+        総合スコアを1件加える
+
+        Args:
+            score: 総合スコア（丸め前）
+            position: ポジション（teamPosition）
+            champion: チャンピオン名
+            patch: パッチ（例: 14.3）
+        """
+        self.add_many([(score, position, champion, patch)])
+
+    def add_many(self, entries: Sequence[Tuple[float, Optional[str], Optional[str], str]]):
+        """(総合スコア, ポジション, チャンピオン, パッチ) をまとめて加える"""
+        with self._lock:
+            for score, position, champion, patch in entries:
+                for key in sketch_keys(position, champion, patch):
+                    sketch = self._sketches.get(key)
+                    if sketch is None:
+                        sketch = self._sketches[key] = KLLSketch(self.k)
+                    sketch.update(score)
+                    self._dirty.add(key)
+                if patch and _patch_order(patch) > _patch_order(self.current_patch):
+                    self.current_patch = patch
+            self.stats['ingested_scores'] += len(entries)
+
+    def percentile(self, score: float, position: Optional[str], champion: Optional[str],
+                   patch: Optional[str] = None) -> Optional[float]:
+        """
+        総合スコアのパーセンタイル（同じ条件のプレイヤーのうち、このスコア以下の割合）
+
+        サンプルが足りなければ、チャンピオン・パッチを問わないキーへ順に切り替える
+
+        Args:
+            score: 総合スコア（丸め前）
+            position: ポジション
+            champion: チャンピオン名
+            patch: パッチ（省略時は取り込んだ中で最新のパッチ）
+
+        Returns:
+            0〜100のパーセンタイル（どのキーもサンプルが足りなければNone）
+        """
+        if not self._initialized:
+            self._initialize()
+        self._schedule_refresh()
+        with self._lock:
+            self.stats['lookups'] += 1
+            patch = self.current_patch if patch is None else patch
+            for key in sketch_keys(position, champion, patch):
+                sketch = self._sketches.get(key)
+                if sketch is not None and sketch.count >= self.min_samples:
+                    return round(sketch.rank(score) * 100, 1)
+            self.stats['fallbacks'] += 1
+        return None
+
+    def _initialize(self):
+        """初回の参照時に、保存済みのスケッチだけを読み込む（試合の取り込みは行わない）"""
+        with self._refresh_lock:
+            if self._initialized:
+                return
+            if self.store is not None and not self._loaded:
+                try:
+                    self._load()
+                except Exception as e:
+                    print(f"Percentile sketches not loaded: {e}")
+            self._initialized = True
+
+    def _schedule_refresh(self):
+        """
+        前回の確認から間隔が空いていれば、新しい試合の取り込みを始める
+
+        取り込みは同時に1つだけ行う。refresh_budget が指定されていればこのスレッドで取り込む
+        """
+        if self.store is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if self._refreshing or now - self._checked_at < self.refresh_interval:
+                return
+            # 取り込めなかった場合も次の確認は間隔を空ける
+            self._refreshing = True
+            self._checked_at = now
+        if self.refresh_budget is not None:
+            self._run_refresh()
+        else:
+            threading.Thread(target=self._run_refresh, name='percentile-refresh', daemon=True).start()
+
+    def _run_refresh(self):
+        # バックグラウンドでは他の取り込みの終了を待ち、同期的に取り込む場合は待たずに次回に回す
+        if self._refresh_lock.acquire(blocking=self.refresh_budget is None):
+            try:
+                self._ingest_new(self.refresh_budget)
+            finally:
+                self._refresh_lock.release()
+        with self._lock:
+            self._refreshing = False
+
+    def refresh(self, force: bool = False, budget: Optional[float] = None) -> int:
+        """
+        ストアに新しく保存された試合を取り込む（前回の確認から間隔が空いた場合のみ）
+
+        他のスレッドが取り込み中なら待たずに戻る
+
+        Args:
+            force: 間隔に関係なく確認し、取り込み中なら終わるまで待つ
+            budget: 取り込みに使う時間（秒）。指定時は小さな単位で取り込み、超えたら残りを次回に回す
+
+        Returns:
+            取り込んだ試合数
+        """
+        if self.store is None:
+            return 0
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.refresh_interval:
+            return 0
+        if not self._refresh_lock.acquire(blocking=force):
+            return 0
+        try:
+            self._checked_at = now
+            return self._ingest_new(budget)
+        finally:
+            self._refresh_lock.release()
+
+    def _ingest_new(self, budget: Optional[float] = None) -> int:
+        """新しく保存された試合を取り込む（_refresh_lock保持中に呼ぶ）"""
+        try:
+            if not self._loaded or self.store.get_percentile_watermark() > self.last_rowid:
+                # 他のプロセスが先に取り込んでいれば、その結果を読み込む
+                self._load()
+            deadline = None if budget is None else time.monotonic() + budget
+            batch = self.refresh_batch if budget is None else min(self.refresh_batch, SYNC_REFRESH_BATCH)
+            total = 0
+            while total < self.refresh_batch:
+                rows = self.store.get_matches_after(self.last_rowid, batch)
+                if not rows:
+                    break
+                self._ingest([match_data for _, match_data in rows])
+                self._save(rows[-1][0])
+                total += len(rows)
+                # 保存が競合した場合は、次回に読み込み直してから続ける
+                if len(rows) < batch or not self._loaded or (deadline is not None and time.monotonic() >= deadline):
+                    break
+            return total
+        except Exception as e:
+            # 取り込めなくても読み込み済みの分布で応答する
+            print(f"Percentile refresh failed: {e}")
+            return 0
+
+    def rebuild(self) -> int:
+        """
+        ストアのすべての試合を取り込む
+
+        Returns:
+            取り込んだ試合数
+        """
+        total = 0
+        while True:
+            self._checked_at = float('-inf')
+            ingested = self.refresh(force=True)
+            if not ingested:
+                return total
+            total += ingested
+
+    def _ingest(self, matches: List[Dict]):
+        """試合の全参加者の総合スコアをまとめて計算して加える"""
+        # scoringはutils経由でこのモジュールを読み込むため、ここで読み込む
+        try:
+            from scoring import calculate_total_scores
+        except ImportError:
+            from api.scoring import calculate_total_scores
+
+        participants = []
+        patches = []
+        for match_data in matches:
+            match = extract_match_record(match_data)
+            patch = patch_of(match.game_version)
+            participants.extend(match.participants)
+            patches.extend([patch] * len(match.participants))
+        totals = calculate_total_scores(participants)
+        self.add_many([
+            (total, participant.position, participant.champion, patch)
+            for participant, total, patch in zip(participants, totals, patches)
+        ])
+        self.stats['ingested_matches'] += len(matches)
+
+    def _load(self):
+        """ストアに保存したスケッチを読み込む"""
+        sketches, last_rowid = self.store.get_percentile_sketches()
+        loaded = {key: KLLSketch.from_json(data) for key, data in sketches.items()}
+        with self._lock:
+            self._sketches = loaded
+            self._dirty.clear()
+            self.last_rowid = last_rowid
+            self.current_patch = max((key.rsplit('|', 1)[1] for key in loaded), key=_patch_order, default='')
+            if self.current_patch == ANY:
+                self.current_patch = ''
+        self._loaded = True
+
+    def _save(self, last_rowid: int):
+        """更新したスケッチと取り込み済みの行番号を保存"""
+        with self._lock:
+            changed = {key: self._sketches[key].to_json() for key in self._dirty}
+            self._dirty.clear()
+        expected = self.last_rowid
+        self.last_rowid = last_rowid
+        try:
+            saved = self.store.put_percentile_sketches(changed, last_rowid, expected)
+        except Exception as e:
+            print(f"Percentile sketches not saved: {e}")
+            saved = False
+        if not saved:
+            # 他のプロセスが先に保存した。次回の確認で読み込み直す
+            self._loaded = False
+
+    def get_stats(self) -> Dict:
+        """
+        統計を取得
+
+        Returns:
+            lookups/fallbacks/ingested_matches/ingested_scores/sketches/last_rowid/current_patch
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats['sketches'] = len(self._sketches)
+        stats['last_rowid'] = self.last_rowid
+        stats['current_patch'] = self.current_patch
+        return stats
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def get_default_percentile_index() -> PercentileIndex:
+    """プロセス共有のパーセンタイル分布を取得（試合データ永続ストアがあれば取り込み元に使う）"""
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = PercentileIndex(get_default_store())
+        return _default_index
@@ -10,7 +10,12 @@ import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from riot_client import RiotAPIClient
-from utils import get_player_stats, calculate_performance_score
+from utils import get_record_stats
+from scoring import calculate_performance_scores
+from records import extract_match_record
+from player_aggregates import get_default_player_aggregates, match_entry
+from laning import calculate_laning_metrics_batch
+from percentiles import patch_of
 
 
 class handler(BaseHTTPRequestHandler):
@@ -25,6 +30,10 @@ class handler(BaseHTTPRequestHandler):
             region = data.get('region', 'jp1')
             routing = data.get('routing', 'asia')
             match_count = data.get('match_count', 10)
+            # Trueなら試合を取得せず、集計済みの通算・直近の成績だけを返す
+            lifetime_only = bool(data.get('lifetime_only', False))
+            # Trueならタイムラインを取得してレーン戦分析を加える
+            include_laning = bool(data.get('include_laning', False))
             
             if not riot_id:
                 self.send_error_response({'error': 'Riot IDが必要です'}, 400)
@@ -46,6 +55,23 @@ class handler(BaseHTTPRequestHandler):
                 return
             
             puuid = account['puuid']
+            aggregates = get_default_player_aggregates()
+            
+            if lifetime_only:
+                aggregate = aggregates.get(puuid)
+                if aggregate is None:
+                    self.send_error_response({'error': '集計済みの試合データがありません'}, 404)
+                    return
+                self.send_success_response({
+                    'player_info': {
+                        'riot_id': riot_id,
+                        'puuid': puuid,
+                        'region': region
+                    },
+                    'lifetime_stats': aggregate.summary(),
+                    'windowed_stats': aggregate.summary(window=match_count)['recent_form']
+                })
+                return
             
             # 最近の試合IDを取得（ランク・ノーマルのみ）
             recent_matches = riot_client.get_match_history(puuid, count=match_count, queue_filter=True)
@@ -58,34 +84,56 @@ class handler(BaseHTTPRequestHandler):
             performance_trends = []
             total_scores = []
             
-            for match_id in recent_matches[:match_count]:
+            failed_matches = []
+            
+            # 試合詳細を並列取得（入力順で返る）
+            # 各ワーカーで軽量レコードに変換し、試合JSON全体はすぐ解放する
+            # Summoner's Riftのランク・ノーマルゲームのみ対象
+            # 420: ランクソロ, 440: ランクフレックス, 400: ノーマルドラフト, 430: ノーマルブラインド
+            valid_queues = [420, 440, 400, 430]
+            analyzed = []
+            for result in riot_client.get_match_details_bulk(recent_matches[:match_count], transform=extract_match_record):
+                match_id = result['match_id']
+                match = result['match_data']
+                if result['error']:
+                    failed_matches.append({'match_id': match_id, 'error': result['error']})
+                    continue
                 try:
-                    match_data = riot_client.get_match_detail(match_id)
-                    if not match_data:
-                        continue
-                    
                     # ゲームモードチェック（ランク・ノーマルのみ対象）
-                    game_info = match_data.get('info', {})
-                    queue_id = game_info.get('queueId', 0)
-                    
-                    # Summoner's Riftのランク・ノーマルゲームのみ対象
-                    # 420: ランクソロ, 440: ランクフレックス, 400: ノーマルドラフト, 430: ノーマルブラインド
-                    valid_queues = [420, 440, 400, 430]
+                    queue_id = match.queue_id or 0
                     if queue_id not in valid_queues:
                         continue
                     
                     # プレイヤー統計取得
-                    player_stats = get_player_stats(match_data, puuid)
-                    if not player_stats:
+                    player = match.find_participant(puuid)
+                    if not player:
                         continue
-                    
-                    # ゲームモード名を取得
-                    queue_names = {
-                        420: "ランクソロ",
-                        440: "ランクフレックス", 
-                        400: "ノーマルドラフト",
-                        430: "ノーマルブラインド"
-                    }
+                    analyzed.append((match_id, match, queue_id, player))
+                except Exception as e:
+                    failed_matches.append({'match_id': match_id, 'error': str(e)})
+            
+            # 全試合のパフォーマンススコアをまとめて計算
+            scores = calculate_performance_scores([player for _, _, _, player in analyzed],
+                                                  [patch_of(match.game_version) for _, match, _, _ in analyzed])
+            
+            # レーン戦分析（全試合のタイムラインを並列取得し、まとめて計算）
+            laning_results = [None] * len(analyzed)
+            if include_laning and analyzed:
+                timelines = riot_client.get_match_timelines([match_id for match_id, _, _, _ in analyzed])
+                laning_results = calculate_laning_metrics_batch(
+                    [(timeline, match) for timeline, (_, match, _, _) in zip(timelines, analyzed)])
+            
+            # ゲームモード名を取得
+            queue_names = {
+                420: "ランクソロ",
+                440: "ランクフレックス", 
+                400: "ノーマルドラフト",
+                430: "ノーマルブラインド"
+            }
+            
+            for (match_id, match, queue_id, player), score, laning in zip(analyzed, scores, laning_results):
+                try:
+                    player_stats = get_record_stats(player, score)
                     
                     # 試合分析データ構築
                     match_analysis = {
@@ -97,9 +145,11 @@ class handler(BaseHTTPRequestHandler):
                         'kda': f"{player_stats.get('kills', 0)}/{player_stats.get('deaths', 0)}/{player_stats.get('assists', 0)}",
                         'game_duration': player_stats.get('game_duration', 0),
                         'performance_analysis': player_stats.get('performance_analysis', {}),
-                        'game_creation': match_data.get('info', {}).get('gameCreation', 0),
+                        'game_creation': match.game_creation or 0,
                         'queue_type': queue_names.get(queue_id, f"Queue {queue_id}")
                     }
+                    if include_laning:
+                        match_analysis['laning'] = laning_player_summary(laning, player.puuid)
                     
                     match_analyses.append(match_analysis)
                     
@@ -115,7 +165,7 @@ class handler(BaseHTTPRequestHandler):
                         })
                     
                 except Exception as e:
-                    print(f"Error processing match {match_id}: {e}")
+                    failed_matches.append({'match_id': match_id, 'error': str(e)})
                     continue
             
             if not match_analyses:
@@ -125,6 +175,18 @@ class handler(BaseHTTPRequestHandler):
             # 総合統計計算
             overall_stats = calculate_overall_performance_stats(match_analyses)
             
+            # 今回の試合をプレイヤー集計に加え、通算の成績を返す（集計済みの試合は数えない）
+            lifetime_stats = None
+            try:
+                aggregates.record(puuid, [
+                    match_entry(match_id, match, player, score)
+                    for (match_id, match, _, player), score in zip(analyzed, scores)
+                ])
+                aggregate = aggregates.get(puuid)
+                lifetime_stats = aggregate.summary() if aggregate else None
+            except Exception as e:
+                print(f"Player aggregates not updated: {e}")
+            
             # 成功レスポンス
             self.send_success_response({
                 'player_info': {
@@ -133,11 +195,14 @@ class handler(BaseHTTPRequestHandler):
                     'region': region
                 },
                 'overall_stats': overall_stats,
+                'lifetime_stats': lifetime_stats,
+                'laning_summary': calculate_laning_summary(match_analyses) if include_laning else None,
                 'match_analyses': match_analyses,
                 'performance_trends': performance_trends,
                 'analysis_metadata': {
                     'total_matches_analyzed': len(match_analyses),
                     'requested_matches': match_count,
+                    'failed_matches': failed_matches,
                     'analysis_date': int(__import__('time').time() * 1000)  # 現在のタイムスタンプ（ミリ秒）
                 }
             })
@@ -246,4 +311,32 @@ def calculate_overall_performance_stats(match_analyses):
                 'avg_score': calculate_avg(total_scores[-5:]) if total_scores else 0
             }
         }
-    }
\ No newline at end of file
+    }
+
+
+def laning_player_summary(laning, puuid):
+    """試合のレーン戦分析から対象プレイヤーの分を取り出す"""
+    if not laning:
+        return None
+    for player in laning['players']:
+        if player['puuid'] == puuid:
+            return player
+    return None
+
+
+def calculate_laning_summary(match_analyses):
+    """全試合のレーン戦分析の平均（10分/15分の対面との差、最初のアイテム完成の目安時刻）"""
+    def calculate_avg(values):
+        return round(sum(values) / len(values), 1) if values else None
+    
+    players = [match['laning'] for match in match_analyses if match.get('laning')]
+    summary = {'matches': len(players)}
+    for checkpoint in ('at_10', 'at_15'):
+        values = [player[checkpoint] for player in players if player.get(checkpoint)]
+        summary[checkpoint] = {
+            name: calculate_avg([value[name] for value in values])
+            for name in ('gold_diff', 'xp_diff', 'cs_diff')
+        }
+    summary['first_item_minute'] = calculate_avg(
+        [player['first_item_minute'] for player in players if player.get('first_item_minute') is not None])
+    return summary
@@ -0,0 +1,392 @@
+"""
+プレイヤー集計 - 試合ごとのスコアをPUUID単位の累計（件数・合計・分散）に加えていき、
+通算・直近の成績を試合を取り直さずに返す
+"""
+import bisect
+import copy
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+try:
+    from match_store import MatchStore, get_default_store
+    from percentiles import patch_of
+    from records import extract_match_record
+    from scoring import calculate_performance_scores
+except ImportError:
+    from api.match_store import MatchStore, get_default_store
+    from api.percentiles import patch_of
+    from api.records import extract_match_record
+    from api.scoring import calculate_performance_scores
+
+
+# 直近の成績として保持する試合数
+RECENT_FORM_SIZE = 20
+
+# 集計の対象にするキュー（ランクソロ・ランクフレックス・ノーマルドラフト・ノーマルブラインド）
+AGGREGATE_QUEUES = (420, 440, 400, 430)
+
+# 保存済みの試合を取り込みに行く間隔（秒）と、1回に取り込む最大試合数
+REFRESH_INTERVAL = 30
+REFRESH_BATCH = 50
+
+# ストアがない場合に、二重に数えないようプレイヤーごとに覚えておく試合IDの数
+# （試合IDの差分同期が保持する件数と同じ。それより古い試合は取得されない）
+MAX_SEEN_MATCHES = 1000
+
+# 累計する評価項目（total_score と performance_analysis.breakdown のキー）
+SCORE_FIELDS = ('total_score', 'farming_score', 'combat_score', 'vision_score', 'objective_score', 'gold_efficiency')
+
+
+def match_entry(match_id: str, match, player, performance: Dict) -> Dict:
+    """
+    1試合分の集計項目を作成
+
+    Args:
+        match_id: マッチID
+        match: 試合レコード
+        player: 参加者レコード
+        performance: calculate_performance_score の結果
+
+    Returns:
+        {match_id, game_creation, queue_id, champion, win, scores: {評価項目: 値}}
+    """
+    breakdown = performance.get('breakdown', {})
+    scores = {name: performance.get(name, 0) if name == 'total_score' else breakdown.get(name, 0)
+              for name in SCORE_FIELDS}
+    return {
+        'match_id': match_id,
+        'game_creation': match.game_creation or 0,
+        'queue_id': match.queue_id or 0,
+        'champion': player.champion or 'Unknown',
+        'win': bool(player.win),
+        'scores': scores,
+    }
+
+
+def _rate(wins: int, games: int) -> float:
+    return round(wins / games * 100, 1) if games else 0
+
+
+class PlayerAggregate:
+    """
+    1プレイヤー分の集計
+
+    評価項目ごとにWelford法で件数・平均・偏差平方和を更新し、チャンピオン別・キュー別に
+    試合数・勝利数・スコア合計を持つ。直近RECENT_FORM_SIZE試合は開始時刻の順に保持する。
+    1試合の追加は保持する試合数によらず一定の手間で済む
+    """
+
+    __slots__ = ('games', 'wins', 'scores', 'best', 'champions', 'queues', 'recent', 'first_game', 'last_game')
+
+    def __init__(self):
+        self.games = 0
+        self.wins = 0
+        # {評価項目: [件数, 平均, 偏差平方和]}
+        self.scores = {name: [0, 0.0, 0.0] for name in SCORE_FIELDS}
+        # 最高スコアの試合 {match_id, total_score}
+        self.best = None
+        # {チャンピオン名 / キューID: [試合数, 勝利数, スコア合計]}
+        self.champions: Dict[str, List] = {}
+        self.queues: Dict[str, List] = {}
+        # [game_creation, match_id, win, {評価項目: 値}] の古い順
+        self.recent: List[List] = []
+        self.first_game = 0
+        self.last_game = 0
+
+    def add(self, entry: Dict):
+        """
+        1試合分の集計項目を加える
+
+        Args:
+            entry: match_entry の結果
+        """
+        win = entry['win']
+        scores = entry['scores']
+        total = scores['total_score']
+        self.games += 1
+        self.wins += int(win)
+        for name in SCORE_FIELDS:
+            stat = self.scores[name]
+            stat[0] += 1
+            delta = scores[name] - stat[1]
+            stat[1] += delta / stat[0]
+            stat[2] += delta * (scores[name] - stat[1])
+        if self.best is None or total > self.best['total_score']:
+            self.best = {'match_id': entry['match_id'], 'total_score': total}
+        for rollups, key in ((self.champions, entry['champion']), (self.queues, str(entry['queue_id']))):
+            rollup = rollups.setdefault(key, [0, 0, 0.0])
+            rollup[0] += 1
+            rollup[1] += int(win)
+            rollup[2] += total
+
+        creation = entry['game_creation']
+        if not self.first_game or creation < self.first_game:
+            self.first_game = creation
+        self.last_game = max(self.last_game, creation)
+        # 取得順は新しい順とは限らないため、開始時刻の位置に差し込む
+        if len(self.recent) < RECENT_FORM_SIZE or creation > self.recent[0][0]:
+            index = bisect.bisect_right([game[0] for game in self.recent], creation)
+            self.recent.insert(index, [creation, entry['match_id'], win, scores])
+            if len(self.recent) > RECENT_FORM_SIZE:
+                self.recent.pop(0)
+
+    def to_dict(self) -> Dict:
+        """保存用の辞書に変換"""
+        return {
+            'games': self.games, 'wins': self.wins, 'scores': self.scores, 'best': self.best,
+            'champions': self.champions, 'queues': self.queues, 'recent': self.recent,
+            'first_game': self.first_game, 'last_game': self.last_game,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict]) -> "PlayerAggregate":
+        """保存した辞書から復元（Noneなら空の集計）"""
+        aggregate = cls()
+        if data:
+            for name in cls.__slots__:
+                if name in data:
+                    setattr(aggregate, name, data[name])
+        return aggregate
+
+    def summary(self, window: Optional[int] = None) -> Dict:
+        """
+        通算・直近の成績
+
+        Args:
+            window: 直近の成績に使う試合数（最大RECENT_FORM_SIZE、省略時は保持しているすべて）
+
+        Returns:
+            calculate_overall_performance_stats に標準偏差・キュー別・直近の勝率を加えた形式
+        """
+        def rollup_stats(rollups):
+            return {key: {'games': games, 'wins': wins, 'win_rate': _rate(wins, games),
+                          'avg_score': round(score_sum / games, 1) if games else 0}
+                    for key, (games, wins, score_sum) in rollups.items()}
+
+        recent = self.recent[-window:] if window else self.recent
+        recent_scores = [game[3]['total_score'] for game in recent]
+        recent_wins = sum(1 for game in recent if game[2])
+        return {
+            'total_matches': self.games,
+            'win_rate': _rate(self.wins, self.games),
+            'average_scores': {name: round(stat[1], 1) for name, stat in self.scores.items()},
+            'score_stddev': {name: round(math.sqrt(stat[2] / (stat[0] - 1)), 1) if stat[0] > 1 else 0
+                             for name, stat in self.scores.items()},
+            'best_performance': dict(self.best) if self.best else {'match_id': None, 'total_score': 0},
+            'champion_performance': rollup_stats(self.champions),
+            'queue_performance': rollup_stats(self.queues),
+            'recent_form': {
+                'games': len(recent),
+                'scores': recent_scores,
+                'wins': recent_wins,
+                'win_rate': _rate(recent_wins, len(recent)),
+                'avg_score': round(sum(recent_scores) / len(recent_scores), 1) if recent_scores else 0,
+                'average_scores': {
+                    name: round(sum(game[3][name] for game in recent) / len(recent), 1) if recent else 0
+                    for name in SCORE_FIELDS
+                },
+            },
+            'first_game_creation': self.first_game,
+            'last_game_creation': self.last_game,
+        }
+
+
+def _apply(data: Optional[Dict], entries: List[Dict]) -> Dict:
+    """保存済みの集計に新しい試合を加える"""
+    aggregate = PlayerAggregate.from_dict(data)
+    for entry in entries:
+        aggregate.add(entry)
+    return aggregate.to_dict()
+
+
+def participant_entries(matches: List[Dict]) -> Dict[str, List[Dict]]:
+    """
+    試合の全参加者の集計項目を作成（パフォーマンススコアはまとめて1回だけ計算する）
+
+    Args:
+        matches: 試合詳細情報のリスト
+
+    Returns:
+        {PUUID: match_entry の結果のリスト}（対象外のキューの試合は含めない）
+    """
+    rows = []
+    for match_data in matches:
+        match = extract_match_record(match_data)
+        if (match.queue_id or 0) not in AGGREGATE_QUEUES:
+            continue
+        patch = patch_of(match.game_version)
+        rows.extend((match, player, patch) for player in match.participants if player.puuid)
+    scores = calculate_performance_scores([player for _, player, _ in rows], [patch for _, _, patch in rows])
+    entries: Dict[str, List[Dict]] = {}
+    for (match, player, _), score in zip(rows, scores):
+        entries.setdefault(player.puuid, []).append(match_entry(match.match_id, match, player, score))
+    return entries
+
+
+class PlayerAggregates:
+    """
+    PUUIDごとのプレイヤー集計
+
+    ストアがあれば集計済みの試合IDと集計をSQLiteに保存し、同じ試合を二重に数えない。
+    ストアに保存された試合は行番号の順に全参加者の分を取り込む（取り込み済みの行番号もストアに保存する）。
+    ストアがなければメモリ上に保持し、プレイヤーごとに直近MAX_SEEN_MATCHES件の試合IDで重複を除く
+    """
+
+    def __init__(self, store: Optional[MatchStore] = None, max_players: int = 10000,
+                 refresh_interval: float = REFRESH_INTERVAL, refresh_batch: int = REFRESH_BATCH):
+        """
+        初期化
+
+        Args:
+            store: 集計を読み書きするストア（Noneならメモリ上のみ）
+            max_players: メモリ上に保持するプレイヤー数の上限（ストアがない場合）
+            refresh_interval: ストアの新しい試合を確認する間隔（秒）
+            refresh_batch: 1回に取り込む最大試合数
+        """
+        self.store = store
+        self.max_players = max_players
+        self.refresh_interval = refresh_interval
+        self.refresh_batch = refresh_batch
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._checked_at = float('-inf')
+        self.last_rowid = 0
+        # {PUUID: (集計, {集計済みの試合ID: None}（古い順）)}
+        self._players: "OrderedDict[str, tuple]" = OrderedDict()
+        self.stats = {'reads': 0, 'ingested_matches': 0, 'duplicate_matches': 0}
+
+    def record(self, puuid: str, entries: List[Dict]) -> int:
+        """
+        試合をプレイヤーの集計に加える（集計済みの試合は無視する）
+
+        Args:
+            puuid: プレイヤーUUID
+            entries: match_entry の結果のリスト
+
+        Returns:
+            新しく加えた試合数
+        """
+        if not entries:
+            return 0
+        return self.record_many({puuid: entries})
+
+    def record_many(self, entries: Dict[str, List[Dict]]) -> int:
+        """
+        複数プレイヤーの試合をまとめて集計に加える（ストアがあれば1つのトランザクションで保存する）
+
+        Args:
+            entries: {PUUID: match_entry の結果のリスト}
+
+        Returns:
+            新しく加えた試合数の合計
+        """
+        if self.store is not None:
+            added = sum(self.store.update_player_aggregates(entries, _apply, time.time()).values())
+        else:
+            added = 0
+            with self._lock:
+                for puuid, player_entries in entries.items():
+                    aggregate, seen = self._players.pop(puuid, (None, None))
+                    if aggregate is None:
+                        aggregate, seen = PlayerAggregate(), OrderedDict()
+                    for entry in player_entries:
+                        if entry['match_id'] in seen:
+                            continue
+                        seen[entry['match_id']] = None
+                        aggregate.add(entry)
+                        added += 1
+                    while len(seen) > MAX_SEEN_MATCHES:
+                        seen.popitem(last=False)
+                    self._players[puuid] = (aggregate, seen)
+                while len(self._players) > self.max_players:
+                    self._players.popitem(last=False)
+        with self._lock:
+            self.stats['ingested_matches'] += added
+            self.stats['duplicate_matches'] += sum(len(player_entries) for player_entries in entries.values()) - added
+        return added
+
+    def refresh(self, force: bool = False) -> int:
+        """
+        ストアに新しく保存された試合の全参加者を集計に加える（前回の確認から間隔が空いた場合のみ）
+
+        他のスレッドが取り込み中なら待たずに戻る
+
+        Args:
+            force: 間隔に関係なく確認し、取り込み中なら終わるまで待つ
+
+        Returns:
+            取り込んだ試合数
+        """
+        if self.store is None:
+            return 0
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.refresh_interval:
+            return 0
+        if not self._refresh_lock.acquire(blocking=force):
+            return 0
+        try:
+            self._checked_at = now
+            # 他のプロセスが先に進めていればそこから続ける
+            expected = self.store.get_player_aggregate_watermark()
+            rows = self.store.get_matches_after(expected, self.refresh_batch)
+            self.last_rowid = expected
+            if not rows:
+                return 0
+            self.record_many(participant_entries([match_data for _, match_data in rows]))
+            # 同じ行を他のプロセスと同時に取り込んでも、集計済みの試合IDで二重には数えない
+            if self.store.put_player_aggregate_watermark(rows[-1][0], expected):
+                self.last_rowid = rows[-1][0]
+            return len(rows)
+        except Exception as e:
+            # 取り込めなくても集計済みの分で応答する
+            print(f"Player aggregates refresh failed: {e}")
+            return 0
+        finally:
+            self._refresh_lock.release()
+
+    def get(self, puuid: str) -> Optional[PlayerAggregate]:
+        """
+        プレイヤーの集計を取得
+
+        Args:
+            puuid: プレイヤーUUID
+
+        Returns:
+            PlayerAggregate（未集計ならNone。ストアがない場合は呼び出し時点のコピー）
+        """
+        with self._lock:
+            self.stats['reads'] += 1
+            if self.store is None:
+                aggregate = self._players.get(puuid, (None, None))[0]
+                return copy.deepcopy(aggregate) if aggregate is not None else None
+        self.refresh()
+        data = self.store.get_player_aggregate(puuid)
+        return PlayerAggregate.from_dict(data) if data else None
+
+    def get_stats(self) -> Dict:
+        """
+        統計を取得
+
+        Returns:
+            reads/ingested_matches/duplicate_matches/last_rowid
+        """
+        with self._lock:
+            stats = dict(self.stats)
+        stats['last_rowid'] = self.last_rowid
+        return stats
+
+
+_default_aggregates = None
+_default_aggregates_lock = threading.Lock()
+
+
+def get_default_player_aggregates() -> PlayerAggregates:
+    """プロセス共有のプレイヤー集計を取得（試合データ永続ストアがあれば保存先に使う）"""
+    global _default_aggregates
+    with _default_aggregates_lock:
+        if _default_aggregates is None:
+            _default_aggregates = PlayerAggregates(get_default_store())
+        return _default_aggregates
@@ -0,0 +1,302 @@
+"""
+Riot APIレートリミッター - レスポンスヘッダーに基づくアプリ/メソッド単位の事前制御
+"""
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+
+# メソッド（エンドポイント）の識別ルール
+_METHOD_PATTERNS = [
+    (re.compile(r'^/riot/account/v1/accounts/by-riot-id/'), 'account-v1:by-riot-id'),
+    (re.compile(r'^/lol/summoner/v4/summoners/by-puuid/'), 'summoner-v4:by-puuid'),
+    (re.compile(r'^/lol/league/v4/entries/by-summoner/'), 'league-v4:by-summoner'),
+    (re.compile(r'^/lol/league/v4/entries/by-puuid/'), 'league-v4:by-puuid'),
+    (re.compile(r'^/lol/match/v5/matches/by-puuid/[^/]+/ids'), 'match-v5:ids-by-puuid'),
+    (re.compile(r'^/lol/match/v5/matches/[^/]+/timeline'), 'match-v5:timeline'),
+    (re.compile(r'^/lol/match/v5/matches/[^/]+$'), 'match-v5:match'),
+    (re.compile(r'^/lol/spectator/v5/active-games/by-summoner/'), 'spectator-v5:active-games'),
+    (re.compile(r'^/lol/champion-mastery/v4/champion-masteries/by-puuid/'), 'champion-mastery-v4:by-puuid'),
+]
+_API_PATTERN = re.compile(r'^/(?:lol|riot)/([a-z-]+)/(v\d+)/')
+
+# 最初のレスポンスを受け取るまで使うアプリ上限（開発キーの既定値）
+DEFAULT_APP_RATE_LIMIT = os.environ.get('RIOT_APP_RATE_LIMIT', '20:1,100:120')
+
+
+def get_method_name(url: str) -> str:
+    """
+    URLからレート制限の単位となるメソッド名を取得
+
+    Args:
+        url: リクエストURL
+
+    Returns:
+        メソッド名（例: match-v5:match）
+    """
+    path = urlsplit(url).path
+    for pattern, name in _METHOD_PATTERNS:
+        if pattern.search(path):
+            return name
+    match = _API_PATTERN.search(path)
+    if match:
+        return f"{match.group(1)}-{match.group(2)}"
+    return 'unknown'
+
+
+def parse_rate_limit_header(value: Optional[str]) -> List[Tuple[int, int]]:
+    """
+    "20:1,100:120" 形式のヘッダーを (値, 秒数) のリストに変換
+
+    Args:
+        value: ヘッダー値
+
+    Returns:
+        (上限 or 使用数, ウィンドウ秒数) のリスト
+    """
+    pairs = []
+    if not value:
+        return pairs
+    for part in value.split(','):
+        try:
+            amount, window = part.strip().split(':')
+            pairs.append((int(amount), int(window)))
+        except ValueError:
+            continue
+    return pairs
+
+
+class _Bucket:
+    """1つのレート制限対象（アプリ or メソッド）のウィンドウ群"""
+
+    def __init__(self, limits: Optional[List[Tuple[int, int]]] = None):
+        # {ウィンドウ秒数: {'limit', 'count', 'reset_at'}}
+        self.windows: Dict[int, Dict] = {}
+        self.blocked_until = 0.0
+        if limits:
+            self.set_limits(limits)
+
+    def set_limits(self, limits: List[Tuple[int, int]]):
+        # ヘッダーに含まれないウィンドウ（初期値など）は破棄する
+        windows = {}
+        for limit, window in limits:
+            state = self.windows.get(window) or {'limit': limit, 'count': 0, 'reset_at': 0.0}
+            state['limit'] = limit
+            windows[window] = state
+        self.windows = windows
+
+    def sync_counts(self, counts: List[Tuple[int, int]], now: float):
+        for count, window in counts:
+            state = self.windows.get(window)
+            if state is None:
+                continue
+            if now >= state['reset_at']:
+                state['reset_at'] = now + window
+                state['count'] = 0
+            state['count'] = max(state['count'], count)
+
+    @staticmethod
+    def _effective_limit(state: Dict, reserve: float) -> int:
+        # reserve: 各ウィンドウの上限のうち、この呼び出しでは使わずに残す割合
+        return max(1, state['limit'] - int(state['limit'] * reserve))
+
+    def wait_time(self, now: float, reserve: float = 0.0) -> float:
+        wait = max(self.blocked_until - now, 0.0)
+        for state in self.windows.values():
+            if now < state['reset_at'] and state['count'] >= self._effective_limit(state, reserve):
+                wait = max(wait, state['reset_at'] - now)
+        return wait
+
+    def headroom(self, now: float, reserve: float = 0.0) -> float:
+        if now < self.blocked_until:
+            return 0
+        remaining = float('inf')
+        for state in self.windows.values():
+            count = state['count'] if now < state['reset_at'] else 0
+            remaining = min(remaining, max(self._effective_limit(state, reserve) - count, 0))
+        return remaining
+
+    def consume(self, now: float):
+        for window, state in self.windows.items():
+            if now >= state['reset_at']:
+                state['reset_at'] = now + window
+                state['count'] = 0
+            state['count'] += 1
+
+
+class RateLimiter:
+    """
+    Riot APIのレート制限を事前に守るリミッター
+
+    リージョンホストごとにアプリ上限、ホスト×メソッドごとにメソッド上限を持ち、
+    X-App-Rate-Limit / X-Method-Rate-Limit（および -Count）ヘッダーで同期する。
+    上限に達しているウィンドウがあれば、リクエストを送る前にリセットまで待つ。
+    上限はAPIキーごとに別なので、複数キーを使う場合はkey（キーのラベル）で区別する。
+    """
+
+    def __init__(self, default_app_limit: str = DEFAULT_APP_RATE_LIMIT):
+        self.default_app_limits = parse_rate_limit_header(default_app_limit)
+        self._lock = threading.Lock()
+        self._buckets: Dict[Tuple[str, str], _Bucket] = {}
+        self.stats = {'acquired': 0, 'delayed': 0, 'total_wait': 0.0, 'rejected': 0, 'rate_limited': 0}
+
+    def _keys(self, url: str, key: Optional[str] = None) -> Tuple[Tuple[str, str], Tuple[str, str]]:
+        host = urlsplit(url).hostname or ''
+        scope = host if key is None else f"{key}@{host}"
+        return (scope, 'app'), (scope, get_method_name(url))
+
+    def _bucket(self, key: Tuple[str, str]) -> _Bucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            limits = self.default_app_limits if key[1] == 'app' else None
+            bucket = self._buckets[key] = _Bucket(limits)
+        return bucket
+
+    def try_acquire(self, url: str, reserve: float = 0.0, key: Optional[str] = None) -> float:
+        """
+        待たずに送信枠の確保を試みる（asyncio版クライアント・スケジューラー用）
+
+        Args:
+            url: リクエストURL
+            reserve: 各ウィンドウの上限のうち使わずに残す割合（優先度の高いリクエスト用）
+            key: APIキーのラベル
+
+        Returns:
+            確保できた場合0、できない場合は空くまでの秒数
+        """
+        app_key, method_key = self._keys(url, key)
+        with self._lock:
+            now = time.monotonic()
+            buckets = (self._bucket(app_key), self._bucket(method_key))
+            wait = max(bucket.wait_time(now, reserve) for bucket in buckets)
+            if wait > 0:
+                return wait
+            for bucket in buckets:
+                bucket.consume(now)
+            self.stats['acquired'] += 1
+            return 0.0
+
+    def record_wait(self, waited: float = 0.0, rejected: bool = False):
+        """待機・中止の統計を記録"""
+        with self._lock:
+            if rejected:
+                self.stats['rejected'] += 1
+            elif waited > 0:
+                self.stats['delayed'] += 1
+                self.stats['total_wait'] += waited
+
+    def headroom(self, url: str, reserve: float = 0.0, key: Optional[str] = None) -> float:
+        """
+        今すぐ送信できる残り回数（アプリ・メソッドの全ウィンドウの最小値）
+
+        Args:
+            url: リクエストURL
+            reserve: 各ウィンドウの上限のうち使わずに残す割合
+            key: APIキーのラベル
+
+        Returns:
+            残り回数（上限が未知ならinf）
+        """
+        app_key, method_key = self._keys(url, key)
+        with self._lock:
+            now = time.monotonic()
+            return min(self._bucket(app_key).headroom(now, reserve), self._bucket(method_key).headroom(now, reserve))
+
+    def acquire(self, url: str, max_wait: Optional[float] = None, key: Optional[str] = None) -> bool:
+        """
+        リクエスト送信枠を確保（必要ならウィンドウのリセットまで待機）
+
+        Args:
+            url: リクエストURL
+            max_wait: 待機時間の上限（秒）。超える場合は待たずにFalseを返す
+            key: APIキーのラベル
+
+        Returns:
+            送信してよい場合True
+        """
+        waited = 0.0
+        while True:
+            wait = self.try_acquire(url, key=key)
+            if wait <= 0:
+                self.record_wait(waited)
+                return True
+            if max_wait is not None and waited + wait > max_wait:
+                self.record_wait(rejected=True)
+                return False
+            time.sleep(wait)
+            waited += wait
+
+    def update(self, url: str, headers, key: Optional[str] = None) -> None:
+        """
+        レスポンスヘッダーから上限と使用数を同期
+
+        Args:
+            url: リクエストURL
+            headers: レスポンスヘッダー
+            key: APIキーのラベル
+        """
+        app_key, method_key = self._keys(url, key)
+        with self._lock:
+            now = time.monotonic()
+            for bucket_key, prefix in ((app_key, 'X-App-Rate-Limit'), (method_key, 'X-Method-Rate-Limit')):
+                limits = parse_rate_limit_header(headers.get(prefix))
+                if not limits:
+                    continue
+                bucket = self._bucket(bucket_key)
+                bucket.set_limits(limits)
+                bucket.sync_counts(parse_rate_limit_header(headers.get(f'{prefix}-Count')), now)
+
+    def on_rate_limited(self, url: str, headers, key: Optional[str] = None) -> float:
+        """
+        429応答を受けたバケットをRetry-Afterの間ブロック
+
+        Args:
+            url: リクエストURL
+            headers: レスポンスヘッダー
+            key: APIキーのラベル
+
+        Returns:
+            ブロックする秒数
+        """
+        try:
+            retry_after = float(headers.get('Retry-After', 1))
+        except (TypeError, ValueError):
+            retry_after = 1.0
+        limit_type = (headers.get('X-Rate-Limit-Type') or '').lower()
+        app_key, method_key = self._keys(url, key)
+        self.update(url, headers, key)
+        with self._lock:
+            self.stats['rate_limited'] += 1
+            bucket_key = app_key if limit_type == 'application' else method_key
+            bucket = self._bucket(bucket_key)
+            bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + retry_after)
+        return retry_after
+
+    def get_status(self) -> Dict:
+        """
+        バケットごとの上限・使用数を取得
+
+        Returns:
+            {ホスト（キー指定時は "キー@ホスト"）: {バケット名: {ウィンドウ秒数: {limit, count, headroom}}}}
+        """
+        status: Dict = {}
+        with self._lock:
+            now = time.monotonic()
+            for (host, name), bucket in self._buckets.items():
+                windows = {}
+                for window, state in bucket.windows.items():
+                    count = state['count'] if now < state['reset_at'] else 0
+                    windows[str(window)] = {
+                        'limit': state['limit'],
+                        'count': count,
+                        'headroom': max(state['limit'] - count, 0)
+                    }
+                status.setdefault(host, {})[name] = windows
+        return status
+
+
+# プロセス内で共有するリミッター
+default_limiter = RateLimiter()
@@ -0,0 +1,364 @@
+"""
+試合データの軽量レコード - match-v5のJSONから使う項目だけを1回の走査で抜き出す
+"""
+from typing import Dict, Optional
+
+
+class ParticipantRecord:
+    """
+    参加者1人分の統計（__slots__による省メモリ版）
+
+    get_player_stats が返す辞書と同じキー名で get() できるため、
+    calculate_performance_score などにそのまま渡せる。
+    """
+
+    __slots__ = (
+        'puuid', 'riot_id_game_name', 'riot_id_tagline',
+        'champion', 'champion_id', 'champion_level',
+        'kills', 'deaths', 'assists', 'win', 'placement', 'position',
+        'minions_killed', 'neutral_minions_killed',
+        'gold', 'gold_spent',
+        'total_damage_dealt', 'total_damage_to_champions', 'physical_damage_to_champions',
+        'magic_damage_to_champions', 'true_damage_to_champions', 'total_damage_taken',
+        'damage_self_mitigated',
+        'vision_score', 'wards_placed', 'wards_killed', 'control_wards_purchased',
+        'items', 'primary_style', 'primary_perks', 'secondary_style', 'secondary_perks',
+        'stat_offense', 'stat_flex', 'stat_defense', 'spell1', 'spell2',
+        'largest_killing_spree', 'largest_multi_kill',
+        'double_kills', 'triple_kills', 'quadra_kills', 'penta_kills',
+        'first_blood_kill', 'first_blood_assist', 'first_tower_kill', 'first_tower_assist',
+        'turret_kills', 'inhibitor_kills', 'dragon_kills', 'baron_kills',
+        'team_id', 'raw_game_duration',
+    )
+
+    @classmethod
+    def from_participant(cls, participant: Dict, game_duration: Optional[int]) -> "ParticipantRecord":
+        """
+        match-v5の参加者データからレコードを作成
+
+        Args:
+            participant: info.participants の1要素
+            game_duration: info.gameDuration（秒）
+
+        Returns:
+            参加者レコード
+        """
+        p = participant.get
+        record = cls.__new__(cls)
+        record.puuid = p("puuid")
+        record.riot_id_game_name = p("riotIdGameName", "Unknown")
+        record.riot_id_tagline = p("riotIdTagline", "NA1")
+        record.champion = p("championName")
+        record.champion_id = p("championId")
+        record.champion_level = p("champLevel")
+        record.kills = p("kills")
+        record.deaths = p("deaths")
+        record.assists = p("assists")
+        record.win = p("win")
+        record.placement = p("placement")
+        record.position = p("teamPosition")
+        record.minions_killed = p("totalMinionsKilled", 0)
+        record.neutral_minions_killed = p("neutralMinionsKilled", 0)
+        record.gold = p("goldEarned")
+        record.gold_spent = p("goldSpent", 0)
+        record.total_damage_dealt = p("totalDamageDealt", 0)
+        record.total_damage_to_champions = p("totalDamageDealtToChampions", 0)
+        record.physical_damage_to_champions = p("physicalDamageDealtToChampions", 0)
+        record.magic_damage_to_champions = p("magicDamageDealtToChampions", 0)
+        record.true_damage_to_champions = p("trueDamageDealtToChampions", 0)
+        record.total_damage_taken = p("totalDamageTaken", 0)
+        record.damage_self_mitigated = p("damageSelfMitigated", 0)
+        record.vision_score = p("visionScore", 0)
+        record.wards_placed = p("wardsPlaced", 0)
+        record.wards_killed = p("wardsKilled", 0)
+        record.control_wards_purchased = p("visionWardsBoughtInGame", 0)
+        record.items = tuple(item for item in (p(f"item{i}", 0) for i in range(7)) if item > 0)
+
+        perks = p("perks", {})
+        styles = perks.get("styles") or []
+        primary_style = styles[0] if styles else {}
+        secondary_style = styles[1] if len(styles) > 1 else {}
+        stat_perks = perks.get("statPerks", {})
+        record.primary_style = primary_style.get("style")
+        record.primary_perks = tuple(perk.get("perk") for perk in primary_style.get("selections", []))
+        record.secondary_style = secondary_style.get("style")
+        record.secondary_perks = tuple(perk.get("perk") for perk in secondary_style.get("selections", []))
+        record.stat_offense = stat_perks.get("offense")
+        record.stat_flex = stat_perks.get("flex")
+        record.stat_defense = stat_perks.get("defense")
+
+        record.spell1 = p("summoner1Id")
+        record.spell2 = p("summoner2Id")
+        record.largest_killing_spree = p("largestKillingSpree", 0)
+        record.largest_multi_kill = p("largestMultiKill", 0)
+        record.double_kills = p("doubleKills", 0)
+        record.triple_kills = p("tripleKills", 0)
+        record.quadra_kills = p("quadraKills", 0)
+        record.penta_kills = p("pentaKills", 0)
+        record.first_blood_kill = p("firstBloodKill", False)
+        record.first_blood_assist = p("firstBloodAssist", False)
+        record.first_tower_kill = p("firstTowerKill", False)
+        record.first_tower_assist = p("firstTowerAssist", False)
+        record.turret_kills = p("turretKills", 0)
+        record.inhibitor_kills = p("inhibitorKills", 0)
+        record.dragon_kills = p("dragonKills", 0)
+        record.baron_kills = p("baronKills", 0)
+        record.team_id = p("teamId")
+        record.raw_game_duration = game_duration
+        return record
+
+    def get(self, key: str, default=None):
+        """辞書と同じ形で項目を取得（スコア計算関数との互換用）"""
+        return getattr(self, key, default)
+
+    @property
+    def game_duration(self) -> int:
+        """試合時間（秒）。不明な場合は1800"""
+        return self.raw_game_duration if self.raw_game_duration is not None else 1800
+
+    @property
+    def _minutes(self) -> float:
+        duration = self.raw_game_duration if self.raw_game_duration is not None else 1
+        return max(duration / 60, 1)
+
+    @property
+    def kda(self) -> float:
+        kills = self.kills or 0
+        deaths = self.deaths or 0
+        assists = self.assists or 0
+        if deaths == 0:
+            return float(kills + assists)
+        return round((kills + assists) / deaths, 2)
+
+    @property
+    def cs(self) -> int:
+        return self.minions_killed + self.neutral_minions_killed
+
+    @property
+    def cs_per_minute(self) -> float:
+        return round(self.cs / self._minutes, 1)
+
+    @property
+    def gold_per_minute(self) -> float:
+        return round((self.gold or 0) / self._minutes, 1)
+
+    @property
+    def damage_per_minute(self) -> float:
+        return round(self.total_damage_to_champions / self._minutes, 1)
+
+    @property
+    def team_position(self) -> Optional[str]:
+        return self.position
+
+    def to_stats(self) -> Dict:
+        """
+        get_player_stats と同じ形式の辞書に変換（performance_analysisは含まない）
+
+        Returns:
+            プレイヤーの詳細統計情報
+        """
+        return {
+            # 基本情報
+            "champion": self.champion,
+            "champion_id": self.champion_id,
+            "champion_level": self.champion_level,
+            "kills": self.kills,
+            "deaths": self.deaths,
+            "assists": self.assists,
+            "kda": self.kda,
+            "win": self.win,
+            "placement": self.placement,  # Arenaモードの順位
+            "position": self.position,
+
+            # ファーム関連
+            "cs": self.cs,
+            "minions_killed": self.minions_killed,
+            "neutral_minions_killed": self.neutral_minions_killed,
+            "cs_per_minute": self.cs_per_minute,
+
+            # 経済
+            "gold": self.gold,
+            "gold_per_minute": self.gold_per_minute,
+            "gold_spent": self.gold_spent,
+
+            # ダメージ統計
+            "damage": {
+                "total_damage_dealt": self.total_damage_dealt,
+                "total_damage_to_champions": self.total_damage_to_champions,
+                "physical_damage_to_champions": self.physical_damage_to_champions,
+                "magic_damage_to_champions": self.magic_damage_to_champions,
+                "true_damage_to_champions": self.true_damage_to_champions,
+                "total_damage_taken": self.total_damage_taken,
+                "damage_self_mitigated": self.damage_self_mitigated
+            },
+            "damage_per_minute": self.damage_per_minute,
+
+            # ビジョン統計
+            "vision": {
+                "vision_score": self.vision_score,
+                "wards_placed": self.wards_placed,
+                "wards_killed": self.wards_killed,
+                "control_wards_purchased": self.control_wards_purchased
+            },
+
+            # アイテム
+            "items": list(self.items),
+
+            # ルーン
+            "runes": {
+                "primary_style": self.primary_style,
+                "primary_perks": list(self.primary_perks),
+                "secondary_style": self.secondary_style,
+                "secondary_perks": list(self.secondary_perks),
+                "stat_perks": {
+                    "offense": self.stat_offense,
+                    "flex": self.stat_flex,
+                    "defense": self.stat_defense
+                }
+            },
+
+            # サモナースペル
+            "summoner_spells": {
+                "spell1": self.spell1,
+                "spell2": self.spell2
+            },
+
+            # その他統計
+            "largest_killing_spree": self.largest_killing_spree,
+            "largest_multi_kill": self.largest_multi_kill,
+            "double_kills": self.double_kills,
+            "triple_kills": self.triple_kills,
+            "quadra_kills": self.quadra_kills,
+            "penta_kills": self.penta_kills,
+            "first_blood_kill": self.first_blood_kill,
+            "first_blood_assist": self.first_blood_assist,
+            "first_tower_kill": self.first_tower_kill,
+            "first_tower_assist": self.first_tower_assist,
+
+            # オブジェクト関連
+            "turret_kills": self.turret_kills,
+            "inhibitor_kills": self.inhibitor_kills,
+            "dragon_kills": self.dragon_kills,
+            "baron_kills": self.baron_kills,
+
+            # チーム情報
+            "team_id": self.team_id,
+            "team_position": self.position,
+
+            # ゲーム時間（パフォーマンス計算用）
+            "game_duration": self.game_duration
+        }
+
+
+def team_summary(team: Dict) -> Dict:
+    """
+    info.teams の1要素をチーム統計に変換
+
+    Args:
+        team: チームデータ
+
+    Returns:
+        チーム統計
+    """
+    objectives = team.get("objectives", {})
+    return {
+        "team_id": team.get("teamId"),
+        "win": team.get("win", False),
+        "bans": [ban.get("championId") for ban in team.get("bans", [])],
+        "objectives": {
+            "baron": objectives.get("baron", {}).get("kills", 0),
+            "dragon": objectives.get("dragon", {}).get("kills", 0),
+            "riftHerald": objectives.get("riftHerald", {}).get("kills", 0),
+            "tower": objectives.get("tower", {}).get("kills", 0),
+            "inhibitor": objectives.get("inhibitor", {}).get("kills", 0)
+        }
+    }
+
+
+class MatchRecord:
+    """試合1件分の要約と参加者レコード（__slots__による省メモリ版）"""
+
+    __slots__ = (
+        'match_id', 'game_creation', 'game_duration', 'game_end_timestamp',
+        'game_mode', 'game_type', 'game_version', 'map_id', 'platform_id',
+        'queue_id', 'tournament_code', 'teams', 'participants',
+        'participant_index', 'team_rows',
+    )
+
+    def find_participant(self, puuid: str) -> Optional[ParticipantRecord]:
+        """PUUIDから参加者レコードを取得"""
+        index = self.participant_index.get(puuid)
+        return self.participants[index] if index is not None else None
+
+    def detailed_info(self) -> Dict:
+        """
+        get_detailed_match_info と同じ形式の試合情報を取得
+
+        Returns:
+            詳細な試合情報
+        """
+        return {
+            "match_id": self.match_id,
+            "game_creation": self.game_creation,
+            "game_duration": self.game_duration,
+            "game_end_timestamp": self.game_end_timestamp,
+            "game_mode": self.game_mode,
+            "game_type": self.game_type,
+            "game_version": self.game_version,
+            "map_id": self.map_id,
+            "platform_id": self.platform_id,
+            "queue_id": self.queue_id,
+            "tournament_code": self.tournament_code,
+            "teams": list(self.teams)
+        }
+
+
+def extract_match_record(match_data: Dict, with_participants: bool = True) -> MatchRecord:
+    """
+    試合データから試合レコードを作成（参加者も1回の走査で変換）
+
+    返したレコードは元のJSONを参照しないため、呼び出し後すぐに元データを解放できる。
+
+    Args:
+        match_data: 試合データ
+        with_participants: 参加者レコードも作成するか
+
+    Returns:
+        試合レコード
+    """
+    info = match_data.get("info", {})
+    record = MatchRecord()
+    record.match_id = match_data.get("metadata", {}).get("matchId")
+    record.game_creation = info.get("gameCreation")
+    record.game_duration = info.get("gameDuration")
+    record.game_end_timestamp = info.get("gameEndTimestamp")
+    record.game_mode = info.get("gameMode")
+    record.game_type = info.get("gameType")
+    record.game_version = info.get("gameVersion")
+    record.map_id = info.get("mapId")
+    record.platform_id = info.get("platformId")
+    record.queue_id = info.get("queueId")
+    record.tournament_code = info.get("tournamentCode")
+
+    teams_by_id = {team.get("teamId"): team for team in info.get("teams", [])}
+    record.teams = tuple(
+        team_summary(teams_by_id[team_id]) if team_id in teams_by_id else {}
+        for team_id in (100, 200)
+    )
+
+    # 参加者レコード・PUUID → 行番号・チームごとの行番号を1回の走査で作成する
+    participants = []
+    participant_index = {}
+    team_rows = {}
+    if with_participants:
+        duration = info.get("gameDuration")
+        for index, participant in enumerate(info.get("participants", [])):
+            participant_record = ParticipantRecord.from_participant(participant, duration)
+            participants.append(participant_record)
+            participant_index.setdefault(participant_record.puuid, index)
+            team_rows.setdefault(participant_record.team_id, []).append(index)
+    record.participants = tuple(participants)
+    record.participant_index = participant_index
+    record.team_rows = {team_id: tuple(rows) for team_id, rows in team_rows.items()}
+    return record
+
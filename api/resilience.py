@@ -0,0 +1,204 @@
+"""
+障害耐性 - ジッター付き指数バックオフとホスト単位のサーキットブレーカー
+"""
+import os
+import random
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+
+# 既定値（環境変数で上書き可能）
+DEFAULT_BACKOFF_BASE = float(os.environ.get('RIOT_RETRY_BACKOFF_BASE', 0.5))
+DEFAULT_BACKOFF_CAP = float(os.environ.get('RIOT_RETRY_BACKOFF_CAP', 8))
+DEFAULT_FAILURE_THRESHOLD = int(os.environ.get('RIOT_BREAKER_FAILURE_THRESHOLD', 5))
+DEFAULT_RECOVERY_TIMEOUT = float(os.environ.get('RIOT_BREAKER_RECOVERY_TIMEOUT', 30))
+
+
+def backoff_delay(attempt: int, base: float = DEFAULT_BACKOFF_BASE, cap: float = DEFAULT_BACKOFF_CAP) -> float:
+    """
+    フルジッター付き指数バックオフの待機時間を計算
+
+    0〜min(cap, base * 2^attempt) の一様乱数を返すため、
+    同時に失敗したリクエストが同じタイミングで再送しない。
+
+    Args:
+        attempt: 試行回数（0始まり）
+        base: 初回の待機上限（秒）
+        cap: 待機上限の最大値（秒）
+
+    Returns:
+        待機秒数
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def is_retryable_status(status: int) -> bool:
+    """再試行すべきサーバーエラーか判定（5xx）"""
+    return 500 <= status < 600
+
+
+class CircuitBreaker:
+    """
+    1ホスト分のサーキットブレーカー
+
+    closed: 通常どおり送信。連続失敗がしきい値に達するとopenへ
+    open: recovery_timeoutの間は送信せず即座に失敗させる。経過後half_openへ
+    half_open: 1件だけ試験的に送信し、成功すればclosed、失敗すれば再びopen
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 recovery_timeout: float = DEFAULT_RECOVERY_TIMEOUT):
+        """
+        初期化
+
+        Args:
+            failure_threshold: openにする連続失敗回数
+            recovery_timeout: openから試験送信までの秒数
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_started_at = 0.0
+        self.stats = {'successes': 0, 'failures': 0, 'rejected': 0, 'opened': 0}
+
+    def allow(self) -> bool:
+        """
+        送信してよいか判定
+
+        Returns:
+            送信可能ならTrue（openまたは試験送信中ならFalse）
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == self.OPEN:
+                if now - self._opened_at < self.recovery_timeout:
+                    self.stats['rejected'] += 1
+                    return False
+                self.state = self.HALF_OPEN
+                self._probe_started_at = now
+                return True
+            # half_open: 試験送信は1件のみ（結果が返らないまま時間切れなら次を許可）
+            if now - self._probe_started_at < self.recovery_timeout:
+                self.stats['rejected'] += 1
+                return False
+            self._probe_started_at = now
+            return True
+
+    def record_success(self):
+        """送信成功を記録（ホストが応答した場合は404/429も成功扱い）"""
+        with self._lock:
+            self.stats['successes'] += 1
+            self.consecutive_failures = 0
+            if self.state != self.CLOSED:
+                self.state = self.CLOSED
+
+    def record_failure(self):
+        """送信失敗（接続エラー・タイムアウト・5xx）を記録"""
+        with self._lock:
+            self.stats['failures'] += 1
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or (
+                    self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self.stats['opened'] += 1
+
+    def get_status(self) -> Dict:
+        """
+        状態を取得
+
+        Returns:
+            state/consecutive_failures/retry_in/統計
+        """
+        with self._lock:
+            retry_in = 0.0
+            if self.state == self.OPEN:
+                retry_in = max(0.0, self.recovery_timeout - (time.monotonic() - self._opened_at))
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'retry_in': round(retry_in, 3),
+                **self.stats,
+            }
+
+
+class CircuitBreakerRegistry:
+    """
+    ホスト（jp1.api.riotgames.com, asia.api.riotgames.comなど）ごとのブレーカー
+
+    リージョン/ルーティングホストの片方が不調でも、もう片方への送信は止めない
+    """
+
+    def __init__(self, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 recovery_timeout: float = DEFAULT_RECOVERY_TIMEOUT):
+        """
+        初期化
+
+        Args:
+            failure_threshold: openにする連続失敗回数
+            recovery_timeout: openから試験送信までの秒数
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._lock = threading.Lock()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, url: str) -> CircuitBreaker:
+        """URLのホストに対応するブレーカーを取得"""
+        host = urlsplit(url).netloc
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.get(host)
+                if breaker is None:
+                    breaker = CircuitBreaker(self.failure_threshold, self.recovery_timeout)
+                    self._breakers[host] = breaker
+        return breaker
+
+    def allow(self, url: str) -> bool:
+        """URLのホストへ送信してよいか判定"""
+        return self.get(url).allow()
+
+    def record_success(self, url: str):
+        """URLのホストへの送信成功を記録"""
+        self.get(url).record_success()
+
+    def record_failure(self, url: str):
+        """URLのホストへの送信失敗を記録"""
+        breaker = self.get(url)
+        was_open = breaker.state == CircuitBreaker.OPEN
+        breaker.record_failure()
+        if not was_open and breaker.state == CircuitBreaker.OPEN:
+            print(f"Circuit breaker opened: {urlsplit(url).netloc} "
+                  f"({breaker.recovery_timeout}秒間送信を停止)")
+
+    def get_status(self, host: Optional[str] = None) -> Dict:
+        """
+        ブレーカーの状態を取得
+
+        Args:
+            host: ホスト名（省略時は全ホスト）
+
+        Returns:
+            {ホスト: 状態}
+        """
+        with self._lock:
+            breakers = dict(self._breakers)
+        if host is not None:
+            breakers = {host: breakers[host]} if host in breakers else {}
+        return {name: breaker.get_status() for name, breaker in breakers.items()}
+
+
+# プロセス内で共有するブレーカー
+default_breakers = CircuitBreakerRegistry()
@@ -0,0 +1,166 @@
+"""
+レスポンスキャッシュ - エンドポイント別TTLとバイト数上限付きLRU
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+try:
+    from rate_limiter import get_method_name
+    from match_store import DEFAULT_DB_PATH
+except ImportError:
+    from api.rate_limiter import get_method_name
+    from api.match_store import DEFAULT_DB_PATH
+
+
+# エンドポイント別のTTL（秒）。Noneは無期限（内容が変わらないデータ）、0はキャッシュしない
+DEFAULT_TTL_POLICY = {
+    'match-v5:match': None,                # 終了した試合は不変
+    'match-v5:timeline': 0,                # 約1MBあるため、変換した軽量版を試合データ永続ストアに保存する
+    # PUUID・サモナーIDはAPIプロジェクトごとに暗号化されるため、URLだけをキーにするこのキャッシュには置かない
+    # （プロジェクト・プラットフォーム別の解決結果はidentity_cacheが保持する）
+    'account-v1:by-riot-id': 0,
+    'summoner-v4:by-puuid': 0,
+    'champion-mastery-v4:by-puuid': 600,
+    'league-v4:by-summoner': 120,          # ランクは試合後にしか変わらない
+    'league-v4:by-puuid': 120,
+    'match-v5:ids-by-puuid': 60,
+    'spectator-v5:active-games': 15,
+}
+
+# 試合データ永続ストアが有効な場合に上書きするTTL。試合詳細はストアから読むため、
+# メモリに未変換の試合JSONを重ねて持たない（同時リクエストの合流はsingle_flightが行う）
+STORE_BACKED_TTL_POLICY = {
+    'match-v5:match': 0,
+}
+
+# 保持するデコード済みレスポンスの推定メモリ量の上限
+DEFAULT_MAX_BYTES = int(os.environ.get('RIOT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+# デコード済みのdict/listが使うメモリと、レスポンス本文の長さの比（試合JSONの実測でおよそ2.5〜4倍）
+DECODED_SIZE_FACTOR = 3
+
+
+class ResponseCache:
+    """
+    デコード済みレスポンスのLRUキャッシュ
+
+    キーはリクエストURL。TTLはURLから判定したエンドポイントごとに決まり、
+    保持データの推定メモリ量（レスポンス本文の長さ×DECODED_SIZE_FACTOR）の合計が
+    上限を超えると最も古く使われたものから破棄する。
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, ttl_policy: Optional[Dict[str, Optional[float]]] = None,
+                 default_ttl: Optional[float] = 0):
+        """
+        初期化
+
+        Args:
+            max_bytes: 保持するデータの推定メモリ量の上限（バイト）
+            ttl_policy: {メソッド名: TTL秒}（省略時はDEFAULT_TTL_POLICY）
+            default_ttl: ポリシーにないエンドポイントのTTL（0はキャッシュしない）
+        """
+        self.max_bytes = max_bytes
+        self.ttl_policy = dict(DEFAULT_TTL_POLICY if ttl_policy is None else ttl_policy)
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        # {URL: (値, 推定メモリ量, 期限)}
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+
+    def get_ttl(self, url: str) -> Optional[float]:
+        """URLに適用されるTTLを取得"""
+        return self.ttl_policy.get(get_method_name(url), self.default_ttl)
+
+    def get(self, url: str) -> Optional[Any]:
+        """
+        キャッシュから取得
+
+        Args:
+            url: リクエストURL
+
+        Returns:
+            有効なキャッシュがあればその値、なければNone
+        """
+        if self.get_ttl(url) == 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            value, size, expires_at = entry
+            if expires_at is not None and time.monotonic() >= expires_at:
+                del self._entries[url]
+                self._bytes -= size
+                self.stats['expirations'] += 1
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(url)
+            self.stats['hits'] += 1
+            return value
+
+    def put(self, url: str, value: Any, size: int) -> bool:
+        """
+        キャッシュに保存（TTLが0のエンドポイントや上限を超える値は保存しない）
+
+        Args:
+            url: リクエストURL
+            value: デコード済みレスポンス
+            size: レスポンス本文のバイト数
+
+        Returns:
+            保存した場合True
+        """
+        ttl = self.get_ttl(url)
+        size = int(size * DECODED_SIZE_FACTOR)
+        if ttl == 0 or value is None or size > self.max_bytes:
+            return False
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            old = self._entries.pop(url, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[url] = (value, size, expires_at)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.stats['evictions'] += 1
+        return True
+
+    def invalidate(self, url: str):
+        """指定URLのキャッシュを破棄"""
+        with self._lock:
+            entry = self._entries.pop(url, None)
+            if entry is not None:
+                self._bytes -= entry[1]
+
+    def clear(self):
+        """全キャッシュを破棄"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_stats(self) -> Dict:
+        """
+        キャッシュ統計を取得
+
+        Returns:
+            hits/misses/evictions/expirations/hit_ratio/entries/bytes/max_bytes
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            lookups = stats['hits'] + stats['misses']
+            stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+            stats['max_bytes'] = self.max_bytes
+        return stats
+
+
+# プロセス内で共有するキャッシュ
+default_cache = ResponseCache(ttl_policy={**DEFAULT_TTL_POLICY, **STORE_BACKED_TTL_POLICY} if DEFAULT_DB_PATH else None)
@@ -1,16 +1,56 @@
 """
 Riot Games API Client - Vercel Serverless Functions用
 """
-import requests
 import time
-from typing import Dict, List, Optional
-import os
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import requests
+
+try:
+    from http_pool import DEFAULT_CONNECT_TIMEOUT
+    from rate_limiter import RateLimiter, default_limiter
+    from concurrency import iter_concurrent, map_concurrent
+    from single_flight import default_flight
+    from response_cache import ResponseCache, default_cache
+    from match_store import MatchStore, get_default_store
+    from match_sync import MatchIdSync, get_default_match_sync
+    from identity_cache import IdentityCache, get_default_identity_cache
+    from timeline import MatchTimeline, parse_timeline
+    from resilience import CircuitBreakerRegistry, default_breakers, backoff_delay, is_retryable_status
+    from deadline import Deadline, DeadlineExceeded
+    from key_pool import ApiKey, KeyPool
+    from scheduler import RequestScheduler, default_scheduler, get_request_context, PRIORITY_INTERACTIVE
+    from client_metrics import ClientMetrics, default_metrics
+    from transport import Transport, get_default_transport
+except ImportError:
+    from api.http_pool import DEFAULT_CONNECT_TIMEOUT
+    from api.rate_limiter import RateLimiter, default_limiter
+    from api.concurrency import iter_concurrent, map_concurrent
+    from api.single_flight import default_flight
+    from api.response_cache import ResponseCache, default_cache
+    from api.match_store import MatchStore, get_default_store
+    from api.match_sync import MatchIdSync, get_default_match_sync
+    from api.identity_cache import IdentityCache, get_default_identity_cache
+    from api.timeline import MatchTimeline, parse_timeline
+    from api.resilience import CircuitBreakerRegistry, default_breakers, backoff_delay, is_retryable_status
+    from api.deadline import Deadline, DeadlineExceeded
+    from api.key_pool import ApiKey, KeyPool
+    from api.scheduler import RequestScheduler, default_scheduler, get_request_context, PRIORITY_INTERACTIVE
+    from api.client_metrics import ClientMetrics, default_metrics
+    from api.transport import Transport, get_default_transport
 
 
 class RiotAPIClient:
     """Riot Games APIクライアント"""
     
-    def __init__(self, api_key: Optional[str] = None, region: str = "jp1", routing: str = "asia"):
+    def __init__(self, api_key: Optional[str] = None, region: str = "jp1", routing: str = "asia",
+                 rate_limiter: Optional[RateLimiter] = None, cache: Optional[ResponseCache] = None,
+                 match_store: Optional[MatchStore] = None, breakers: Optional[CircuitBreakerRegistry] = None,
+                 connect_timeout: float = DEFAULT_CONNECT_TIMEOUT, read_timeout: float = 5,
+                 deadline: Optional[Deadline] = None, scheduler: Optional[RequestScheduler] = None,
+                 priority: str = PRIORITY_INTERACTIVE,
+                 api_keys: Optional[List[str]] = None, metrics: Optional[ClientMetrics] = None,
+                 transport: Optional[Transport] = None, identities: Optional[IdentityCache] = None):
         """
         初期化
         
@@ -18,17 +58,73 @@ class RiotAPIClient:
             api_key: Riot Games APIキー
             region: リージョン (jp1, kr, na1, euw1, etc.)
             routing: ルーティング (asia, americas, europe, sea)
+            rate_limiter: レートリミッター（省略時はプロセス共有のもの）
+            cache: レスポンスキャッシュ（省略時はプロセス共有のもの）
+            match_store: 試合データ永続ストア（省略時はプロセス共有のもの）
+            breakers: ホスト別サーキットブレーカー（省略時はプロセス共有のもの）
+            connect_timeout: 接続タイムアウト（秒）
+            read_timeout: 読み取りタイムアウト（秒）
+            deadline: リクエスト全体の期限（指定時は待機・タイムアウトを残り時間内に収める）
+            scheduler: リクエストスケジューラー（省略時はプロセス共有のもの）
+            priority: 既定の優先度クラス（request_contextで上書き可能）
+            api_keys: 分散して使うAPIキーのリスト（api_keyともに省略時はRIOT_API_KEYS / RIOT_API_KEY）
+            metrics: 送信結果の集計（省略時はプロセス共有のもの）
+            transport: 送信に使うトランスポート（省略時はRIOT_TRANSPORT_RECORD / RIOT_TRANSPORT_REPLAYに従う）
+            identities: Riot ID・サモナーIDの解決結果のキャッシュ（省略時はプロセス共有のもの）
         """
-        self.api_key = api_key or os.environ.get("RIOT_API_KEY")
         self.region = region
         self.routing = routing
         self.base_url = f"https://{region}.api.riotgames.com"
         self.routing_url = f"https://{routing}.api.riotgames.com"
+        self.rate_limiter = rate_limiter or default_limiter
+        self.single_flight = default_flight
+        self.cache = cache or default_cache
+        self.match_store = match_store or get_default_store()
+        # 試合IDの同期状態（ストアを明示しなければプロセス内で共有する）
+        self.match_sync = MatchIdSync(match_store) if match_store else get_default_match_sync()
+        self.identities = identities or get_default_identity_cache()
+        self.breakers = breakers or default_breakers
+        self.metrics = metrics or default_metrics
+        self.transport = transport or get_default_transport()
+        # キーを明示しなければ環境変数のキープールをプロセス内で共有する
+        key_pool = KeyPool(api_keys or [api_key]) if (api_keys or api_key) else None
+        if scheduler is None:
+            if key_pool is None and self.rate_limiter is default_limiter:
+                scheduler = default_scheduler
+            else:
+                scheduler = RequestScheduler(self.rate_limiter, key_pool=key_pool)
+        self.scheduler = scheduler
+        self.key_pool = scheduler.key_pool
+        self.api_key = self.key_pool.primary_key()
         self.headers = {
             "X-Riot-Token": self.api_key
         }
+        self.priority = priority
+        self.timeout = (connect_timeout, read_timeout)
+        self.deadline = deadline
+        # Vercelの実行時間制限があるため、レート制限の待機は最大2秒まで
+        self.max_rate_limit_wait = 2
+        # 再試行の待機も短く抑える
+        self.backoff_base = 0.25
+        self.backoff_cap = 1.0
         
     def _make_request(self, url: str, retries: int = 2) -> Optional[Dict]:
+        """
+        APIリクエストを実行（キャッシュを優先し、同一URLへの同時リクエストは1回の上流呼び出しにまとめる）
+        
+        Args:
+            url: リクエストURL
+            retries: リトライ回数
+            
+        Returns:
+            レスポンスJSON（合流した呼び出し元間で共有されるため変更しないこと）
+        """
+        cached = self.cache.get(url)
+        if cached is not None:
+            return cached
+        return self.single_flight.do(url, lambda: self._fetch(url, retries))
+    
+    def _fetch(self, url: str, retries: int = 2) -> Optional[Dict]:
         """
         APIリクエストを実行（Vercel用に最適化）
         
@@ -40,28 +136,121 @@ class RiotAPIClient:
             レスポンスJSON
         """
         for attempt in range(retries):
+            # 時間予算を使い切っていれば送信しない
+            if self._deadline_expired():
+                print(f"Deadline: 時間予算を使い切ったため送信しません - {url}")
+                return None
+            # 不調なホストへは送信せず即座に失敗させる
+            if not self.breakers.allow(url):
+                print(f"Circuit open: ホストの回復待ちのため送信しません - {url}")
+                return None
+            # 優先度クラス順に送信枠を確保（上限まで待っても順番が来なければ中止）
+            max_wait = self._clamp(self.max_rate_limit_wait)
+            priority, user = get_request_context()
+            ticket = self.scheduler.acquire(url, priority or self.priority, user, max_wait=max_wait)
+            if ticket is None:
+                print(f"Rate limit: {max_wait:.2f}秒以内に送信枠が空かないため中止 - {url}")
+                return None
+            api_key = ticket.api_key
+            error = None
+            started = time.monotonic()
             try:
-                response = requests.get(url, headers=self.headers, timeout=5)
-                
-                if response.status_code == 200:
-                    return response.json()
-                elif response.status_code == 429:  # Rate limit
-                    retry_after = min(int(response.headers.get("Retry-After", 1)), 2)
-                    time.sleep(retry_after)
+                response = self.transport.get(url, headers=self._headers_for(api_key), timeout=self._request_timeout())
+            except requests.RequestException as e:
+                error = e
+            finally:
+                self.scheduler.release(ticket)
+            self.metrics.observe(url, 'error' if error is not None else response.status_code, time.monotonic() - started)
+            if error is not None:
+                # 期限に合わせて短くしたタイムアウトはホストの不調として数えない
+                if not self._deadline_expired():
+                    self.breakers.record_failure(url)
+                print(f"Request error: {error}")
+                if self._backoff(attempt, retries):
+                    self.metrics.record_retry(url, 'error')
                     continue
-                elif response.status_code == 404:
-                    return None
-                else:
-                    print(f"Error: {response.status_code} - {response.text}")
-                    return None
-            except Exception as e:
-                print(f"Request error: {e}")
-                if attempt < retries - 1:
-                    time.sleep(0.5)
+                return None
+            key = api_key.label if api_key is not None else None
+            self.rate_limiter.update(url, response.headers, key)
+            
+            if is_retryable_status(response.status_code):
+                self.breakers.record_failure(url)
+                print(f"Error: {response.status_code} - {response.text}")
+                if self._backoff(attempt, retries):
+                    self.metrics.record_retry(url, '5xx')
+                    continue
+                return None
+            # ホストは応答している（404/429も含む）
+            self.breakers.record_success(url)
+            
+            if response.status_code in (401, 403):
+                # キーの失効・取り消し。ほかに使えるキーがあれば差し替えて再試行
+                print(f"Error: {response.status_code} - {response.text}")
+                self.key_pool.record_auth_failure(api_key, response.status_code)
+                if api_key is not None and any(k is not api_key for k in self.key_pool.active_keys()):
+                    self.metrics.record_retry(url, 'auth')
                     continue
                 return None
+            self.key_pool.record_success(api_key)
+            
+            if response.status_code == 200:
+                try:
+                    data = response.json()
+                except ValueError as e:
+                    print(f"Invalid JSON: {e}")
+                    return None
+                self.cache.put(url, data, len(response.content))
+                return data
+            elif response.status_code == 429:  # Rate limit
+                self.rate_limiter.on_rate_limited(url, response.headers, key)
+                self.metrics.record_retry(url, '429')
+                continue
+            elif response.status_code == 404:
+                return None
+            else:
+                print(f"Error: {response.status_code} - {response.text}")
+                return None
         return None
     
+    def _headers_for(self, api_key: Optional[ApiKey]) -> Dict:
+        """割り当てられたキーのリクエストヘッダー"""
+        if api_key is None:
+            return self.headers
+        return {"X-Riot-Token": api_key.key}
+    
+    def _backoff(self, attempt: int, retries: int) -> bool:
+        """
+        再試行が残っていればジッター付き指数バックオフで待機
+        
+        Args:
+            attempt: 現在の試行回数（0始まり）
+            retries: リトライ回数
+            
+        Returns:
+            再試行する場合True
+        """
+        if attempt >= retries - 1:
+            return False
+        delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap)
+        if self.deadline is not None and delay >= self.deadline.usable():
+            return False
+        time.sleep(delay)
+        return True
+    
+    def _deadline_expired(self) -> bool:
+        """期限が設定されていて、残り時間を使い切ったか判定"""
+        return self.deadline is not None and self.deadline.expired()
+    
+    def _clamp(self, seconds: float) -> float:
+        """待機時間・タイムアウトを期限の残り時間以内に収める"""
+        if self.deadline is None:
+            return seconds
+        return max(0.0, self.deadline.clamp(seconds))
+    
+    def _request_timeout(self) -> tuple:
+        """(接続, 読み取り) タイムアウトを期限の残り時間以内に収める（0はrequestsが受け付けないため下限あり）"""
+        return tuple(max(0.05, self._clamp(t)) for t in self.timeout)
+    
     def get_account_by_riot_id(self, game_name: str, tag_line: str) -> Optional[Dict]:
         """
         Riot ID (game_name#tag_line) からアカウント情報を取得
@@ -71,10 +260,16 @@ class RiotAPIClient:
             tag_line: タグライン
             
         Returns:
-            アカウント情報
+            アカウント情報（解決済みのRiot IDはAPIを呼ばずに返す）
         """
+        account = self.identities.get_account(game_name, tag_line, self.key_pool.project_label())
+        if account is not None:
+            return account
         url = f"{self.routing_url}/riot/account/v1/accounts/by-riot-id/{game_name}/{tag_line}"
-        return self._make_request(url)
+        account = self._make_request(url)
+        if account:
+            self.identities.put_account(game_name, tag_line, account, self.key_pool.project_label())
+        return account
     
     def get_summoner_by_puuid(self, puuid: str) -> Optional[Dict]:
         """
@@ -91,11 +286,35 @@ class RiotAPIClient:
         # デバッグ: レスポンスキーを確認
         if result:
             print(f"Summoner API Response keys: {result.keys()}")
+            self.identities.put_summoner(result, self.region, self.key_pool.project_label())
         return result
     
+    def get_summoner_id(self, puuid: str) -> Optional[str]:
+        """
+        PUUIDからサモナーID（暗号化されたサモナーID）を取得
+        
+        Args:
+            puuid: プレイヤーUUID
+            
+        Returns:
+            サモナーID（解決済みならAPIを呼ばない）
+        """
+        summoner_id = self.identities.get_summoner_id(puuid, self.region, self.key_pool.project_label())
+        if summoner_id is None:
+            summoner = self.get_summoner_by_puuid(puuid)
+            summoner_id = summoner.get('id') if summoner else None
+        return summoner_id
+    
+    # queue_filter=True で対象にするキュー
+    # 420: ランクソロ, 440: ランクフレックス, 400: ノーマルドラフト, 430: ノーマルブラインド
+    HISTORY_QUEUES = (420, 440, 400, 430)
+    
     def get_match_history(self, puuid: str, count: int = 20, queue_filter: bool = True) -> Optional[List[str]]:
         """
-        マッチ履歴のIDリストを取得
+        マッチ履歴のIDリストを取得（新しい順）
+        
+        取得済みの試合IDをプレイヤーごとに保持し、2回目以降は前回以降の試合IDだけを
+        startTimeで取得する
         
         Args:
             puuid: プレイヤーUUID
@@ -105,15 +324,35 @@ class RiotAPIClient:
         Returns:
             マッチIDのリスト
         """
-        if queue_filter:
-            # ランク・ノーマルのみ取得（多めに取得してフィルタリング）
-            # 420: ランクソロ, 440: ランクフレックス, 400: ノーマルドラフト, 430: ノーマルブラインド
-            queue_params = "&queue=420&queue=440&queue=400&queue=430"
-            url = f"{self.routing_url}/lol/match/v5/matches/by-puuid/{puuid}/ids?start=0&count={count * 2}{queue_params}"
-        else:
-            url = f"{self.routing_url}/lol/match/v5/matches/by-puuid/{puuid}/ids?start=0&count={count}"
+        queues = self.HISTORY_QUEUES if queue_filter else ()
+        return self.match_sync.recent(puuid, queues, count, self._match_id_fetcher(puuid, queues))
+    
+    def iter_match_history(self, puuid: str, queue_filter: bool = True, page_size: int = 20) -> Iterator[str]:
+        """
+        マッチ履歴のIDを新しい順に返すジェネレーター（古いページは必要になった時点で取得）
         
-        return self._make_request(url)
+        Args:
+            puuid: プレイヤーUUID
+            queue_filter: ランク・ノーマルのみに限定するか
+            page_size: 1回に取得する件数（最大100）
+            
+        Returns:
+            マッチIDのイテレーター
+        """
+        queues = self.HISTORY_QUEUES if queue_filter else ()
+        return self.match_sync.iter_match_ids(puuid, queues, self._match_id_fetcher(puuid, queues), page_size)
+    
+    def _match_id_fetcher(self, puuid: str, queues) -> Callable[[int, int, Optional[int]], Optional[List[str]]]:
+        """ids エンドポイントを start/count/startTime 指定で呼び出す関数を作成"""
+        base_url = f"{self.routing_url}/lol/match/v5/matches/by-puuid/{puuid}/ids"
+        queue_params = ''.join(f"&queue={queue}" for queue in queues)
+        
+        def fetch_page(start: int, count: int, start_time: Optional[int] = None) -> Optional[List[str]]:
+            url = f"{base_url}?start={start}&count={count}{queue_params}"
+            if start_time is not None:
+                url += f"&startTime={start_time}"
+            return self._make_request(url)
+        return fetch_page
     
     def get_match_detail(self, match_id: str) -> Optional[Dict]:
         """
@@ -126,7 +365,125 @@ class RiotAPIClient:
             試合詳細情報
         """
         url = f"{self.routing_url}/lol/match/v5/matches/{match_id}"
-        return self._make_request(url)
+        if self.match_store is None:
+            return self._make_request(url)
+        
+        # 保存済みの試合はネットワークに出ずに返す（終了した試合は不変）
+        match_data = self.match_store.get(match_id)
+        if match_data is None:
+            match_data = self._make_request(url)
+            if match_data:
+                self.match_store.put(match_data)
+        return match_data
+    
+    def get_match_timeline(self, match_id: str) -> Optional[MatchTimeline]:
+        """
+        試合のタイムラインを取得
+        
+        元のJSON（約1MB）はフレームの数値配列とイベントの表に変換してすぐ解放し、
+        変換したものを試合データ永続ストアに保存する（終了した試合は不変）
+        
+        Args:
+            match_id: マッチID
+            
+        Returns:
+            MatchTimeline（取得できなければNone）
+        """
+        if self.match_store is not None:
+            data = self.match_store.get_timeline(match_id)
+            if data is not None:
+                timeline = MatchTimeline.from_bytes(data)
+                if timeline is not None:
+                    return timeline
+        
+        url = f"{self.routing_url}/lol/match/v5/matches/{match_id}/timeline"
+        timeline_data = self._make_request(url)
+        if not timeline_data:
+            return None
+        timeline = parse_timeline(timeline_data)
+        if self.match_store is not None:
+            self.match_store.put_timeline(match_id, timeline.to_bytes())
+        return timeline
+    
+    def get_match_timelines(self, match_ids: List[str], max_workers: int = 8) -> List[Optional[MatchTimeline]]:
+        """
+        複数試合のタイムラインを並列取得（入力順で返す）
+        
+        Args:
+            match_ids: マッチIDのリスト
+            max_workers: 最大同時リクエスト数
+            
+        Returns:
+            MatchTimeline のリスト（取得できなかった試合はNone）
+        """
+        return [
+            timeline if error is None else None
+            for _, timeline, error in map_concurrent(self.get_match_timeline, match_ids, max_workers)
+        ]
+    
+    def get_match_details_bulk(self, match_ids: List[str], max_workers: int = 8,
+                               transform: Optional[Callable[[Dict], Any]] = None) -> List[Dict]:
+        """
+        複数試合の詳細情報を並列取得（入力順で返す）
+        
+        Args:
+            match_ids: マッチIDのリスト
+            max_workers: 最大同時リクエスト数
+            transform: 取得した試合データに適用する変換（ワーカー内で適用し、元のJSONはすぐ解放する）
+            
+        Returns:
+            {'match_id', 'match_data', 'error', 'deadline_exceeded'} のリスト
+            （失敗時はmatch_dataがNoneでerrorに理由。期限切れで取得しなかった場合はdeadline_exceededがTrue）
+        """
+        fetch = lambda match_id: self._fetch_match(match_id, transform)
+        return [
+            self._bulk_result(match_id, match_data, error)
+            for match_id, match_data, error in map_concurrent(fetch, match_ids, max_workers)
+        ]
+    
+    def iter_match_details(self, match_ids: List[str], max_workers: int = 8,
+                           transform: Optional[Callable[[Dict], Any]] = None) -> Iterator[Dict]:
+        """
+        複数試合の詳細情報を並列取得（取得できた順に返す）
+        
+        Args:
+            match_ids: マッチIDのリスト
+            max_workers: 最大同時リクエスト数
+            transform: 取得した試合データに適用する変換（ワーカー内で適用し、元のJSONはすぐ解放する）
+            
+        Yields:
+            {'match_id', 'match_data', 'error', 'deadline_exceeded'}
+        """
+        fetch = lambda match_id: self._fetch_match(match_id, transform)
+        for match_id, match_data, error in iter_concurrent(fetch, match_ids, max_workers):
+            yield self._bulk_result(match_id, match_data, error)
+    
+    def _fetch_match(self, match_id: str, transform: Optional[Callable[[Dict], Any]]) -> Any:
+        """試合詳細を取得し、指定があれば変換して返す"""
+        if self._deadline_expired():
+            raise DeadlineExceeded('時間予算を使い切ったため取得しませんでした')
+        match_data = self.get_match_detail(match_id)
+        if match_data is None and self._deadline_expired():
+            raise DeadlineExceeded('時間予算を使い切ったため取得できませんでした')
+        if match_data is not None and transform is not None:
+            return transform(match_data)
+        return match_data
+    
+    @staticmethod
+    def _bulk_result(match_id: str, match_data: Optional[Dict], error: Optional[Exception]) -> Dict:
+        """一括取得の1件分の結果を作成"""
+        if error is not None:
+            message = str(error)
+        elif match_data is None:
+            message = '試合データを取得できませんでした'
+        else:
+            message = None
+        return {
+            'match_id': match_id,
+            'match_data': match_data,
+            'error': message,
+            'deadline_exceeded': isinstance(error, DeadlineExceeded)
+        }
     
     def get_current_game(self, puuid: str) -> Optional[Dict]:
         """
@@ -156,7 +513,7 @@ class RiotAPIClient:
     
     def get_ranked_stats_by_puuid(self, puuid: str) -> Optional[List[Dict]]:
         """
-        PUUIDからランク情報を直接取得（新しいエンドポイント）
+        PUUIDからランク情報を直接取得（league-v4 by-puuid、サモナー情報の取得は不要）
         
         Args:
             puuid: プレイヤーUUID
@@ -164,8 +521,49 @@ class RiotAPIClient:
         Returns:
             ランク情報のリスト
         """
-        # まずサモナー情報を取得してIDを取得
-        summoner = self.get_summoner_by_puuid(puuid)
-        if summoner and 'id' in summoner:
-            return self.get_ranked_stats(summoner['id'])
-        return None
+        url = f"{self.base_url}/lol/league/v4/entries/by-puuid/{puuid}"
+        return self._make_request(url)
+    
+    def get_participants_info(self, puuids: List[str], include_summoner: bool = False,
+                              max_workers: int = 10) -> Dict[str, Dict]:
+        """
+        複数プレイヤーのランク情報（とサモナー情報）を並列取得
+        
+        キャッシュ済みのものはスレッドプールに渡さずその場で返し、残りの呼び出しを
+        プレイヤー・エンドポイントの区別なく同時に送るため、全員分がおよそ1往復で揃う
+        
+        Args:
+            puuids: プレイヤーUUIDのリスト
+            include_summoner: サモナー情報（summonerLevelなど）も取得するか
+            max_workers: 最大同時リクエスト数
+            
+        Returns:
+            {puuid: {'ranked_stats': ランク情報のリスト, 'summoner': サモナー情報}}
+            （取得できなかった項目はNone）
+        """
+        lookups = [('ranked_stats', puuid, f"{self.base_url}/lol/league/v4/entries/by-puuid/{puuid}")
+                   for puuid in puuids]
+        if include_summoner:
+            lookups += [('summoner', puuid, f"{self.base_url}/lol/summoner/v4/summoners/by-puuid/{puuid}")
+                        for puuid in puuids]
+        
+        info = {puuid: {'ranked_stats': None, 'summoner': None} for puuid in puuids}
+        pending = []
+        for lookup in lookups:
+            cached = self.cache.get(lookup[2])
+            if cached is not None:
+                info[lookup[1]][lookup[0]] = cached
+            else:
+                pending.append(lookup)
+        
+        # キャッシュは確認済みなので、同時リクエストの合流だけを通して送信する
+        fetch = lambda lookup: self.single_flight.do(lookup[2], lambda: self._fetch(lookup[2]))
+        for (kind, puuid, _), result, error in map_concurrent(fetch, pending, max_workers):
+            if error is not None:
+                print(f"Participant lookup failed ({kind}, {puuid}): {error}")
+            info[puuid][kind] = result
+        
+        for entry in info.values():
+            if entry['summoner']:
+                self.identities.put_summoner(entry['summoner'], self.region, self.key_pool.project_label())
+        return info
@@ -0,0 +1,327 @@
+"""
+リクエストスケジューラー - 共有APIキーの送信枠を優先度クラス順・ユーザー間で公平に割り当てる
+"""
+import contextvars
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+try:
+    from rate_limiter import RateLimiter, default_limiter
+    from key_pool import ApiKey, KeyPool, default_key_pool
+except ImportError:
+    from api.rate_limiter import RateLimiter, default_limiter
+    from api.key_pool import ApiKey, KeyPool, default_key_pool
+
+
+# 優先度クラス（先頭ほど優先）
+PRIORITY_INTERACTIVE = 'interactive'   # Web画面からの検索
+PRIORITY_BOT = 'bot'                   # Discordコマンド
+PRIORITY_BACKGROUND = 'background'     # 一括取得・定期更新
+PRIORITY_ORDER = (PRIORITY_INTERACTIVE, PRIORITY_BOT, PRIORITY_BACKGROUND)
+
+# クラスごとの同時実行数上限（一括取得が送信枠と接続を占有しないようにする）
+DEFAULT_CLASS_CAPS = {
+    PRIORITY_INTERACTIVE: 32,
+    PRIORITY_BOT: 16,
+    PRIORITY_BACKGROUND: 4,
+}
+
+# クラスごとに使わずに残すレート制限枠の割合。ウィンドウを使い切ると上位クラスも
+# リセットまで待つことになるため、下位クラスは上限の手前で止めて上位クラスの分を残す
+DEFAULT_CLASS_RESERVE = {
+    PRIORITY_INTERACTIVE: 0.0,
+    PRIORITY_BOT: 0.1,
+    PRIORITY_BACKGROUND: 0.3,
+}
+
+# 同時実行数の上限で割り当てられなかった場合に、try_acquireの呼び出し元が再度試すまでの秒数
+POLL_INTERVAL = 0.02
+
+# 呼び出し元の (優先度クラス, ユーザー)。スレッドプールにはconcurrencyモジュールが引き継ぐ
+_request_context: contextvars.ContextVar = contextvars.ContextVar('riot_request_context', default=(None, None))
+
+
+def get_request_context() -> Tuple[Optional[str], Optional[str]]:
+    """現在の (優先度クラス, ユーザー) を取得（未設定ならNone）"""
+    return _request_context.get()
+
+
+def set_request_context(priority: Optional[str] = None, user: Optional[str] = None) -> contextvars.Token:
+    """
+    現在のコンテキストに優先度クラスとユーザーを設定
+
+    Args:
+        priority: 優先度クラス（省略時はクライアントの既定値）
+        user: 公平に分配する単位（DiscordユーザーID、IPアドレスなど）
+
+    Returns:
+        reset_request_contextに渡すトークン
+    """
+    return _request_context.set((priority, user))
+
+
+def reset_request_context(token: contextvars.Token):
+    """set_request_contextの設定を元に戻す"""
+    _request_context.reset(token)
+
+
+@contextmanager
+def request_context(priority: Optional[str] = None, user: Optional[str] = None):
+    """
+    ブロック内のAPI呼び出しに優先度クラスとユーザーを設定
+
+    使い方:
+        with request_context(PRIORITY_BACKGROUND):
+            client.get_match_details_bulk(match_ids)
+    """
+    token = set_request_context(priority, user)
+    try:
+        yield
+    finally:
+        reset_request_context(token)
+
+
+class _Ticket:
+    """送信待ちのリクエスト1件"""
+
+    __slots__ = ('url', 'priority', 'user', 'enqueued_at', 'granted', 'api_key')
+
+    def __init__(self, url: str, priority: str, user: Optional[str]):
+        self.url = url
+        self.priority = priority
+        self.user = user
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        # 割り当てられたAPIキー（送信時にこのキーを使う）
+        self.api_key: Optional[ApiKey] = None
+
+
+class RequestScheduler:
+    """
+    優先度付きリクエストスケジューラー
+
+    送信待ちのリクエストは優先度クラスごと・ユーザーごとのキューに入り、
+    レート制限の枠が空くたびに上位クラスから順に、同じクラス内では
+    ユーザー間のラウンドロビンで割り当てる。クラスごとに同時実行数の上限と、
+    上位クラスのために残すレート制限枠の割合を持つ。
+    キープールに複数のキーがあれば、残り回数が最も多いキーを割り当てる。
+    待機者自身が割り当て処理を行うため、専用のスレッドは使わない。
+    """
+
+    def __init__(self, rate_limiter: Optional[RateLimiter] = None, caps: Optional[Dict[str, int]] = None,
+                 reserve: Optional[Dict[str, float]] = None, key_pool: Optional[KeyPool] = None):
+        """
+        初期化
+
+        Args:
+            rate_limiter: 送信枠を管理するレートリミッター（省略時はプロセス共有のもの）
+            caps: {優先度クラス: 同時実行数上限}（省略時はDEFAULT_CLASS_CAPS）
+            reserve: {優先度クラス: 上位クラス用に残すレート制限枠の割合}（省略時はDEFAULT_CLASS_RESERVE）
+            key_pool: 送信に使うAPIキーのプール（省略時はプロセス共有のもの）
+        """
+        self.rate_limiter = rate_limiter or default_limiter
+        self.key_pool = key_pool or default_key_pool
+        self.caps = dict(DEFAULT_CLASS_CAPS)
+        if caps:
+            self.caps.update(caps)
+        self.reserve = dict(DEFAULT_CLASS_RESERVE)
+        if reserve:
+            self.reserve.update(reserve)
+        self._cond = threading.Condition()
+        # {クラス: {ユーザー: deque[_Ticket]}}（OrderedDictの順がラウンドロビンの順）
+        self._queues: Dict[str, "OrderedDict[Optional[str], deque]"] = {p: OrderedDict() for p in PRIORITY_ORDER}
+        self._in_flight = {p: 0 for p in PRIORITY_ORDER}
+        self.stats = {
+            p: {'granted': 0, 'rejected': 0, 'total_wait': 0.0, 'max_wait': 0.0}
+            for p in PRIORITY_ORDER
+        }
+
+    def acquire(self, url: str, priority: str = PRIORITY_INTERACTIVE, user: Optional[str] = None,
+                max_wait: Optional[float] = None) -> Optional[_Ticket]:
+        """
+        送信枠を確保（順番が来るまで待機）
+
+        Args:
+            url: リクエストURL
+            priority: 優先度クラス
+            user: 公平に分配する単位（省略時は同じクラスの匿名ユーザーとしてまとめる）
+            max_wait: 待機時間の上限（秒）。超えたら諦めてNoneを返す
+
+        Returns:
+            送信後にreleaseへ渡すチケット（待機上限を超えた場合None）
+        """
+        ticket = self.enqueue(url, priority, user)
+        give_up_at = None if max_wait is None else ticket.enqueued_at + max_wait
+
+        with self._cond:
+            while True:
+                retry_in = self._dispatch()
+                if ticket.granted:
+                    self._record_grant(ticket)
+                    return ticket
+                timeout = retry_in
+                if give_up_at is not None:
+                    remaining = give_up_at - time.monotonic()
+                    if remaining <= 0:
+                        self._remove(ticket)
+                        self.stats[priority]['rejected'] += 1
+                        self.rate_limiter.record_wait(rejected=True)
+                        return None
+                    timeout = remaining if timeout is None else min(timeout, remaining)
+                self._cond.wait(timeout)
+
+    def enqueue(self, url: str, priority: str = PRIORITY_INTERACTIVE, user: Optional[str] = None) -> _Ticket:
+        """
+        待たずにチケットを待ち行列に入れる（asyncio版クライアント用。割り当てはtry_acquireで確認する）
+
+        Args:
+            url: リクエストURL
+            priority: 優先度クラス
+            user: 公平に分配する単位
+
+        Returns:
+            待ち行列に入れたチケット
+        """
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority class: {priority}")
+        ticket = _Ticket(url, priority, user)
+        with self._cond:
+            self._queues[priority].setdefault(user, deque()).append(ticket)
+        return ticket
+
+    def try_acquire(self, ticket: _Ticket) -> float:
+        """
+        待たずにチケットへの送信枠の割り当てを試みる
+
+        Args:
+            ticket: enqueueが返したチケット
+
+        Returns:
+            割り当てられた場合0、まだなら再度試すまでの秒数
+        """
+        with self._cond:
+            retry_in = None if ticket.granted else self._dispatch()
+            if ticket.granted:
+                self._record_grant(ticket)
+                return 0.0
+            return POLL_INTERVAL if retry_in is None else retry_in
+
+    def cancel(self, ticket: _Ticket):
+        """
+        待機をやめたチケットを取り消す（割り当て済みなら枠を返す）
+
+        Args:
+            ticket: enqueueが返したチケット
+        """
+        with self._cond:
+            if not ticket.granted:
+                self._remove(ticket)
+                return
+        self.release(ticket)
+
+    def _record_grant(self, ticket: _Ticket):
+        """割り当てたチケットの待ち時間を記録（_cond保持中に呼ぶ）"""
+        waited = time.monotonic() - ticket.enqueued_at
+        stats = self.stats[ticket.priority]
+        stats['granted'] += 1
+        stats['total_wait'] += waited
+        stats['max_wait'] = max(stats['max_wait'], waited)
+        self.rate_limiter.record_wait(waited)
+
+    def release(self, ticket: Optional[_Ticket]):
+        """
+        送信完了を通知し、同時実行数の枠を返す
+
+        Args:
+            ticket: acquireが返したチケット
+        """
+        if ticket is None or not ticket.granted:
+            return
+        with self._cond:
+            self._in_flight[ticket.priority] -= 1
+            ticket.granted = False
+            self._cond.notify_all()
+
+    def _dispatch(self) -> Optional[float]:
+        """
+        待機中のチケットに送信枠を割り当てる（_cond保持中に呼ぶ）
+
+        Returns:
+            レート制限で割り当てられなかった場合、再評価までの秒数（なければNone）
+        """
+        retry_in = None
+        granted_any = False
+        for priority in PRIORITY_ORDER:
+            queue = self._queues[priority]
+            while queue and self._in_flight[priority] < self.caps[priority]:
+                granted = False
+                for user, tickets in queue.items():
+                    wait, api_key = self.key_pool.acquire(tickets[0].url, self.rate_limiter, self.reserve[priority])
+                    if wait > 0:
+                        # このメソッド・ホストは上限に達している。同じクラスの他ユーザーを試す
+                        retry_in = wait if retry_in is None else min(retry_in, wait)
+                        continue
+                    ticket = tickets.popleft()
+                    ticket.granted = True
+                    ticket.api_key = api_key
+                    self._in_flight[priority] += 1
+                    granted = True
+                    break
+                if not granted:
+                    break
+                granted_any = True
+                # 割り当てたユーザーは次回最後に回す（ラウンドロビン）
+                if tickets:
+                    queue.move_to_end(user)
+                else:
+                    del queue[user]
+        if granted_any:
+            self._cond.notify_all()
+        return retry_in
+
+    def _remove(self, ticket: _Ticket):
+        """待機を諦めたチケットをキューから外す（_cond保持中に呼ぶ）"""
+        queue = self._queues[ticket.priority]
+        tickets = queue.get(ticket.user)
+        if tickets is None:
+            return
+        try:
+            tickets.remove(ticket)
+        except ValueError:
+            return
+        if not tickets:
+            del queue[ticket.user]
+
+    def get_stats(self) -> Dict:
+        """
+        クラスごとの待ち行列の状態を取得
+
+        Returns:
+            {クラス: {queue_depth, waiting_users, in_flight, cap, granted, rejected, avg_wait, max_wait, oldest_wait}}
+        """
+        with self._cond:
+            now = time.monotonic()
+            result = {}
+            for priority in PRIORITY_ORDER:
+                queue = self._queues[priority]
+                stats = self.stats[priority]
+                oldest = min((tickets[0].enqueued_at for tickets in queue.values()), default=None)
+                result[priority] = {
+                    'queue_depth': sum(len(tickets) for tickets in queue.values()),
+                    'waiting_users': len(queue),
+                    'in_flight': self._in_flight[priority],
+                    'cap': self.caps[priority],
+                    'granted': stats['granted'],
+                    'rejected': stats['rejected'],
+                    'avg_wait': round(stats['total_wait'] / stats['granted'], 4) if stats['granted'] else 0.0,
+                    'max_wait': round(stats['max_wait'], 4),
+                    'oldest_wait': round(now - oldest, 4) if oldest is not None else 0.0,
+                }
+        return result
+
+
+# プロセス内で共有するスケジューラー
+default_scheduler = RequestScheduler()
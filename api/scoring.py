@@ -0,0 +1,293 @@
+"""
+バッチパフォーマンススコア - 複数参加者のスコアをNumPyの配列演算でまとめて計算
+
+utils.calculate_performance_score と同じ式・同じ既定値を列ごとの配列に適用する。
+NumPyがない環境では calculate_performance_score を1件ずつ呼び出す。
+"""
+from typing import Dict, List, Optional, Sequence
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+try:
+    from utils import (calculate_performance_score, calculate_percentile_rank, calculate_total_score,
+                       get_record_stats, ROLE_CS_BENCHMARKS, DEFAULT_CS_BENCHMARK, SUPPORT_POSITIONS)
+    from records import MatchRecord
+    from percentiles import patch_of
+except ImportError:
+    from api.utils import (calculate_performance_score, calculate_percentile_rank, calculate_total_score,
+                           get_record_stats, ROLE_CS_BENCHMARKS, DEFAULT_CS_BENCHMARK, SUPPORT_POSITIONS)
+    from api.records import MatchRecord
+    from api.percentiles import patch_of
+
+
+# スコア計算に使う列: (列名, 変換関数, 項目がない場合の値)
+# 変換に失敗した行は、その列を使う評価項目がスカラー版と同じ既定値になる
+SCORE_COLUMNS = (
+    ('cs_per_minute', float, 0),
+    ('kda', float, 0),
+    ('damage_per_minute', float, 0),
+    ('kills', int, 0),
+    ('assists', int, 0),
+    ('deaths', int, 0),
+    ('vision_score', float, 0),
+    ('wards_placed', int, 0),
+    ('wards_killed', int, 0),
+    ('turret_kills', int, 0),
+    ('dragon_kills', int, 0),
+    ('baron_kills', int, 0),
+    ('gold_per_minute', float, 0),
+    ('gold', float, 0),
+    ('game_duration', float, 1800),
+)
+
+# 統計辞書ではvisionにネストしている列
+_VISION_COLUMNS = frozenset(('vision_score', 'wards_placed', 'wards_killed'))
+
+# 評価項目ごとの既定値（入力を数値に変換できない場合）
+_FALLBACK = {'farming': 10.0, 'combat': 12.0, 'vision': 10.0, 'objective': 7.5, 'gold': 10.0}
+
+# 総合スコアの重み（スカラー版と同じ順序で加算する）
+_WEIGHTS = (('farming', 0.20), ('combat', 0.25), ('vision', 0.20), ('objective', 0.15), ('gold', 0.20))
+
+# 配列に直接変換できる型（float()/int()と同じ値になる）
+_NUMERIC_TYPES = (int, float, bool)
+
+# これより少ない行数ではNumPyの呼び出しの固定費が上回るため、1件ずつ計算する
+BATCH_MIN_ROWS = 64
+
+_BREAKDOWN_KEYS = (
+    ('farming_score', 'farming'),
+    ('combat_score', 'combat'),
+    ('vision_score', 'vision'),
+    ('objective_score', 'objective'),
+    ('gold_efficiency', 'gold'),
+)
+
+
+def extract_columns(rows: Sequence) -> Dict[str, "np.ndarray"]:
+    """
+    統計辞書・参加者レコードのリストをスコア計算用の列に変換
+
+    Args:
+        rows: get_player_statsの辞書 または ParticipantRecord のリスト
+
+    Returns:
+        {列名: float64配列, 'position': object配列, 'valid': {列名: bool配列}, 'empty': bool配列}
+    """
+    n = len(rows)
+    empty = np.fromiter((not row for row in rows), dtype=bool, count=n)
+    present = [row if row else {} for row in rows]
+    sources = [row.get('vision') or row for row in present]
+
+    columns = {}
+    valid = {}
+    for name, convert, default in SCORE_COLUMNS:
+        source_rows = sources if name in _VISION_COLUMNS else present
+        raw = [row.get(name, default) for row in source_rows]
+        if all(type(value) in _NUMERIC_TYPES for value in raw):
+            # すべて数値なら配列に直接変換する（intへの変換は切り捨て、非有限値は失敗扱い）
+            values = np.array(raw, dtype=np.float64)
+            ok = np.ones(n, dtype=bool)
+            if convert is int:
+                ok = np.isfinite(values)
+                values = np.where(ok, np.trunc(values), 0.0)
+        else:
+            values = np.zeros(n)
+            ok = np.ones(n, dtype=bool)
+            for i, value in enumerate(raw):
+                try:
+                    values[i] = convert(value)
+                except (ValueError, TypeError, OverflowError):
+                    ok[i] = False
+        columns[name] = values
+        valid[name] = ok | empty
+
+    positions = np.empty(n, dtype=object)
+    for i, row in enumerate(present):
+        if row:
+            positions[i] = row.get('position', 'MID')
+    columns['position'] = positions
+    columns['valid'] = valid
+    columns['empty'] = empty
+    return columns
+
+
+def _position_lookup(positions: "np.ndarray"):
+    """ポジション列からCS基準値とサポートかどうかの配列を作成（ポジションの種類ごとに1回だけ判定）"""
+    benchmark = np.full(len(positions), DEFAULT_CS_BENCHMARK)
+    benchmark_valid = np.ones(len(positions), dtype=bool)
+    support = np.zeros(len(positions), dtype=bool)
+    for position in dict.fromkeys(positions.tolist()):
+        mask = positions == position
+        try:
+            benchmark[mask] = ROLE_CS_BENCHMARKS.get(position, DEFAULT_CS_BENCHMARK)
+        except TypeError:
+            benchmark_valid[mask] = False
+        if position in SUPPORT_POSITIONS:
+            support[mask] = True
+    return benchmark, benchmark_valid, support
+
+
+def score_columns(columns: Dict) -> Dict[str, "np.ndarray"]:
+    """
+    列からスコアを計算（丸め前）
+
+    Args:
+        columns: extract_columns の結果、または同じ列名の数値配列と 'position' 配列
+                 （'valid' / 'empty' は省略可能で、省略時はすべて有効）
+
+    Returns:
+        {farming, combat, vision, objective, gold, total} の配列と、
+        'integral': {評価項目: スカラー版がintを返す行のbool配列}
+    """
+    positions = np.asarray(columns['position'], dtype=object)
+    n = len(positions)
+    valid = columns.get('valid') or {}
+    ones = np.ones(n, dtype=bool)
+    ok = lambda *names: np.logical_and.reduce([valid.get(name, ones) for name in names])
+    col = lambda name: np.asarray(columns[name], dtype=np.float64)
+
+    benchmark, benchmark_valid, support = _position_lookup(positions)
+    scores = {}
+    # スカラー版は上限で頭打ちになるとmin()が整数の上限値を返すため、その行を記録する
+    integral = {}
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        # ファーム効率 (0-20点)。基準値は0.1より大きいため、サポート用の固定値の分岐は通らない
+        farming = np.minimum(col('cs_per_minute') / benchmark, 1.5) * 20
+        farming_ok = ok('cs_per_minute') & benchmark_valid
+        scores['farming'] = np.where(farming_ok, np.minimum(farming, 20), _FALLBACK['farming'])
+        integral['farming'] = farming_ok & (farming > 20)
+
+        # 戦闘効率 (0-25点)
+        deaths = np.maximum(np.trunc(col('deaths')), 1)
+        kda_score = col('kda') * 3
+        damage_score = col('damage_per_minute') / 200
+        takedowns = np.trunc(col('kills')) + np.trunc(col('assists'))
+        kill_ratio = takedowns / np.maximum(deaths * 3, 1)
+        combat = np.minimum(kda_score, 12) + np.minimum(damage_score, 8) + np.minimum(kill_ratio, 1) * 5
+        combat_ok = ok('kda', 'damage_per_minute', 'kills', 'assists', 'deaths')
+        scores['combat'] = np.where(combat_ok, combat, _FALLBACK['combat'])
+        integral['combat'] = combat_ok & (kda_score > 12) & (damage_score > 8) & (kill_ratio > 1)
+
+        # 視界コントロール (0-20点)
+        wards = np.trunc(col('wards_placed')) + np.trunc(col('wards_killed'))
+        base_score = col('vision_score') / np.where(support, 3, 4)
+        ward_score = wards / np.where(support, 10, 15)
+        vision_ok = ok('vision_score', 'wards_placed', 'wards_killed')
+        scores['vision'] = np.where(vision_ok, np.minimum(base_score, 15) + np.minimum(ward_score, 5),
+                                    _FALLBACK['vision'])
+        integral['vision'] = vision_ok & (base_score > 15) & (ward_score > 5)
+
+        # オブジェクト参加 (0-15点、最低5点)
+        objective = (np.trunc(col('turret_kills')) * 2 + np.trunc(col('dragon_kills')) * 3 +
+                     np.trunc(col('baron_kills')) * 4)
+        objective_ok = ok('turret_kills', 'dragon_kills', 'baron_kills')
+        scores['objective'] = np.where(objective_ok, np.maximum(np.minimum(objective, 15), 5.0),
+                                       _FALLBACK['objective'])
+        integral['objective'] = objective_ok & (objective >= 5)
+
+        # ゴールド効率 (0-20点)
+        gold = col('gold')
+        damage_per_minute = col('damage_per_minute')
+        gold_rate_score = col('gold_per_minute') / 400
+        has_efficiency = (gold > 100) & (damage_per_minute > 0)
+        minutes = np.maximum(col('game_duration') / 60, 1)
+        efficiency_score = damage_per_minute * minutes / gold * 1000
+        # 試合時間は効率を計算する行でだけ使う
+        gold_ok = ok('gold_per_minute', 'gold', 'damage_per_minute') & (~has_efficiency | ok('game_duration'))
+        scores['gold'] = np.where(
+            gold_ok,
+            np.minimum(gold_rate_score, 10) + np.where(has_efficiency, np.minimum(efficiency_score, 10), 5),
+            _FALLBACK['gold'])
+        integral['gold'] = gold_ok & (gold_rate_score > 10) & (~has_efficiency | (efficiency_score > 10))
+
+    total = np.zeros(n)
+    for name, weight in _WEIGHTS:
+        total = total + scores[name] * weight
+    scores['total'] = total
+
+    empty = columns.get('empty')
+    if empty is not None and empty.any():
+        for name in scores:
+            scores[name] = np.where(empty, 0.0, scores[name])
+    scores['integral'] = integral
+    return scores
+
+
+def calculate_performance_scores(rows: Sequence, patches: Optional[Sequence[Optional[str]]] = None) -> List[Dict]:
+    """
+    複数参加者の詳細パフォーマンススコアをまとめて計算
+
+    Args:
+        rows: get_player_statsの辞書 または ParticipantRecord のリスト
+        patches: rowsと同じ順の試合のパッチ（省略時は分布の最新パッチと比べる）
+
+    Returns:
+        calculate_performance_score と同じ形式の辞書のリスト（入力順）
+    """
+    if patches is None:
+        patches = [None] * len(rows)
+    if not HAS_NUMPY or len(rows) < BATCH_MIN_ROWS:
+        return [calculate_performance_score(row, patch) for row, patch in zip(rows, patches)]
+
+    columns = extract_columns(rows)
+    scores = score_columns(columns)
+    empty = columns['empty'].tolist()
+    total = scores['total'].tolist()
+    breakdown = {}
+    for _, name in _BREAKDOWN_KEYS:
+        values = scores[name].tolist()
+        for i in np.flatnonzero(scores['integral'][name]).tolist():
+            values[i] = int(values[i])
+        breakdown[name] = values
+    positions = columns['position'].tolist()
+
+    results = []
+    for i, row in enumerate(rows):
+        if empty[i]:
+            results.append(calculate_performance_score(row, patches[i]))
+            continue
+        # 丸めは組み込みのround（np.roundとは端数の扱いが異なる）で行い、スカラー版と一致させる
+        results.append({
+            'total_score': round(min(total[i], 100), 1),
+            'breakdown': {key: round(breakdown[name][i], 1) for key, name in _BREAKDOWN_KEYS},
+            'percentile_rank': calculate_percentile_rank(total[i], positions[i], row.get('champion'), patches[i]),
+        })
+    return results
+
+
+def calculate_total_scores(rows: Sequence) -> List[float]:
+    """
+    複数参加者の総合スコア（丸め前）をまとめて計算
+
+    Args:
+        rows: get_player_statsの辞書 または ParticipantRecord のリスト
+
+    Returns:
+        calculate_total_score と同じ値のリスト（入力順）
+    """
+    if not HAS_NUMPY or len(rows) < BATCH_MIN_ROWS:
+        return [calculate_total_score(row) for row in rows]
+    return score_columns(extract_columns(rows))['total'].tolist()
+
+
+def get_match_participants_stats(match: MatchRecord) -> List[Dict]:
+    """
+    試合の全参加者の詳細統計（get_record_statsと同じ形式）を作成
+
+    パフォーマンススコアは全員分をまとめて1回だけ計算する
+
+    Args:
+        match: 試合レコード
+
+    Returns:
+        参加者の並び順の詳細統計のリスト
+    """
+    patch = patch_of(match.game_version)
+    scores = calculate_performance_scores(match.participants, [patch] * len(match.participants))
+    return [get_record_stats(participant, score) for participant, score in zip(match.participants, scores)]
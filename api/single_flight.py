@@ -0,0 +1,115 @@
+"""
+リクエスト合流（single-flight） - 同一URLへの同時リクエストを1回の上流呼び出しにまとめる
+"""
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict
+
+
+class _Call:
+    """実行中の呼び出し1件"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Exception = None
+
+
+class SingleFlight:
+    """
+    スレッド間でのリクエスト合流
+
+    同じキーの呼び出しが実行中なら、後続の呼び出し元は新たに実行せず
+    先行の結果（デコード済みJSON）を共有する。結果は呼び出し元間で同じ
+    オブジェクトになるため、受け取った側で変更しないこと。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self.stats = {'executed': 0, 'coalesced': 0}
+
+    def do(self, key: str, func: Callable[[], Any]) -> Any:
+        """
+        キー単位で合流して関数を実行
+
+        Args:
+            key: 合流キー（リクエストURL）
+            func: 上流呼び出し
+
+        Returns:
+            funcの戻り値（合流した場合は先行呼び出しの結果）
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.stats['coalesced'] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.stats['executed'] += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+        return call.result
+
+
+class AsyncSingleFlight:
+    """asyncio用のリクエスト合流（同一イベントループ内）"""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+        self.stats = {'executed': 0, 'coalesced': 0}
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        キー単位で合流してコルーチンを実行
+
+        Args:
+            key: 合流キー（リクエストURL）
+            func: 上流呼び出しを行うコルーチン関数
+
+        Returns:
+            funcの戻り値（合流した場合は先行呼び出しの結果）
+        """
+        future = self._calls.get(key)
+        if future is not None:
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        self.stats['executed'] += 1
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 待機者がいない場合の "exception was never retrieved" を防ぐ
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._calls.pop(key, None)
+
+
+# プロセス内で共有する合流テーブル
+default_flight = SingleFlight()
@@ -0,0 +1,336 @@
+"""
+試合タイムライン - match-v5 timeline の毎分のフレームを参加者×項目の数値配列に、
+イベントを型付きの列の表に変換し、元のJSON（約1MB）を保持せずに扱う
+"""
+import json
+import struct
+import sys
+import zlib
+from array import array
+from typing import Dict, List, Optional, Sequence
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+
+# フレームごと・参加者ごとに保持する項目（participantFramesのキー）
+FRAME_FIELDS = (
+    ('total_gold', 'totalGold'),
+    ('current_gold', 'currentGold'),
+    ('xp', 'xp'),
+    ('level', 'level'),
+    ('minions_killed', 'minionsKilled'),
+    ('jungle_minions_killed', 'jungleMinionsKilled'),
+    ('x', None),
+    ('y', None),
+    ('damage_to_champions', None),
+)
+FIELD_INDEX = {name: index for index, (name, _) in enumerate(FRAME_FIELDS)}
+
+# イベントの種類（0はこの一覧にない種類）
+EVENT_TYPES = (
+    'OTHER',
+    'CHAMPION_KILL', 'CHAMPION_SPECIAL_KILL', 'ELITE_MONSTER_KILL', 'BUILDING_KILL', 'TURRET_PLATE_DESTROYED',
+    'ITEM_PURCHASED', 'ITEM_SOLD', 'ITEM_DESTROYED', 'ITEM_UNDO',
+    'WARD_PLACED', 'WARD_KILL', 'SKILL_LEVEL_UP', 'LEVEL_UP',
+    'DRAGON_SOUL_GIVEN', 'CHAMPION_TRANSFORM', 'OBJECTIVE_BOUNTY_PRESTART', 'OBJECTIVE_BOUNTY_FINISH',
+    'FEAT_UPDATE', 'GAME_END', 'PAUSE_END',
+)
+EVENT_TYPE_CODES = {name: code for code, name in enumerate(EVENT_TYPES)}
+
+# イベントの列: (列名, arrayの型コード)
+EVENT_COLUMNS = (
+    ('timestamp', 'q'),     # ミリ秒
+    ('type', 'B'),          # EVENT_TYPES の番号
+    ('participant', 'b'),   # 行動した参加者（killerId / participantId / creatorId。0は中立・不明）
+    ('victim', 'b'),        # victimId（0はなし）
+    ('assists', 'H'),       # 参加者IDをビット位置にしたアシストのビット集合
+    ('item_id', 'i'),       # itemId（ITEM_UNDOはafterId）
+    ('x', 'h'),
+    ('y', 'h'),
+    ('detail', 'H'),        # details の番号+1（モンスター・建物・ワードの種類、スキル番号など。0はなし）
+    ('team_id', 'h'),       # 建物・プレートの所属チーム / ソウル・エピックモンスターの獲得チーム
+)
+
+# イベントの種類ごとの補足情報のキー（最初に値があるものを使う）
+_DETAIL_KEYS = ('monsterSubType', 'monsterType', 'towerType', 'buildingType', 'wardType', 'name',
+                'skillSlot', 'killType', 'multiKillLength')
+
+_FORMAT_VERSION = 1
+_LITTLE_ENDIAN = sys.byteorder == 'little'
+
+
+def _to_bytes(values: array) -> bytes:
+    """arrayをリトルエンディアンのバイト列に変換"""
+    if not _LITTLE_ENDIAN:
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_bytes(typecode: str, data: bytes) -> array:
+    """リトルエンディアンのバイト列からarrayを作成"""
+    values = array(typecode)
+    values.frombytes(data)
+    if not _LITTLE_ENDIAN:
+        values.byteswap()
+    return values
+
+
+class MatchTimeline:
+    """
+    1試合分のタイムライン
+
+    frames はフレーム×参加者×FRAME_FIELDS の順に並べた32bit整数の1次元配列で、
+    events はEVENT_COLUMNSの列ごとの配列。10人・30分の試合で合わせて数十KBに収まる
+    """
+
+    __slots__ = ('match_id', 'frame_interval', 'puuids', 'timestamps', 'frames', 'events', 'details')
+
+    def __init__(self, match_id: Optional[str], frame_interval: int, puuids: Sequence[str]):
+        self.match_id = match_id
+        self.frame_interval = frame_interval
+        # 参加者ID（1始まり）の順のPUUID
+        self.puuids = tuple(puuids)
+        self.timestamps = array('q')
+        self.frames = array('i')
+        self.events = {name: array(typecode) for name, typecode in EVENT_COLUMNS}
+        # イベントの補足情報の文字列（detail列の値-1が番号）
+        self.details: List[str] = []
+
+    @property
+    def frame_count(self) -> int:
+        return len(self.timestamps)
+
+    @property
+    def participant_count(self) -> int:
+        return len(self.puuids)
+
+    @property
+    def event_count(self) -> int:
+        return len(self.events['timestamp'])
+
+    @property
+    def nbytes(self) -> int:
+        """配列が使うバイト数"""
+        arrays = [self.timestamps, self.frames] + list(self.events.values())
+        return sum(len(values) * values.itemsize for values in arrays)
+
+    def participant_id(self, puuid: str) -> Optional[int]:
+        """PUUIDの参加者ID（1始まり。参加していなければNone）"""
+        try:
+            return self.puuids.index(puuid) + 1
+        except ValueError:
+            return None
+
+    def value(self, frame: int, participant_id: int, field: str) -> int:
+        """1フレーム・1参加者の項目の値"""
+        width = len(FRAME_FIELDS)
+        return self.frames[(frame * self.participant_count + participant_id - 1) * width + FIELD_INDEX[field]]
+
+    def series(self, field: str) -> List[List[int]]:
+        """
+        項目のフレームごとの値
+
+        Args:
+            field: FRAME_FIELDS の項目名
+
+        Returns:
+            [フレーム][参加者ID-1] の値
+        """
+        width = len(FRAME_FIELDS)
+        row = self.participant_count * width
+        column = self.frames[FIELD_INDEX[field]::width]
+        return [list(column[start:start + self.participant_count])
+                for start in range(0, len(column), self.participant_count)] if row else []
+
+    def frame_array(self) -> "np.ndarray":
+        """
+        フレームの値をNumPy配列で取得（コピーしない）
+
+        Returns:
+            (フレーム数, 参加者数, len(FRAME_FIELDS)) のint32配列
+        """
+        if not HAS_NUMPY:
+            raise RuntimeError('frame_arrayにはNumPyが必要です')
+        values = np.frombuffer(self.frames, dtype=np.int32) if len(self.frames) else np.zeros(0, dtype=np.int32)
+        return values.reshape(self.frame_count, self.participant_count, len(FRAME_FIELDS))
+
+    def event_list(self, participant_id: Optional[int] = None,
+                   types: Optional[Sequence[str]] = None) -> List[Dict]:
+        """
+        イベントを辞書のリストに変換
+
+        Args:
+            participant_id: 指定した参加者が行動・被害・アシストしたイベントのみ（Noneならすべて）
+            types: イベントの種類で絞り込む（Noneならすべて）
+
+        Returns:
+            {timestamp, type, participant, victim, assists, item_id, position, detail, team_id} のリスト
+        """
+        columns = self.events
+        type_codes = {EVENT_TYPE_CODES.get(name, 0) for name in types} if types is not None else None
+        bit = 1 << participant_id if participant_id is not None else 0
+        result = []
+        for i in range(self.event_count):
+            if type_codes is not None and columns['type'][i] not in type_codes:
+                continue
+            if participant_id is not None and not (
+                    columns['participant'][i] == participant_id or columns['victim'][i] == participant_id
+                    or columns['assists'][i] & bit):
+                continue
+            assists = columns['assists'][i]
+            detail = columns['detail'][i]
+            result.append({
+                'timestamp': columns['timestamp'][i],
+                'type': EVENT_TYPES[columns['type'][i]],
+                'participant': columns['participant'][i] or None,
+                'victim': columns['victim'][i] or None,
+                'assists': [pid for pid in range(1, 17) if assists & (1 << pid)],
+                'item_id': columns['item_id'][i] or None,
+                'position': {'x': columns['x'][i], 'y': columns['y'][i]},
+                'detail': self.details[detail - 1] if detail else None,
+                'team_id': columns['team_id'][i] or None,
+            })
+        return result
+
+    def to_response(self, events: bool = True) -> Dict:
+        """
+        APIレスポンス用の辞書（ゴールド・経験値・CSの推移とイベント）
+
+        Args:
+            events: イベントの一覧を含めるか
+
+        Returns:
+            {frame_interval, timestamps, participants, gold, xp, cs, events}
+        """
+        minions = self.series('minions_killed')
+        jungle = self.series('jungle_minions_killed')
+        response = {
+            'frame_interval': self.frame_interval,
+            'timestamps': list(self.timestamps),
+            'participants': list(self.puuids),
+            'gold': self.series('total_gold'),
+            'xp': self.series('xp'),
+            'cs': [[m + j for m, j in zip(lane, jungle_row)] for lane, jungle_row in zip(minions, jungle)],
+        }
+        if events:
+            response['events'] = self.event_list()
+        return response
+
+    def to_bytes(self) -> bytes:
+        """保存用のバイト列（zlib圧縮）に変換"""
+        arrays = [self.timestamps, self.frames] + [self.events[name] for name, _ in EVENT_COLUMNS]
+        header = json.dumps({
+            'v': _FORMAT_VERSION, 'match_id': self.match_id, 'frame_interval': self.frame_interval,
+            'puuids': self.puuids, 'details': self.details, 'fields': [name for name, _ in FRAME_FIELDS],
+            'sizes': [len(values) * values.itemsize for values in arrays],
+        }, separators=(',', ':')).encode('utf-8')
+        body = b''.join(_to_bytes(values) for values in arrays)
+        return zlib.compress(struct.pack('<I', len(header)) + header + body)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> Optional["MatchTimeline"]:
+        """保存したバイト列から復元（形式が異なる場合はNone）"""
+        raw = zlib.decompress(data)
+        header_size, = struct.unpack_from('<I', raw)
+        header = json.loads(raw[4:4 + header_size])
+        if header.get('v') != _FORMAT_VERSION or header.get('fields') != [name for name, _ in FRAME_FIELDS]:
+            return None
+        timeline = cls(header['match_id'], header['frame_interval'], header['puuids'])
+        timeline.details = header['details']
+        offset = 4 + header_size
+        typecodes = ['q', 'i'] + [typecode for _, typecode in EVENT_COLUMNS]
+        arrays = []
+        for typecode, size in zip(typecodes, header['sizes']):
+            arrays.append(_from_bytes(typecode, raw[offset:offset + size]))
+            offset += size
+        timeline.timestamps, timeline.frames = arrays[0], arrays[1]
+        timeline.events = {name: values for (name, _), values in zip(EVENT_COLUMNS, arrays[2:])}
+        return timeline
+
+
+def _int(value) -> int:
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def parse_timeline(timeline_data: Dict) -> MatchTimeline:
+    """
+    match-v5 timeline の応答をタイムラインに変換
+
+    Args:
+        timeline_data: /lol/match/v5/matches/{matchId}/timeline の応答
+
+    Returns:
+        MatchTimeline
+    """
+    info = timeline_data.get('info', {})
+    metadata = timeline_data.get('metadata', {})
+    participants = info.get('participants') or []
+    if participants:
+        ordered = sorted(participants, key=lambda p: _int(p.get('participantId')))
+        puuids = [p.get('puuid') for p in ordered]
+    else:
+        puuids = metadata.get('participants') or []
+    timeline = MatchTimeline(metadata.get('matchId'), _int(info.get('frameInterval')) or 60000, puuids)
+    count = len(puuids)
+
+    frames = timeline.frames
+    events = timeline.events
+    detail_codes: Dict[str, int] = {}
+    empty_row = [0] * len(FRAME_FIELDS)
+    for frame in info.get('frames') or []:
+        timeline.timestamps.append(_int(frame.get('timestamp')))
+        participant_frames = frame.get('participantFrames') or {}
+        for participant_id in range(1, count + 1):
+            pf = participant_frames.get(str(participant_id))
+            if not pf:
+                frames.extend(empty_row)
+                continue
+            position = pf.get('position') or {}
+            damage = pf.get('damageStats') or {}
+            for name, key in FRAME_FIELDS:
+                if key is not None:
+                    frames.append(_int(pf.get(key)))
+                elif name == 'x':
+                    frames.append(_int(position.get('x')))
+                elif name == 'y':
+                    frames.append(_int(position.get('y')))
+                else:
+                    frames.append(_int(damage.get('totalDamageDoneToChampions')))
+
+        for event in frame.get('events') or []:
+            event_type = event.get('type')
+            position = event.get('position') or {}
+            assists = 0
+            for participant_id in event.get('assistingParticipantIds') or ():
+                assists |= 1 << _int(participant_id)
+            detail = None
+            for key in _DETAIL_KEYS:
+                if event.get(key) is not None:
+                    detail = str(event[key])
+                    break
+            detail_code = 0
+            if detail is not None:
+                detail_code = detail_codes.get(detail)
+                if detail_code is None:
+                    timeline.details.append(detail)
+                    detail_code = detail_codes[detail] = len(timeline.details)
+            actor = event.get('killerId', event.get('participantId', event.get('creatorId')))
+            events['timestamp'].append(_int(event.get('timestamp')))
+            events['type'].append(EVENT_TYPE_CODES.get(event_type, 0))
+            events['participant'].append(_int(actor))
+            events['victim'].append(_int(event.get('victimId')))
+            events['assists'].append(assists & 0xFFFF)
+            events['item_id'].append(_int(event.get('itemId', event.get('afterId'))))
+            events['x'].append(_int(position.get('x')))
+            events['y'].append(_int(position.get('y')))
+            events['detail'].append(detail_code)
+            events['team_id'].append(_int(event.get('teamId', event.get('killerTeamId'))))
+    return timeline
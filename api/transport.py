@@ -0,0 +1,292 @@
+"""
+トランスポート - Riot APIへの送信を差し替え、応答の記録・再生を行う
+
+RIOT_TRANSPORT_RECORD にパスを指定すると実際の応答（ヘッダー・所要時間を含む）を
+フィクスチャアーカイブに追記し、RIOT_TRANSPORT_REPLAY を指定するとネットワークに
+接続せずアーカイブから応答を再生する。再生時は RIOT_REPLAY_LATENCY（秒数または
+recorded）で応答遅延を、RIOT_REPLAY_429_RATE で429応答の混入率を指定できる。
+"""
+import abc
+import gzip
+import json
+import os
+import random
+import threading
+import time
+from datetime import timedelta
+from typing import Dict, List, Optional, Union
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+try:
+    from http_pool import get_session
+except ImportError:
+    from api.http_pool import get_session
+
+
+class TransportResponse:
+    """
+    記録から再生した応答
+
+    クライアントが参照するrequests.Responseの属性（status_code/headers/content/
+    text/json()/elapsed）だけを持つ
+    """
+
+    __slots__ = ('url', 'status_code', 'headers', 'content', 'elapsed')
+
+    def __init__(self, url: str, status_code: int, headers: Dict[str, str], content: bytes, elapsed: float = 0.0):
+        self.url = url
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = content
+        self.elapsed = timedelta(seconds=elapsed)
+
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8', 'replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class Transport(abc.ABC):
+    """クライアントの送信部分（_fetchはこのgetだけを呼ぶ）"""
+
+    @abc.abstractmethod
+    def get(self, url: str, headers: Optional[Dict] = None, timeout=None):
+        """
+        GETリクエストを送信
+
+        Args:
+            url: リクエストURL
+            headers: リクエストヘッダー
+            timeout: タイムアウト（秒、または (接続, 読み取り) のタプル）
+
+        Returns:
+            requests.Response または TransportResponse
+        """
+
+
+class HttpTransport(Transport):
+    """ホストごとのkeep-aliveセッションで実際に送信する（既定）"""
+
+    def get(self, url: str, headers: Optional[Dict] = None, timeout=None):
+        """
+        GETリクエストを送信
+
+        Args:
+            url: リクエストURL
+            headers: リクエストヘッダー
+            timeout: タイムアウト（秒、または (接続, 読み取り) のタプル）
+
+        Returns:
+            requests.Response
+        """
+        return get_session(url).get(url, headers=headers, timeout=timeout)
+
+
+# 本文は復号済みで記録するため、転送時の符号化に関するヘッダーは記録しない
+_UNREPLAYED_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding', 'connection')
+
+
+def _open_archive(path: str, mode: str):
+    """アーカイブを開く（拡張子が.gzなら圧縮）"""
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def load_archive(path: str) -> List[Dict]:
+    """
+    フィクスチャアーカイブを読み込む
+
+    Args:
+        path: アーカイブのパス（1行1応答のJSON Lines）
+
+    Returns:
+        記録した応答のリスト（記録順）
+    """
+    entries = []
+    with _open_archive(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entries.append(json.loads(line))
+    return entries
+
+
+class RecordingTransport(Transport):
+    """
+    実際に送信し、応答をフィクスチャアーカイブに追記する
+
+    記録するのはURL・ステータス・レスポンスヘッダー・本文・所要時間のみで、
+    リクエストヘッダー（APIキー）は記録しない
+    """
+
+    def __init__(self, path: str, inner: Optional[Transport] = None):
+        """
+        初期化
+
+        Args:
+            path: 追記先のアーカイブのパス
+            inner: 実際に送信するトランスポート
+        """
+        self.path = path
+        self.inner = inner or HttpTransport()
+        self._lock = threading.Lock()
+        self.stats = {'recorded': 0}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def get(self, url: str, headers: Optional[Dict] = None, timeout=None):
+        """送信し、応答を記録して返す"""
+        started = time.monotonic()
+        response = self.inner.get(url, headers=headers, timeout=timeout)
+        entry = {
+            'url': url,
+            'status': response.status_code,
+            'headers': {k: v for k, v in response.headers.items() if k.lower() not in _UNREPLAYED_HEADERS},
+            'body': response.content.decode('utf-8', 'replace'),
+            'elapsed': round(time.monotonic() - started, 4),
+            'recorded_at': round(time.time(), 3),
+        }
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            with _open_archive(self.path, 'a') as f:
+                f.write(line + '\n')
+            self.stats['recorded'] += 1
+        return response
+
+
+class ReplayTransport(Transport):
+    """
+    フィクスチャアーカイブから応答を再生する（ネットワークには接続しない）
+
+    同じURLの応答が複数記録されていれば記録順に返し、最後の応答を繰り返す。
+    429の混入はURLと呼び出し回数から決まるため、スレッドの実行順に関係なく再現できる。
+    """
+
+    def __init__(self, path: str, latency: Union[None, float, str] = None, latency_scale: float = 1.0,
+                 rate_limit_rate: float = 0.0, retry_after: float = 1.0, seed: int = 0):
+        """
+        初期化
+
+        Args:
+            path: アーカイブのパス
+            latency: 応答遅延。None/0なら待たない、秒数なら一律、'recorded'なら記録時の所要時間
+            latency_scale: 遅延に掛ける倍率
+            rate_limit_rate: 429を返す割合（0〜1）
+            retry_after: 混入させる429のRetry-After（秒）
+            seed: 429の混入に使う乱数の種
+        """
+        self.path = path
+        self.latency = latency
+        self.latency_scale = latency_scale
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.seed = seed
+        self._lock = threading.Lock()
+        self._entries: Dict[str, List[Dict]] = {}
+        for entry in load_archive(path):
+            self._entries.setdefault(entry['url'], []).append(entry)
+        self._calls: Dict[str, int] = {}
+        self.stats = {'replayed': 0, 'misses': 0, 'injected_429': 0}
+
+    def get(self, url: str, headers: Optional[Dict] = None, timeout=None) -> TransportResponse:
+        """記録した応答を返す（未記録のURLは404）"""
+        with self._lock:
+            call = self._calls.get(url, 0)
+            self._calls[url] = call + 1
+            entries = self._entries.get(url)
+            if entries is None:
+                self.stats['misses'] += 1
+            inject = (self.rate_limit_rate > 0 and
+                      random.Random(f"{self.seed}:{url}:{call}").random() < self.rate_limit_rate)
+            if inject:
+                self.stats['injected_429'] += 1
+            elif entries is not None:
+                self.stats['replayed'] += 1
+
+        entry = entries[min(call, len(entries) - 1)] if entries else None
+        self._sleep(entry, timeout)
+        if inject:
+            return TransportResponse(url, 429, {
+                'Retry-After': str(self.retry_after),
+                'X-Rate-Limit-Type': 'method',
+            }, b'{"status":{"message":"Rate limit exceeded","status_code":429}}')
+        if entry is None:
+            print(f"Replay: 記録されていないURLです - {url}")
+            return TransportResponse(url, 404, {'Content-Type': 'application/json'},
+                                     b'{"status":{"message":"Not recorded","status_code":404}}')
+        return TransportResponse(url, entry['status'], entry.get('headers') or {},
+                                 entry.get('body', '').encode('utf-8'), entry.get('elapsed', 0.0))
+
+    def _sleep(self, entry: Optional[Dict], timeout):
+        """応答遅延を再現（読み取りタイムアウトを超える場合はタイムアウトさせる）"""
+        if not self.latency:
+            return
+        if self.latency == 'recorded':
+            delay = entry.get('elapsed', 0.0) if entry else 0.0
+        else:
+            delay = float(self.latency)
+        delay *= self.latency_scale
+        read_timeout = timeout[1] if isinstance(timeout, tuple) else timeout
+        if read_timeout is not None and delay > read_timeout:
+            time.sleep(read_timeout)
+            raise requests.ReadTimeout(f"Replay: {delay:.3f}秒の応答遅延がタイムアウトを超えました")
+        if delay > 0:
+            time.sleep(delay)
+
+
+def transport_from_env() -> Transport:
+    """
+    環境変数からトランスポートを作成
+
+    Returns:
+        RIOT_TRANSPORT_REPLAY があればReplayTransport、RIOT_TRANSPORT_RECORD があれば
+        RecordingTransport、どちらもなければHttpTransport
+    """
+    replay_path = os.environ.get('RIOT_TRANSPORT_REPLAY')
+    if replay_path:
+        latency = os.environ.get('RIOT_REPLAY_LATENCY') or None
+        if latency is not None and latency != 'recorded':
+            latency = float(latency)
+        return ReplayTransport(
+            replay_path,
+            latency=latency,
+            latency_scale=float(os.environ.get('RIOT_REPLAY_LATENCY_SCALE', 1.0)),
+            rate_limit_rate=float(os.environ.get('RIOT_REPLAY_429_RATE', 0.0)),
+            retry_after=float(os.environ.get('RIOT_REPLAY_RETRY_AFTER', 1.0)),
+            seed=int(os.environ.get('RIOT_REPLAY_SEED', 0)),
+        )
+    record_path = os.environ.get('RIOT_TRANSPORT_RECORD')
+    if record_path:
+        return RecordingTransport(record_path)
+    return HttpTransport()
+
+
+_default_transport = None
+_default_transport_lock = threading.Lock()
+
+
+def get_default_transport() -> Transport:
+    """プロセス共有のトランスポートを取得（最初の呼び出し時に環境変数から作成）"""
+    global _default_transport
+    with _default_transport_lock:
+        if _default_transport is None:
+            _default_transport = transport_from_env()
+        return _default_transport
+
+
+def set_default_transport(transport: Optional[Transport]):
+    """
+    プロセス共有のトランスポートを差し替え（以降に作成するクライアントに適用）
+
+    Args:
+        transport: 使用するトランスポート（Noneなら次回の取得時に環境変数から作り直す）
+    """
+    global _default_transport
+    with _default_transport_lock:
+        _default_transport = transport
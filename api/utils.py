@@ -3,6 +3,15 @@
 """
 from typing import List, Dict, Tuple, Optional
 
+try:
+    from records import ParticipantRecord, extract_match_record, team_summary
+    from percentiles import get_default_percentile_index, patch_of
+    from timeline import MatchTimeline
+except ImportError:
+    from api.records import ParticipantRecord, extract_match_record, team_summary
+    from api.percentiles import get_default_percentile_index, patch_of
+    from api.timeline import MatchTimeline
+
 
 def calculate_kda(kills: int, deaths: int, assists: int) -> float:
     """KDAを計算"""
@@ -29,147 +38,39 @@ def get_player_stats(match_data: Dict, puuid: str) -> Optional[Dict]:
     Returns:
         プレイヤーの詳細統計情報
     """
-    participants = match_data.get("info", {}).get("participants", [])
+    info = match_data.get("info", {})
     
-    for participant in participants:
+    for participant in info.get("participants", []):
         if participant.get("puuid") == puuid:
-            # アイテム情報
-            items = [
-                participant.get("item0", 0),
-                participant.get("item1", 0),
-                participant.get("item2", 0),
-                participant.get("item3", 0),
-                participant.get("item4", 0),
-                participant.get("item5", 0),
-                participant.get("item6", 0)  # ワード等
-            ]
-            
-            # ルーン情報
-            perks = participant.get("perks", {})
-            primary_style = perks.get("styles", [{}])[0] if perks.get("styles") else {}
-            secondary_style = perks.get("styles", [{}])[1] if len(perks.get("styles", [])) > 1 else {}
-            stat_perks = perks.get("statPerks", {})
-            
-            # スペル情報
-            summoner_spells = {
-                "spell1": participant.get("summoner1Id"),
-                "spell2": participant.get("summoner2Id")
-            }
-            
-            # ダメージ詳細
-            damage_stats = {
-                "total_damage_dealt": participant.get("totalDamageDealt", 0),
-                "total_damage_to_champions": participant.get("totalDamageDealtToChampions", 0),
-                "physical_damage_to_champions": participant.get("physicalDamageDealtToChampions", 0),
-                "magic_damage_to_champions": participant.get("magicDamageDealtToChampions", 0),
-                "true_damage_to_champions": participant.get("trueDamageDealtToChampions", 0),
-                "total_damage_taken": participant.get("totalDamageTaken", 0),
-                "damage_self_mitigated": participant.get("damageSelfMitigated", 0)
-            }
-            
-            # ビジョン関連
-            vision_stats = {
-                "vision_score": participant.get("visionScore", 0),
-                "wards_placed": participant.get("wardsPlaced", 0),
-                "wards_killed": participant.get("wardsKilled", 0),
-                "control_wards_purchased": participant.get("visionWardsBoughtInGame", 0)
-            }
-            
-            player_stats = {
-                # 基本情報
-                "champion": participant.get("championName"),
-                "champion_id": participant.get("championId"),
-                "champion_level": participant.get("champLevel"),
-                "kills": participant.get("kills"),
-                "deaths": participant.get("deaths"),
-                "assists": participant.get("assists"),
-                "kda": calculate_kda(
-                    participant.get("kills", 0),
-                    participant.get("deaths", 0),
-                    participant.get("assists", 0)
-                ),
-                "win": participant.get("win"),
-                "placement": participant.get("placement"),  # Arenaモードの順位
-                "position": participant.get("teamPosition"),
-                
-                # ファーム関連
-                "cs": participant.get("totalMinionsKilled", 0) + participant.get("neutralMinionsKilled", 0),
-                "minions_killed": participant.get("totalMinionsKilled", 0),
-                "neutral_minions_killed": participant.get("neutralMinionsKilled", 0),
-                "cs_per_minute": round(
-                    (participant.get("totalMinionsKilled", 0) + participant.get("neutralMinionsKilled", 0)) 
-                    / max(match_data.get("info", {}).get("gameDuration", 1) / 60, 1), 1
-                ),
-                
-                # 経済
-                "gold": participant.get("goldEarned"),
-                "gold_per_minute": round(
-                    participant.get("goldEarned", 0) / max(match_data.get("info", {}).get("gameDuration", 1) / 60, 1), 1
-                ),
-                "gold_spent": participant.get("goldSpent", 0),
-                
-                # ダメージ統計
-                "damage": damage_stats,
-                "damage_per_minute": round(
-                    participant.get("totalDamageDealtToChampions", 0) 
-                    / max(match_data.get("info", {}).get("gameDuration", 1) / 60, 1), 1
-                ),
-                
-                # ビジョン統計
-                "vision": vision_stats,
-                
-                # アイテム
-                "items": [item for item in items if item > 0],
-                
-                # ルーン
-                "runes": {
-                    "primary_style": primary_style.get("style"),
-                    "primary_perks": [perk.get("perk") for perk in primary_style.get("selections", [])],
-                    "secondary_style": secondary_style.get("style"),
-                    "secondary_perks": [perk.get("perk") for perk in secondary_style.get("selections", [])],
-                    "stat_perks": {
-                        "offense": stat_perks.get("offense"),
-                        "flex": stat_perks.get("flex"),
-                        "defense": stat_perks.get("defense")
-                    }
-                },
-                
-                # サモナースペル
-                "summoner_spells": summoner_spells,
-                
-                # その他統計
-                "largest_killing_spree": participant.get("largestKillingSpree", 0),
-                "largest_multi_kill": participant.get("largestMultiKill", 0),
-                "double_kills": participant.get("doubleKills", 0),
-                "triple_kills": participant.get("tripleKills", 0),
-                "quadra_kills": participant.get("quadraKills", 0),
-                "penta_kills": participant.get("pentaKills", 0),
-                "first_blood_kill": participant.get("firstBloodKill", False),
-                "first_blood_assist": participant.get("firstBloodAssist", False),
-                "first_tower_kill": participant.get("firstTowerKill", False),
-                "first_tower_assist": participant.get("firstTowerAssist", False),
-                
-                # オブジェクト関連
-                "turret_kills": participant.get("turretKills", 0),
-                "inhibitor_kills": participant.get("inhibitorKills", 0),
-                "dragon_kills": participant.get("dragonKills", 0),
-                "baron_kills": participant.get("baronKills", 0),
-                
-                # チーム情報
-                "team_id": participant.get("teamId"),
-                "team_position": participant.get("teamPosition"),
-                
-                # ゲーム時間（パフォーマンス計算用）
-                "game_duration": match_data.get("info", {}).get("gameDuration", 1800)
-            }
-            
-            # 詳細パフォーマンススコア計算
-            player_stats["performance_analysis"] = calculate_performance_score(player_stats)
-            
-            return player_stats
+            record = ParticipantRecord.from_participant(participant, info.get("gameDuration"))
+            return get_record_stats(record, patch=patch_of(info.get("gameVersion")))
     return None
 
 
+def get_record_stats(record: ParticipantRecord, performance_analysis: Optional[Dict] = None,
+                     patch: Optional[str] = None) -> Dict:
+    """
+    参加者レコードから詳細統計（get_player_statsと同じ形式）を作成
+    
+    Args:
+        record: 参加者レコード
+        performance_analysis: 計算済みの詳細パフォーマンススコア（scoring.calculate_performance_scoresでまとめて
+                              計算した場合。省略時はこのレコードだけ計算する）
+        patch: 試合のパッチ（パーセンタイルの分布の選択に使う）
+        
+    Returns:
+        プレイヤーの詳細統計情報
+    """
+    player_stats = record.to_stats()
+    
+    # 詳細パフォーマンススコア計算
+    if performance_analysis is None:
+        performance_analysis = calculate_performance_score(record, patch)
+    player_stats["performance_analysis"] = performance_analysis
+    
+    return player_stats
+
+
 def get_rank_score(tier: str, rank: str, lp: int) -> int:
     """
     ランクをスコア化
@@ -265,28 +166,43 @@ def format_rank(tier: str, rank: str, lp: int) -> str:
     return f"{tier} {rank} {lp} LP"
 
 
-def get_match_timeline_events(match_data: Dict, puuid: str) -> List[Dict]:
+def get_match_timeline_events(timeline: Optional[MatchTimeline], puuid: str) -> List[Dict]:
     """
     試合タイムラインから特定プレイヤーのイベントを取得
     
     Args:
-        match_data: 試合データ
+        timeline: 試合タイムライン（RiotAPIClient.get_match_timeline）
         puuid: プレイヤーUUID
         
     Returns:
-        プレイヤーのイベントリスト
+        プレイヤーが行動・被害・アシストしたイベントのリスト（時刻順）
     """
-    # 注意: タイムラインデータは別のAPIエンドポイントが必要
-    # 将来の実装のための枠組み
-    return []
+    if timeline is None:
+        return []
+    participant_id = timeline.participant_id(puuid)
+    if participant_id is None:
+        return []
+    return timeline.event_list(participant_id)
 
 
-def calculate_performance_score(stats: Dict) -> Dict:
+# ロール別の分間CS基準値（ファーム効率スコア用）
+ROLE_CS_BENCHMARKS = {
+    'TOP': 7.5, 'JUNGLE': 6.0, 'MIDDLE': 8.0, 'MID': 8.0,
+    'BOTTOM': 8.5, 'ADC': 8.5, 'UTILITY': 2.0, 'SUPPORT': 2.0
+}
+DEFAULT_CS_BENCHMARK = 7.0
+
+# 視界スコアの基準が高いロール
+SUPPORT_POSITIONS = ('UTILITY', 'SUPPORT')
+
+
+def calculate_performance_score(stats: Dict, patch: Optional[str] = None) -> Dict:
     """
     詳細パフォーマンススコアを計算
     
     Args:
         stats: プレイヤー統計
+        patch: 試合のパッチ（例: 14.3。省略時は分布の最新パッチと比べる）
         
     Returns:
         詳細パフォーマンススコア情報
@@ -308,20 +224,8 @@ def calculate_performance_score(stats: Dict) -> Dict:
     position = stats.get("position", "MID")
     
     # 各スコア計算
-    farming_score = calculate_farming_efficiency(stats, position)
-    combat_score = calculate_combat_effectiveness(stats)
-    vision_score = calculate_vision_control(stats, position)
-    objective_score = calculate_objective_participation(stats)
-    gold_efficiency = calculate_gold_efficiency(stats)
-    
-    # 総合スコア計算（重み付け）
-    total_score = (
-        farming_score * 0.20 +      # ファーム 20%
-        combat_score * 0.25 +       # 戦闘 25%
-        vision_score * 0.20 +       # 視界 20%
-        objective_score * 0.15 +    # オブジェクト 15%
-        gold_efficiency * 0.20      # ゴールド効率 20%
-    )
+    farming_score, combat_score, vision_score, objective_score, gold_efficiency = _score_components(stats, position)
+    total_score = _weighted_total(farming_score, combat_score, vision_score, objective_score, gold_efficiency)
     
     return {
         'total_score': round(min(total_score, 100), 1),
@@ -332,22 +236,54 @@ def calculate_performance_score(stats: Dict) -> Dict:
             'objective_score': round(objective_score, 1),
             'gold_efficiency': round(gold_efficiency, 1)
         },
-        'percentile_rank': calculate_percentile_rank(total_score, position, stats.get('champion'))
+        'percentile_rank': calculate_percentile_rank(total_score, position, stats.get('champion'), patch)
     }
 
 
+def calculate_total_score(stats: Dict) -> float:
+    """
+    総合スコア（丸め前）を計算
+    
+    Args:
+        stats: プレイヤー統計
+        
+    Returns:
+        calculate_performance_score の total_score の丸め前の値
+    """
+    if not stats:
+        return 0.0
+    return _weighted_total(*_score_components(stats, stats.get("position", "MID")))
+
+
+def _score_components(stats: Dict, position: str) -> Tuple[float, float, float, float, float]:
+    """評価項目ごとのスコア（ファーム, 戦闘, 視界, オブジェクト, ゴールド効率）"""
+    return (
+        calculate_farming_efficiency(stats, position),
+        calculate_combat_effectiveness(stats),
+        calculate_vision_control(stats, position),
+        calculate_objective_participation(stats),
+        calculate_gold_efficiency(stats),
+    )
+
+
+def _weighted_total(farming_score: float, combat_score: float, vision_score: float,
+                    objective_score: float, gold_efficiency: float) -> float:
+    """総合スコア計算（重み付け）"""
+    return (
+        farming_score * 0.20 +      # ファーム 20%
+        combat_score * 0.25 +       # 戦闘 25%
+        vision_score * 0.20 +       # 視界 20%
+        objective_score * 0.15 +    # オブジェクト 15%
+        gold_efficiency * 0.20      # ゴールド効率 20%
+    )
+
+
 def calculate_farming_efficiency(stats: Dict, position: str) -> float:
     """ファーム効率スコア (0-20点)"""
     try:
         cs_per_min = float(stats.get('cs_per_minute', 0))
         
-        # ロール別基準値
-        role_cs_benchmarks = {
-            'TOP': 7.5, 'JUNGLE': 6.0, 'MIDDLE': 8.0, 'MID': 8.0,
-            'BOTTOM': 8.5, 'ADC': 8.5, 'UTILITY': 2.0, 'SUPPORT': 2.0
-        }
-        
-        benchmark = role_cs_benchmarks.get(position, 7.0)
+        benchmark = ROLE_CS_BENCHMARKS.get(position, DEFAULT_CS_BENCHMARK)
         if benchmark <= 0.1:  # サポートなど、CSが重要でないロール
             return 18.0
         
@@ -383,13 +319,14 @@ def calculate_combat_effectiveness(stats: Dict) -> float:
 def calculate_vision_control(stats: Dict, position: str) -> float:
     """視界コントロールスコア (0-20点)"""
     try:
-        vision_data = stats.get('vision', {})
+        # 統計辞書はvisionにネスト、参加者レコードはフラットに持つ
+        vision_data = stats.get('vision') or stats
         vision_score = float(vision_data.get('vision_score', 0))
         wards_placed = int(vision_data.get('wards_placed', 0))
         wards_killed = int(vision_data.get('wards_killed', 0))
         
         # ポジション別基準
-        if position in ['UTILITY', 'SUPPORT']:
+        if position in SUPPORT_POSITIONS:
             # サポートは視界スコアを重視
             base_score = min(vision_score / 3, 15)
             ward_score = min((wards_placed + wards_killed) / 10, 5)
@@ -444,13 +381,21 @@ def calculate_gold_efficiency(stats: Dict) -> float:
         return 10.0  # デフォルト値
 
 
-def calculate_percentile_rank(total_score: float, position: str, champion: str) -> float:
-    """パーセンタイルランク計算（暫定実装）"""
+def calculate_percentile_rank(total_score: float, position: str, champion: str, patch: Optional[str] = None) -> float:
+    """
+    パーセンタイルランク計算
+    
+    保存済みの試合から作った (ポジション, チャンピオン, パッチ) ごとの分布で順位を求める。
+    パッチを省略すると分布の最新パッチと比べる。
+    分布のサンプルが足りない場合はスコア帯ごとの固定値を返す
+    """
     try:
-        # 将来的にはデータベースの統計データから計算
-        # 現在は簡易的な計算
         score = float(total_score)
         
+        percentile = get_default_percentile_index().percentile(score, position, champion, patch)
+        if percentile is not None:
+            return percentile
+        
         if score >= 80:
             return 95.0
         elif score >= 70:
@@ -482,20 +427,7 @@ def get_team_stats(match_data: Dict, team_id: int) -> Dict:
     
     for team in teams:
         if team.get("teamId") == team_id:
-            objectives = team.get("objectives", {})
-            
-            return {
-                "team_id": team_id,
-                "win": team.get("win", False),
-                "bans": [ban.get("championId") for ban in team.get("bans", [])],
-                "objectives": {
-                    "baron": objectives.get("baron", {}).get("kills", 0),
-                    "dragon": objectives.get("dragon", {}).get("kills", 0),
-                    "riftHerald": objectives.get("riftHerald", {}).get("kills", 0),
-                    "tower": objectives.get("tower", {}).get("kills", 0),
-                    "inhibitor": objectives.get("inhibitor", {}).get("kills", 0)
-                }
-            }
+            return team_summary(team)
     
     return {}
 
@@ -510,22 +442,7 @@ def get_detailed_match_info(match_data: Dict) -> Dict:
     Returns:
         詳細な試合情報
     """
-    info = match_data.get("info", {})
-    
-    return {
-        "match_id": match_data.get("metadata", {}).get("matchId"),
-        "game_creation": info.get("gameCreation"),
-        "game_duration": info.get("gameDuration"),
-        "game_end_timestamp": info.get("gameEndTimestamp"),
-        "game_mode": info.get("gameMode"),
-        "game_type": info.get("gameType"),
-        "game_version": info.get("gameVersion"),
-        "map_id": info.get("mapId"),
-        "platform_id": info.get("platformId"),
-        "queue_id": info.get("queueId"),
-        "tournament_code": info.get("tournamentCode"),
-        "teams": [get_team_stats(match_data, 100), get_team_stats(match_data, 200)]
-    }
+    return extract_match_record(match_data, with_participants=False).detailed_info()
 
 
 def balance_teams_with_lanes(players_data: List[Dict]) -> Tuple[List[Dict], List[Dict], Dict]:
@@ -1,8 +1,9 @@
 """
 Flaskを使用したWebアプリケーション
 """
-from flask import Flask, render_template, request, jsonify
-from riot_api import RiotAPIClient
+from flask import Flask, render_template, request, jsonify, g, Response
+from riot_api import RiotAPIClient, PRIORITY_INTERACTIVE, set_request_context, reset_request_context
+from client_metrics import collect_metrics, render_prometheus, PROMETHEUS_CONTENT_TYPE
 from game_utils import MatchAnalyzer, TeamBalancer, format_rank
 import os
 from dotenv import load_dotenv
@@ -15,6 +16,19 @@ app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY', 'your-secret-key-here')
 riot_client = RiotAPIClient()
 
 
+@app.before_request
+def tag_request_context():
+    """Riot APIへのリクエストを対話クラスとして、アクセス元ごとに公平に割り当てる"""
+    g.request_context_token = set_request_context(PRIORITY_INTERACTIVE, request.remote_addr)
+
+
+@app.teardown_request
+def clear_request_context(exc):
+    token = g.pop('request_context_token', None)
+    if token is not None:
+        reset_request_context(token)
+
+
 @app.route('/')
 def index():
     """トップページ"""
@@ -53,19 +67,22 @@ def get_match_history():
         return jsonify({'error': '試合履歴が見つかりませんでした'}), 404
     
     matches = []
-    for match_id in match_ids[:count]:
-        match_data = riot_client.get_match_detail(match_id)
-        if match_data:
-            player_stats = MatchAnalyzer.get_player_stats(match_data, puuid)
-            if player_stats:
-                matches.append({
-                    'match_id': match_id,
-                    'game_duration': MatchAnalyzer.format_game_duration(
-                        match_data['info']['gameDuration']
-                    ),
-                    'game_mode': match_data['info']['gameMode'],
-                    'stats': player_stats
-                })
+    failed_matches = []
+    for result in riot_client.get_match_details_bulk(match_ids[:count]):
+        match_data = result['match_data']
+        if result['error']:
+            failed_matches.append({'match_id': result['match_id'], 'error': result['error']})
+            continue
+        player_stats = MatchAnalyzer.get_player_stats(match_data, puuid)
+        if player_stats:
+            matches.append({
+                'match_id': result['match_id'],
+                'game_duration': MatchAnalyzer.format_game_duration(
+                    match_data['info']['gameDuration']
+                ),
+                'game_mode': match_data['info']['gameMode'],
+                'stats': player_stats
+            })
     
     return jsonify({
         'summoner': {
@@ -74,7 +91,8 @@ def get_match_history():
             'level': summoner.get('summonerLevel') if summoner else 'N/A'
         },
         'ranked_stats': ranked_stats,
-        'matches': matches
+        'matches': matches,
+        'failed_matches': failed_matches
     })
 
 
@@ -100,25 +118,22 @@ def get_current_game():
     if not current_game:
         return jsonify({'error': 'ゲーム中ではありません'}), 404
     
-    # 各プレイヤーの情報を取得
+    # 各プレイヤーの情報を並列取得
+    participants = current_game.get('participants', [])
+    participants_info = riot_client.get_participants_info([p['puuid'] for p in participants])
+    
     players = []
-    for participant in current_game.get('participants', []):
-        player_puuid = participant['puuid']
-        summoner = riot_client.get_summoner_by_puuid(player_puuid)
-        
-        ranked_stats = []
+    for participant in participants:
         rank_info = "Unranked"
-        if summoner:
-            ranked_stats = riot_client.get_ranked_stats(summoner['id']) or []
-            if ranked_stats:
-                for rank in ranked_stats:
-                    if rank['queueType'] == 'RANKED_SOLO_5x5':
-                        rank_info = format_rank(
-                            rank['tier'],
-                            rank.get('rank', ''),
-                            rank['leaguePoints']
-                        )
-                        break
+        ranked_stats = participants_info[participant['puuid']]['ranked_stats'] or []
+        for rank in ranked_stats:
+            if rank['queueType'] == 'RANKED_SOLO_5x5':
+                rank_info = format_rank(
+                    rank['tier'],
+                    rank.get('rank', ''),
+                    rank['leaguePoints']
+                )
+                break
         
         players.append({
             'riot_id': participant.get('riotId', 'Unknown'),
@@ -158,26 +173,24 @@ def balance_teams():
             return jsonify({'error': f'プレイヤーが見つかりません: {riot_id}'}), 404
         
         puuid = account['puuid']
-        summoner = riot_client.get_summoner_by_puuid(puuid)
         
         # ランク情報取得
         rank_score = 0
         rank_info = "Unranked"
-        if summoner:
-            ranked_stats = riot_client.get_ranked_stats(summoner['id']) or []
-            for rank in ranked_stats:
-                if rank['queueType'] == 'RANKED_SOLO_5x5':
-                    rank_score = MatchAnalyzer.get_rank_score(
-                        rank['tier'],
-                        rank.get('rank', 'I'),
-                        rank['leaguePoints']
-                    )
-                    rank_info = format_rank(
-                        rank['tier'],
-                        rank.get('rank', ''),
-                        rank['leaguePoints']
-                    )
-                    break
+        ranked_stats = riot_client.get_ranked_stats_by_puuid(puuid) or []
+        for rank in ranked_stats:
+            if rank['queueType'] == 'RANKED_SOLO_5x5':
+                rank_score = MatchAnalyzer.get_rank_score(
+                    rank['tier'],
+                    rank.get('rank', 'I'),
+                    rank['leaguePoints']
+                )
+                rank_info = format_rank(
+                    rank['tier'],
+                    rank.get('rank', ''),
+                    rank['leaguePoints']
+                )
+                break
         
         players_data.append({
             'riot_id': riot_id,
@@ -204,5 +217,14 @@ def balance_teams():
     })
 
 
+@app.route('/api/metrics')
+def get_metrics():
+    """Riot APIクライアントのメトリクス（?format=prometheus でテキスト形式）"""
+    data = collect_metrics()
+    if request.args.get('format') == 'prometheus':
+        return Response(render_prometheus(data), content_type=PROMETHEUS_CONTENT_TYPE)
+    return jsonify(data)
+
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,342 @@
+"""
+エンドツーエンドのベンチマーク
+
+Vercel関数（api/*.py のhandler）とFlaskのルートを、遅延付きのRiot APIスタンドイン
+（stub_riot.py）に対して実行し、シナリオごとに以下を計測する。
+
+    p50/p95/p99レイテンシ、リクエスト/秒、1リクエストあたりの上流呼び出し数、ピークメモリ
+
+使い方:
+    python benchmarks/run_benchmarks.py --latency 0.05 --iterations 50 --concurrency 4
+    python benchmarks/run_benchmarks.py --save-baseline benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --baseline benchmarks/baseline.json --threshold 0.2
+
+--baseline を指定すると、保存した結果より閾値以上悪化した項目を表示して終了コード1で終わる。
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+API_DIR = os.path.join(ROOT, 'api')
+
+# 試合データ永続ストアは実行ごとに結果が変わるため使わない（クライアントの読み込み前に設定する）
+os.environ['RIOT_MATCH_DB'] = ''
+sys.path.insert(0, ROOT)
+sys.path.insert(0, API_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_riot import StubRiotAPI, UNLIMITED_RATE_LIMIT  # noqa: E402
+from transport import set_default_transport  # noqa: E402
+
+
+# シナリオごとのプレイヤー番号の間隔（同じ実行内でキャッシュが当たらないようにする）
+PLAYERS_PER_SCENARIO = 10 ** 6
+# 1回のリクエストで使うプレイヤー番号の幅（チーム分け・観戦は10人分）
+PLAYER_STRIDE = 20
+
+# 悪化とみなす方向（True: 大きいほど悪い）
+COMPARED_METRICS = {
+    'p50_ms': True,
+    'p95_ms': True,
+    'requests_per_sec': False,
+    'upstream_calls_per_request': True,
+    'peak_memory_kb': True,
+    'error_rate': True,
+}
+
+
+def _call_handler(handler_cls, method: str, path: str, body: Optional[Dict] = None) -> int:
+    """
+    Vercel関数のhandlerをソケットなしで呼び出す
+
+    Returns:
+        HTTPステータス
+    """
+    raw = json.dumps(body).encode('utf-8') if body is not None else b''
+
+    class Invocation(handler_cls):
+        def __init__(self):
+            self.path = path
+            self.command = method
+            self.headers = {'Content-Length': str(len(raw)), 'Content-Type': 'application/json'}
+            self.rfile = io.BytesIO(raw)
+            self.wfile = io.BytesIO()
+            self.request_version = 'HTTP/1.1'
+            self.requestline = f"{method} {path} HTTP/1.1"
+            self.status = None
+
+        def send_response(self, code, message=None):
+            self.status = code
+
+        def send_header(self, keyword, value):
+            pass
+
+        def end_headers(self):
+            pass
+
+        def log_message(self, format, *args):
+            pass
+
+    invocation = Invocation()
+    getattr(invocation, f"do_{method}")()
+    return invocation.status or 500
+
+
+def _riot_ids(k: int, count: int = 10) -> List[str]:
+    return [f"Bench{k + i}#JP1" for i in range(count)]
+
+
+def build_scenarios(match_count: int) -> Dict[str, Callable[[int], int]]:
+    """
+    シナリオ名 → プレイヤー番号を受け取りステータスを返す関数
+
+    Flaskが読み込めない環境ではFlaskのシナリオを含めない
+    """
+    import match_history
+    import performance_analysis
+    import balance_teams
+    import current_game
+
+    scenarios = {
+        'handler:match_history': lambda k: _call_handler(
+            match_history.handler, 'GET', f"/api/match_history?game_name=Bench{k}&tag_line=JP1&count={match_count}"),
+        'handler:performance_analysis': lambda k: _call_handler(
+            performance_analysis.handler, 'POST', '/api/performance_analysis',
+            {'riot_id': f"Bench{k}#JP1", 'match_count': match_count}),
+        'handler:balance_teams': lambda k: _call_handler(
+            balance_teams.handler, 'POST', '/api/balance_teams', {'players': _riot_ids(k)}),
+        'handler:current_game': lambda k: _call_handler(
+            current_game.handler, 'GET', f"/api/current_game?game_name=Bench{k}&tag_line=JP1"),
+    }
+
+    try:
+        import app as flask_app
+    except ImportError as e:
+        print(f"Flaskのシナリオを省略します: {e}")
+        return scenarios
+
+    def flask_post(route: str, body: Dict) -> int:
+        with flask_app.app.test_client() as client:
+            return client.post(route, json=body).status_code
+
+    scenarios.update({
+        'flask:match-history': lambda k: flask_post(
+            '/api/match-history', {'game_name': f"Bench{k}", 'tag_line': 'JP1', 'count': match_count}),
+        'flask:current-game': lambda k: flask_post(
+            '/api/current-game', {'game_name': f"Bench{k}", 'tag_line': 'JP1'}),
+        'flask:balance-teams': lambda k: flask_post('/api/balance-teams', {'riot_ids': _riot_ids(k)}),
+    })
+    return scenarios
+
+
+def percentile(values: List[float], q: float) -> float:
+    """線形補間のパーセンタイル（q: 0〜100）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def run_scenario(call: Callable[[int], int], stub: StubRiotAPI, first_player: int, iterations: int,
+                 concurrency: int, warmup: int, memory_samples: int, warm: bool) -> Dict:
+    """
+    1シナリオを実行して計測
+
+    Args:
+        call: プレイヤー番号を受け取りステータスを返す関数
+        stub: 上流呼び出し数を数えるスタンドイン
+        first_player: このシナリオで使う最初のプレイヤー番号
+        iterations: 計測するリクエスト数
+        concurrency: 同時に送るリクエスト数
+        warmup: 計測前に送るリクエスト数
+        memory_samples: ピークメモリの計測に使うリクエスト数（逐次実行）
+        warm: 全リクエストで同じプレイヤーを使う（キャッシュが当たる状態を計測）
+
+    Returns:
+        計測結果
+    """
+    def player(i: int) -> int:
+        return first_player if warm else first_player + i * PLAYER_STRIDE
+
+    def timed(i: int) -> Tuple[float, int]:
+        started = time.perf_counter()
+        status = call(player(i))
+        return time.perf_counter() - started, status
+
+    for i in range(warmup):
+        call(player(iterations + memory_samples + i) if not warm else player(0))
+
+    calls_before = stub.snapshot()['calls']
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed, range(iterations)))
+    wall = time.perf_counter() - started
+    upstream_calls = stub.snapshot()['calls'] - calls_before
+
+    # トレースは処理を大きく遅くするため、レイテンシとは別に逐次実行で計測する
+    peak = 0
+    if memory_samples:
+        tracemalloc.start()
+        try:
+            for i in range(memory_samples):
+                tracemalloc.reset_peak()
+                call(player(iterations + i))
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+
+    latencies = [elapsed for elapsed, _ in results]
+    errors = sum(1 for _, status in results if not 200 <= status < 300)
+    return {
+        'iterations': iterations,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'max_ms': round(max(latencies) * 1000, 2) if latencies else 0.0,
+        'requests_per_sec': round(iterations / wall, 2) if wall > 0 else 0.0,
+        'upstream_calls_per_request': round(upstream_calls / iterations, 2) if iterations else 0.0,
+        'peak_memory_kb': round(peak / 1024, 1),
+        'error_rate': round(errors / iterations, 4) if iterations else 0.0,
+    }
+
+
+def compare_with_baseline(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float,
+                          min_delta_ms: float) -> List[str]:
+    """
+    保存した結果と比較し、閾値以上悪化した項目を列挙
+
+    Args:
+        results: 今回の結果 {シナリオ: 計測結果}
+        baseline: 保存した結果 {シナリオ: 計測結果}
+        threshold: 悪化とみなす割合（0.2なら20%）
+        min_delta_ms: これ未満のレイテンシの差は無視する（ミリ秒）
+
+    Returns:
+        悪化した項目の説明のリスト
+    """
+    regressions = []
+    for scenario, base in baseline.items():
+        current = results.get(scenario)
+        if current is None:
+            continue
+        for metric, higher_is_worse in COMPARED_METRICS.items():
+            if metric not in base or metric not in current:
+                continue
+            before, after = base[metric], current[metric]
+            if higher_is_worse:
+                limit = before * (1 + threshold)
+                worse = after > limit and (not metric.endswith('_ms') or after - before >= min_delta_ms)
+                # 0件だったエラーが発生した場合も悪化とする
+                worse = worse or (metric == 'error_rate' and before == 0 and after > 0)
+            else:
+                limit = before * (1 - threshold)
+                worse = after < limit
+            if worse:
+                regressions.append(f"{scenario} {metric}: {before} -> {after}")
+    return regressions
+
+
+def print_table(results: Dict[str, Dict]):
+    """結果を表形式で表示"""
+    columns = ('p50_ms', 'p95_ms', 'p99_ms', 'requests_per_sec', 'upstream_calls_per_request',
+               'peak_memory_kb', 'error_rate')
+    headers = ('p50 ms', 'p95 ms', 'p99 ms', 'req/s', 'calls/req', 'peak KB', 'errors')
+    width = max(len(name) for name in results) if results else 10
+    print(f"{'scenario':<{width}}  " + '  '.join(f"{h:>9}" for h in headers))
+    for name, result in results.items():
+        print(f"{name:<{width}}  " + '  '.join(f"{result[c]:>9}" for c in columns))
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='match_history / performance_analysis / balance_teams / '
+                                                 'current_game のエンドツーエンドベンチマーク')
+    parser.add_argument('--latency', type=float, default=0.03, help='スタンドインの応答遅延（秒）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='応答遅延のばらつき（秒）')
+    parser.add_argument('--rate-limit', default=UNLIMITED_RATE_LIMIT,
+                        help='スタンドインが返すX-App-Rate-Limit（例 "20:1,100:120"。省略時は事実上制限なし）')
+    parser.add_argument('--iterations', type=int, default=30, help='シナリオごとの計測リクエスト数')
+    parser.add_argument('--concurrency', type=int, default=4, help='同時に送るリクエスト数')
+    parser.add_argument('--warmup', type=int, default=2, help='計測前に送るリクエスト数')
+    parser.add_argument('--memory-samples', type=int, default=3, help='ピークメモリの計測に使うリクエスト数')
+    parser.add_argument('--match-count', type=int, default=20, help='戦績・パフォーマンス分析の試合数')
+    parser.add_argument('--warm', action='store_true', help='同じプレイヤーを繰り返し、キャッシュが当たる状態を計測')
+    parser.add_argument('--scenario', action='append', default=None,
+                        help='実行するシナリオ（部分一致、複数指定可。省略時はすべて）')
+    parser.add_argument('--json', dest='json_path', default=None, help='結果をJSONで保存するパス')
+    parser.add_argument('--baseline', default=None, help='比較するベースラインのJSON')
+    parser.add_argument('--save-baseline', default=None, help='結果をベースラインとして保存するパス')
+    parser.add_argument('--threshold', type=float, default=0.2, help='悪化とみなす割合')
+    parser.add_argument('--min-delta-ms', type=float, default=5.0, help='これ未満のレイテンシの差は無視する')
+    parser.add_argument('--verbose', action='store_true', help='ハンドラー・クライアントのログを表示')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    stub = StubRiotAPI(latency=args.latency, jitter=args.jitter, rate_limit=args.rate_limit).start()
+    set_default_transport(stub.transport())
+    try:
+        scenarios = build_scenarios(args.match_count)
+        if args.scenario:
+            scenarios = {name: call for name, call in scenarios.items()
+                         if any(pattern in name for pattern in args.scenario)}
+
+        results = {}
+        with open(os.devnull, 'w') as devnull:
+            # ハンドラーのデバッグ出力は表示しない（端末への書き込み時間が計測に混ざるため）
+            with contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+                for index, (name, call) in enumerate(scenarios.items(), start=1):
+                    results[name] = run_scenario(
+                        call, stub, index * PLAYERS_PER_SCENARIO, args.iterations, args.concurrency,
+                        args.warmup, args.memory_samples, args.warm)
+    finally:
+        set_default_transport(None)
+        stub.stop()
+
+    print(f"latency={args.latency}s jitter={args.jitter}s concurrency={args.concurrency} "
+          f"iterations={args.iterations} warm={args.warm}")
+    print_table(results)
+
+    report = {
+        'config': {key: value for key, value in vars(args).items()
+                   if key not in ('json_path', 'baseline', 'save_baseline')},
+        'results': results,
+    }
+    for path in (args.json_path, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"保存しました: {path}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        # 条件が違う結果との比較は参考程度にしかならない
+        different = [key for key in ('latency', 'jitter', 'rate_limit', 'concurrency', 'match_count', 'warm')
+                     if key in baseline.get('config', {}) and baseline['config'][key] != getattr(args, key)]
+        if different:
+            print(f"注意: ベースラインと条件が異なります ({', '.join(different)})")
+        regressions = compare_with_baseline(results, baseline.get('results', {}), args.threshold,
+                                            args.min_delta_ms)
+        if regressions:
+            print(f"\nベースラインから{args.threshold:.0%}以上悪化しました:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nベースライン比で悪化はありません（閾値 {args.threshold:.0%}）")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
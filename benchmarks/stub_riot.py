@@ -0,0 +1,359 @@
+"""
+ベンチマーク用のRiot APIスタンドイン - 合成データを遅延付きで返すローカルHTTPサーバー
+
+応答はURLから決定的に生成する。プレイヤー番号kは「Bench{k}」というゲーム名、
+または "bench-{k:010d}-..." 形式のPUUIDに埋め込まれているため、状態を持たない。
+"""
+import hashlib
+import json
+import multiprocessing
+import random
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, unquote, urlsplit
+
+try:
+    from transport import HttpTransport
+except ImportError:
+    from api.transport import HttpTransport
+
+
+POSITIONS = ['TOP', 'JUNGLE', 'MIDDLE', 'BOTTOM', 'UTILITY']
+TIERS = ['IRON', 'BRONZE', 'SILVER', 'GOLD', 'PLATINUM', 'EMERALD', 'DIAMOND']
+DIVISIONS = ['IV', 'III', 'II', 'I']
+
+# 1プレイヤーあたりの試合ID数（プレイヤーkの試合は JP1_{k * MATCHES_PER_PLAYER} から始まる）
+MATCHES_PER_PLAYER = 1000
+
+# 既定で返すX-App-Rate-Limit。ヘッダーがないとレートリミッターは開発キーの上限
+# （20:1,100:120）を仮定するため、計測の妨げにならない大きな値を返す
+UNLIMITED_RATE_LIMIT = '100000:1'
+
+# 実データに近い大きさにするためのchallenges項目数（match-v5は1人あたり100項目以上）
+CHALLENGE_FIELDS = 100
+
+
+def player_number(game_name: str) -> int:
+    """ゲーム名からプレイヤー番号を取得（Bench{k}以外はハッシュから決める）"""
+    match = re.fullmatch(r'Bench(\d+)', game_name)
+    if match:
+        return int(match.group(1))
+    return int(hashlib.sha256(game_name.encode('utf-8')).hexdigest()[:8], 16) % 10 ** 6
+
+
+def puuid_for(k: int) -> str:
+    """プレイヤー番号からPUUIDを作成（実際のPUUIDと同じ78文字）"""
+    return f"bench-{k:010d}-" + hashlib.sha256(str(k).encode('ascii')).hexdigest()[:61]
+
+
+def number_from_puuid(puuid: str) -> int:
+    """PUUIDからプレイヤー番号を取得"""
+    try:
+        return int(puuid.split('-')[1])
+    except (IndexError, ValueError):
+        return 0
+
+
+def _participant(match_number: int, k: int, slot: int, rng: random.Random) -> Dict:
+    """試合の参加者1人分"""
+    participant = {
+        'puuid': puuid_for(k),
+        'riotIdGameName': f"Bench{k}",
+        'riotIdTagline': 'JP1',
+        'summonerName': f"Bench{k}",
+        'championName': f"Champion{rng.randint(1, 160)}",
+        'championId': rng.randint(1, 950),
+        'champLevel': rng.randint(11, 18),
+        'kills': rng.randint(0, 15),
+        'deaths': rng.randint(0, 12),
+        'assists': rng.randint(0, 25),
+        'win': slot < 5 if match_number % 2 == 0 else slot >= 5,
+        'teamId': 100 if slot < 5 else 200,
+        'teamPosition': POSITIONS[slot % 5],
+        'totalMinionsKilled': rng.randint(20, 300),
+        'neutralMinionsKilled': rng.randint(0, 150),
+        'goldEarned': rng.randint(6000, 18000),
+        'goldSpent': rng.randint(5000, 17000),
+        'totalDamageDealt': rng.randint(40000, 250000),
+        'totalDamageDealtToChampions': rng.randint(4000, 50000),
+        'physicalDamageDealtToChampions': rng.randint(0, 30000),
+        'magicDamageDealtToChampions': rng.randint(0, 30000),
+        'trueDamageDealtToChampions': rng.randint(0, 5000),
+        'totalDamageTaken': rng.randint(8000, 50000),
+        'damageSelfMitigated': rng.randint(2000, 40000),
+        'visionScore': rng.randint(5, 90),
+        'wardsPlaced': rng.randint(0, 40),
+        'wardsKilled': rng.randint(0, 15),
+        'visionWardsBoughtInGame': rng.randint(0, 8),
+        'summoner1Id': 4,
+        'summoner2Id': rng.choice([7, 11, 12, 14]),
+        'largestKillingSpree': rng.randint(0, 8),
+        'largestMultiKill': rng.randint(0, 3),
+        'doubleKills': rng.randint(0, 3),
+        'tripleKills': rng.randint(0, 1),
+        'quadraKills': 0,
+        'pentaKills': 0,
+        'firstBloodKill': False,
+        'firstBloodAssist': False,
+        'firstTowerKill': False,
+        'firstTowerAssist': False,
+        'turretKills': rng.randint(0, 4),
+        'inhibitorKills': rng.randint(0, 2),
+        'dragonKills': rng.randint(0, 3),
+        'baronKills': rng.randint(0, 1),
+        'perks': {
+            'styles': [
+                {'style': 8000, 'selections': [{'perk': 8005 + i} for i in range(4)]},
+                {'style': 8100, 'selections': [{'perk': 8126 + i} for i in range(2)]},
+            ],
+            'statPerks': {'offense': 5008, 'flex': 5008, 'defense': 5002},
+        },
+        'challenges': {f"challenge{i}": rng.random() * 100 for i in range(CHALLENGE_FIELDS)},
+    }
+    for i in range(7):
+        participant[f"item{i}"] = rng.choice([0, 1001, 3006, 3031, 3078, 3153, 6672])
+    return participant
+
+
+def match_detail(match_id: str) -> Optional[Dict]:
+    """
+    試合詳細を生成
+
+    プレイヤーkの試合には、k本人と k+1〜k+9 の10人が参加する
+    """
+    try:
+        match_number = int(match_id.split('_', 1)[1])
+    except (IndexError, ValueError):
+        return None
+    rng = random.Random(match_number)
+    owner = match_number // MATCHES_PER_PLAYER
+    participants = [_participant(match_number, owner + slot, slot, rng) for slot in range(10)]
+    duration = rng.randint(1200, 2400)
+    created = 1_700_000_000_000 + match_number * 1000
+    return {
+        'metadata': {
+            'dataVersion': '2',
+            'matchId': match_id,
+            'participants': [p['puuid'] for p in participants],
+        },
+        'info': {
+            'gameCreation': created,
+            'gameStartTimestamp': created + 30_000,
+            'gameEndTimestamp': created + 30_000 + duration * 1000,
+            'gameDuration': duration,
+            'gameMode': 'CLASSIC',
+            'gameType': 'MATCHED_GAME',
+            'gameVersion': '14.20.620.1234',
+            'mapId': 11,
+            'platformId': 'JP1',
+            'queueId': 420,
+            'tournamentCode': '',
+            'participants': participants,
+            'teams': [
+                {
+                    'teamId': team_id,
+                    'win': participants[0 if team_id == 100 else 5]['win'],
+                    'bans': [{'championId': rng.randint(1, 950), 'pickTurn': i + 1} for i in range(5)],
+                    'objectives': {
+                        name: {'first': False, 'kills': rng.randint(0, 4)}
+                        for name in ('baron', 'champion', 'dragon', 'inhibitor', 'riftHerald', 'tower')
+                    },
+                }
+                for team_id in (100, 200)
+            ],
+        },
+    }
+
+
+def _league_entries(k: int) -> List[Dict]:
+    """ランク情報（プレイヤー番号から決定的に決める）"""
+    rng = random.Random(k)
+    return [{
+        'queueType': 'RANKED_SOLO_5x5',
+        'tier': rng.choice(TIERS),
+        'rank': rng.choice(DIVISIONS),
+        'leaguePoints': rng.randint(0, 99),
+        'wins': rng.randint(10, 200),
+        'losses': rng.randint(10, 200),
+        'puuid': puuid_for(k),
+    }]
+
+
+def route(path: str, query: Dict[str, List[str]]):
+    """
+    パスに対応する応答本文を生成
+
+    Returns:
+        JSONに変換する値（対応するデータがなければNone）
+    """
+    parts = [unquote(p) for p in path.strip('/').split('/')]
+    tail = parts[-1] if parts else ''
+    if '/accounts/by-riot-id/' in path:
+        k = player_number(parts[-2])
+        return {'puuid': puuid_for(k), 'gameName': parts[-2], 'tagLine': tail}
+    if '/accounts/by-puuid/' in path:
+        k = number_from_puuid(tail)
+        return {'puuid': tail, 'gameName': f"Bench{k}", 'tagLine': 'JP1'}
+    if '/summoners/by-puuid/' in path:
+        k = number_from_puuid(tail)
+        return {'id': f"summoner-{k}", 'puuid': tail, 'summonerLevel': 30 + k % 500,
+                'profileIconId': k % 30, 'revisionDate': 1_700_000_000_000}
+    if '/entries/by-summoner/' in path:
+        return _league_entries(int(tail.split('-')[-1]) if tail.startswith('summoner-') else 0)
+    if '/entries/by-puuid/' in path:
+        return _league_entries(number_from_puuid(tail))
+    if '/matches/by-puuid/' in path and tail == 'ids':
+        k = number_from_puuid(parts[-2])
+        start = int(query.get('start', ['0'])[0])
+        count = int(query.get('count', ['20'])[0])
+        first = k * MATCHES_PER_PLAYER
+        return [f"JP1_{first + i}" for i in range(start, min(start + count, MATCHES_PER_PLAYER))]
+    if tail == 'timeline':
+        return {'metadata': {'matchId': parts[-2]}, 'info': {'frameInterval': 60000, 'frames': []}}
+    if '/matches/' in path:
+        return match_detail(tail)
+    if '/active-games/by-summoner/' in path:
+        k = number_from_puuid(tail)
+        return {
+            'gameId': k,
+            'gameMode': 'CLASSIC',
+            'gameType': 'MATCHED',
+            'gameLength': 600,
+            'mapId': 11,
+            'gameQueueConfigId': 420,
+            'participants': [
+                {'puuid': puuid_for(k + slot), 'riotId': f"Bench{k + slot}#JP1", 'championId': 1 + slot,
+                 'teamId': 100 if slot < 5 else 200, 'spell1Id': 4, 'spell2Id': 14}
+                for slot in range(10)
+            ],
+        }
+    if '/champion-masteries/by-puuid/' in path:
+        rng = random.Random(number_from_puuid(parts[-1]))
+        return [{'championId': rng.randint(1, 950), 'championLevel': rng.randint(1, 7),
+                 'championPoints': rng.randint(1000, 500000)} for _ in range(20)]
+    return None
+
+
+def _handler_class(latency: float, jitter: float, rate_limit: str, calls, bytes_sent):
+    """スタンドインのリクエストハンドラー（calls/bytes_sentはプロセス間で共有するカウンタ）"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            parsed = urlsplit(self.path)
+            delay = latency + (random.uniform(0, jitter) if jitter else 0.0)
+            if delay > 0:
+                time.sleep(delay)
+            body = route(parsed.path, parse_qs(parsed.query))
+            data = json.dumps(body if body is not None else {
+                'status': {'message': 'Data not found', 'status_code': 404}
+            }).encode('utf-8')
+            with calls.get_lock():
+                calls.value += 1
+            with bytes_sent.get_lock():
+                bytes_sent.value += len(data)
+            self.send_response(200 if body is not None else 404)
+            self.send_header('Content-Type', 'application/json;charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            if rate_limit:
+                self.send_header('X-App-Rate-Limit', rate_limit)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def _serve(host: str, latency: float, jitter: float, rate_limit: str, calls, bytes_sent, port, ready):
+    """子プロセスで待ち受ける（portに実際のポートを書き込んでreadyを通知）"""
+    server = ThreadingHTTPServer((host, port.value), _handler_class(latency, jitter, rate_limit, calls, bytes_sent))
+    server.daemon_threads = True
+    port.value = server.server_address[1]
+    ready.set()
+    server.serve_forever()
+
+
+class StubRiotAPI:
+    """
+    ローカルで起動するRiot APIのスタンドイン
+
+    応答の生成とJSON変換が計測対象のプロセスのCPU（GIL）を使わないよう、別プロセスで待ち受ける。
+
+    使い方:
+        stub = StubRiotAPI(latency=0.05).start()
+        set_default_transport(stub.transport())
+        ...
+        stub.stop()
+    """
+
+    def __init__(self, latency: float = 0.03, jitter: float = 0.0, rate_limit: str = UNLIMITED_RATE_LIMIT,
+                 host: str = '127.0.0.1', port: int = 0):
+        """
+        初期化
+
+        Args:
+            latency: 応答までの遅延（秒）
+            jitter: 遅延に加える0〜jitter秒のばらつき
+            rate_limit: X-App-Rate-Limitヘッダーの値（例 "20:1,100:120"。空なら送らない）
+            host: 待ち受けるアドレス
+            port: 待ち受けるポート（0なら空いているポート）
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.host = host
+        self._context = multiprocessing.get_context('spawn')
+        self._calls = self._context.Value('q', 0)
+        self._bytes_sent = self._context.Value('q', 0)
+        self._port = self._context.Value('i', port)
+        self._process = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self._port.value}"
+
+    def start(self, timeout: float = 30) -> "StubRiotAPI":
+        """子プロセスで待ち受けを開始（待ち受けを始めるまで待つ）"""
+        ready = self._context.Event()
+        self._process = self._context.Process(
+            target=_serve, daemon=True,
+            args=(self.host, self.latency, self.jitter, self.rate_limit, self._calls, self._bytes_sent,
+                  self._port, ready))
+        self._process.start()
+        if not ready.wait(timeout):
+            self.stop()
+            raise RuntimeError('スタンドインのRiot APIを起動できませんでした')
+        return self
+
+    def stop(self):
+        """待ち受けを終了"""
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+            self._process = None
+
+    def snapshot(self) -> Dict[str, int]:
+        """現在までの受信数と送信バイト数"""
+        return {'calls': self._calls.value, 'bytes_sent': self._bytes_sent.value}
+
+    def transport(self) -> "StubTransport":
+        """*.api.riotgames.com 宛てのリクエストをこのサーバーへ送るトランスポート"""
+        return StubTransport(self.base_url)
+
+
+class StubTransport(HttpTransport):
+    """リクエストのホストをスタンドインに差し替えて送信する"""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip('/')
+
+    def get(self, url: str, headers: Optional[Dict] = None, timeout=None):
+        parsed = urlsplit(url)
+        target = self.base_url + parsed.path + (f"?{parsed.query}" if parsed.query else '')
+        return super().get(target, headers=headers, timeout=timeout)
@@ -1,9 +1,10 @@
 """
 Discord Bot実装
 """
+import asyncio
 import discord
 from discord.ext import commands
-from riot_api import RiotAPIClient
+from riot_api import RiotAPIClient, PRIORITY_BOT, set_request_context
 from game_utils import MatchAnalyzer, TeamBalancer, format_rank
 import os
 from dotenv import load_dotenv
@@ -15,7 +16,14 @@ intents = discord.Intents.default()
 intents.message_content = True
 
 bot = commands.Bot(command_prefix='!lol ', intents=intents)
-riot_client = RiotAPIClient()
+riot_client = RiotAPIClient(priority=PRIORITY_BOT)
+
+
+@bot.before_invoke
+async def tag_request_context(ctx):
+    """コマンド内のRiot APIリクエストをBotクラスとして、ユーザーごとに公平に割り当てる"""
+    # コマンドごとのタスク内でのみ有効（asyncio.to_threadにも引き継がれる）
+    set_request_context(PRIORITY_BOT, f"discord:{ctx.author.id}")
 
 
 @bot.event
@@ -87,17 +95,21 @@ async def match_history(ctx, riot_id: str, count: int = 10):
         
         # 最近の試合を表示
         matches_text = []
-        for i, match_id in enumerate(match_ids[:count], 1):
-            match_data = riot_client.get_match_detail(match_id)
-            if match_data:
-                player_stats = MatchAnalyzer.get_player_stats(match_data, puuid)
-                if player_stats:
-                    result = "🟢 勝利" if player_stats['win'] else "🔴 敗北"
-                    matches_text.append(
-                        f"{i}. {result} | {player_stats['champion']} | "
-                        f"{player_stats['kills']}/{player_stats['deaths']}/{player_stats['assists']} "
-                        f"(KDA: {player_stats['kda']})"
-                    )
+        failed_count = 0
+        # 試合詳細を並列取得（イベントループを塞がないよう別スレッドで実行）
+        details = await asyncio.to_thread(riot_client.get_match_details_bulk, match_ids[:count])
+        for i, detail in enumerate(details, 1):
+            if detail['error']:
+                failed_count += 1
+                continue
+            player_stats = MatchAnalyzer.get_player_stats(detail['match_data'], puuid)
+            if player_stats:
+                result = "🟢 勝利" if player_stats['win'] else "🔴 敗北"
+                matches_text.append(
+                    f"{i}. {result} | {player_stats['champion']} | "
+                    f"{player_stats['kills']}/{player_stats['deaths']}/{player_stats['assists']} "
+                    f"(KDA: {player_stats['kda']})"
+                )
         
         if matches_text:
             embed.add_field(
@@ -106,6 +118,9 @@ async def match_history(ctx, riot_id: str, count: int = 10):
                 inline=False
             )
         
+        if failed_count:
+            embed.set_footer(text=f"{failed_count}試合の取得に失敗しました")
+        
         await ctx.send(embed=embed)
         
     except Exception as e:
@@ -155,21 +170,23 @@ async def current_game(ctx, riot_id: str):
         team1_players = []
         team2_players = []
         
-        for participant in current_game.get('participants', []):
-            player_puuid = participant['puuid']
-            summoner = riot_client.get_summoner_by_puuid(player_puuid)
-            
+        # 各プレイヤーのランクを並列取得（イベントループを止めないよう別スレッドで待つ）
+        participants = current_game.get('participants', [])
+        participants_info = await asyncio.to_thread(
+            riot_client.get_participants_info, [p['puuid'] for p in participants]
+        )
+        
+        for participant in participants:
             rank_info = "Unranked"
-            if summoner:
-                ranked_stats = riot_client.get_ranked_stats(summoner['id']) or []
-                for rank in ranked_stats:
-                    if rank['queueType'] == 'RANKED_SOLO_5x5':
-                        rank_info = format_rank(
-                            rank['tier'],
-                            rank.get('rank', ''),
-                            rank['leaguePoints']
-                        )
-                        break
+            ranked_stats = participants_info[participant['puuid']]['ranked_stats'] or []
+            for rank in ranked_stats:
+                if rank['queueType'] == 'RANKED_SOLO_5x5':
+                    rank_info = format_rank(
+                        rank['tier'],
+                        rank.get('rank', ''),
+                        rank['leaguePoints']
+                    )
+                    break
             
             player_text = f"{participant.get('riotId', 'Unknown')} - {rank_info}"
             
@@ -229,26 +246,24 @@ async def balance(ctx, *riot_ids: str):
                 return
             
             puuid = account['puuid']
-            summoner = riot_client.get_summoner_by_puuid(puuid)
             
             # ランク情報取得
             rank_score = 0
             rank_info = "Unranked"
-            if summoner:
-                ranked_stats = riot_client.get_ranked_stats(summoner['id']) or []
-                for rank in ranked_stats:
-                    if rank['queueType'] == 'RANKED_SOLO_5x5':
-                        rank_score = MatchAnalyzer.get_rank_score(
-                            rank['tier'],
-                            rank.get('rank', 'I'),
-                            rank['leaguePoints']
-                        )
-                        rank_info = format_rank(
-                            rank['tier'],
-                            rank.get('rank', ''),
-                            rank['leaguePoints']
-                        )
-                        break
+            ranked_stats = riot_client.get_ranked_stats_by_puuid(puuid) or []
+            for rank in ranked_stats:
+                if rank['queueType'] == 'RANKED_SOLO_5x5':
+                    rank_score = MatchAnalyzer.get_rank_score(
+                        rank['tier'],
+                        rank.get('rank', 'I'),
+                        rank['leaguePoints']
+                    )
+                    rank_info = format_rank(
+                        rank['tier'],
+                        rank.get('rank', ''),
+                        rank['leaguePoints']
+                    )
+                    break
             
             players_data.append({
                 'riot_id': riot_id,
@@ -23,11 +23,16 @@ from api.utils import (
     balance_teams,
     calculate_team_average
 )
+# api/をパスに追加済みのため、クライアントと同じモジュールとして読み込む（集計を共有する）
+from client_metrics import collect_metrics, render_prometheus, PROMETHEUS_CONTENT_TYPE
 
 
 class LocalTestHandler(SimpleHTTPRequestHandler):
     def do_GET(self):
         """静的ファイルを提供"""
+        parsed_path = urlparse(self.path)
+        if parsed_path.path == '/api/metrics':
+            return self.handle_metrics(parse_qs(parsed_path.query))
         if self.path == '/' or self.path == '/index.html':
             self.path = '/index.html'
         return SimpleHTTPRequestHandler.do_GET(self)
@@ -80,19 +85,22 @@ class LocalTestHandler(SimpleHTTPRequestHandler):
                 return
             
             matches = []
-            for match_id in match_ids[:count]:
-                match_data = riot_client.get_match_detail(match_id)
-                if match_data:
-                    player_stats = get_player_stats(match_data, puuid)
-                    if player_stats:
-                        matches.append({
-                            'match_id': match_id,
-                            'game_duration': format_game_duration(
-                                match_data['info']['gameDuration']
-                            ),
-                            'game_mode': match_data['info']['gameMode'],
-                            'stats': player_stats
-                        })
+            failed_matches = []
+            for result in riot_client.get_match_details_bulk(match_ids[:count]):
+                match_data = result['match_data']
+                if result['error']:
+                    failed_matches.append({'match_id': result['match_id'], 'error': result['error']})
+                    continue
+                player_stats = get_player_stats(match_data, puuid)
+                if player_stats:
+                    matches.append({
+                        'match_id': result['match_id'],
+                        'game_duration': format_game_duration(
+                            match_data['info']['gameDuration']
+                        ),
+                        'game_mode': match_data['info']['gameMode'],
+                        'stats': player_stats
+                    })
             
             self.send_json_response({
                 'summoner': {
@@ -101,7 +109,8 @@ class LocalTestHandler(SimpleHTTPRequestHandler):
                     'level': summoner.get('summonerLevel') if summoner else 'N/A'
                 },
                 'ranked_stats': ranked_stats,
-                'matches': matches
+                'matches': matches,
+                'failed_matches': failed_matches
             })
             
         except Exception as e:
@@ -135,14 +144,14 @@ class LocalTestHandler(SimpleHTTPRequestHandler):
                 self.send_json_response({'error': 'ゲーム中ではありません'}, 404)
                 return
             
-            # 各プレイヤーの情報を取得
+            # 各プレイヤーの情報を並列取得
+            participants = current_game.get('participants', [])
+            participants_info = riot_client.get_participants_info([p['puuid'] for p in participants])
+            
             players = []
-            for participant in current_game.get('participants', []):
-                player_puuid = participant['puuid']
-                summoner = riot_client.get_summoner_by_puuid(player_puuid)
-                
+            for participant in participants:
                 rank_info = "Unranked"
-                ranked_stats = riot_client.get_ranked_stats_by_puuid(player_puuid) or []
+                ranked_stats = participants_info[participant['puuid']]['ranked_stats'] or []
                 if ranked_stats:
                     for rank in ranked_stats:
                         if rank['queueType'] == 'RANKED_SOLO_5x5':
@@ -198,7 +207,6 @@ class LocalTestHandler(SimpleHTTPRequestHandler):
                     return
                 
                 puuid = account['puuid']
-                summoner = riot_client.get_summoner_by_puuid(puuid)
                 
                 # ランク情報取得
                 rank_score = 0
@@ -249,6 +257,19 @@ class LocalTestHandler(SimpleHTTPRequestHandler):
             traceback.print_exc()
             self.send_json_response({'error': str(e)}, 500)
     
+    def handle_metrics(self, query):
+        """クライアント層のメトリクス（?format=prometheus でテキスト形式）"""
+        data = collect_metrics()
+        if query.get('format', [''])[0] == 'prometheus':
+            body = render_prometheus(data).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', PROMETHEUS_CONTENT_TYPE)
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self.send_json_response(data)
+    
     def send_json_response(self, data, status_code=200):
         """JSON レスポンスを送信"""
         self.send_response(status_code)
@@ -292,6 +313,7 @@ def main():
     print()
     print("利用可能なエンドポイント:")
     print(f"  - GET  http://localhost:{port}/")
+    print(f"  - GET  http://localhost:{port}/api/metrics")
     print(f"  - POST http://localhost:{port}/api/match_history")
     print(f"  - POST http://localhost:{port}/api/current_game")
     print(f"  - POST http://localhost:{port}/api/balance_teams")
@@ -0,0 +1,292 @@
+"""
+テスト用スクリプト - APIモジュールの動作確認（Riot APIに接続せずに実行できるもの）
+
+pytest でも、python test_backend.py でも実行できる
+"""
+import bisect
+import json
+import os
+import random
+import sys
+import tempfile
+
+# APIモジュールのパスを追加
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+
+from client_metrics import ClientMetrics
+from deadline import decode_continuation_token, encode_continuation_token
+from key_pool import KeyPool
+from match_store import MatchStore
+from match_sync import MatchIdSync
+from percentiles import KLLSketch, PercentileIndex
+from rate_limiter import RateLimiter
+from resilience import CircuitBreakerRegistry
+from response_cache import ResponseCache
+from riot_client import RiotAPIClient
+from transport import Transport, TransportResponse
+
+
+def _temp_store() -> MatchStore:
+    """テストごとに空のストアを作成"""
+    directory = tempfile.mkdtemp(prefix='lol_test_')
+    return MatchStore(os.path.join(directory, 'matches.sqlite3'))
+
+
+def _match(match_id: str, game_creation: int, with_participants: bool = False) -> dict:
+    """試合詳細（with_participants=Falseなら参加者のいない最小限のもの）"""
+    rng = random.Random(match_id)
+    positions = ['TOP', 'JUNGLE', 'MIDDLE', 'BOTTOM', 'UTILITY']
+    participants = [{
+        'puuid': f'p{i}', 'championName': f'Champ{rng.randint(1, 5)}', 'teamPosition': positions[i % 5],
+        'teamId': 100 if i < 5 else 200, 'win': i < 5,
+        'kills': rng.randint(0, 15), 'deaths': rng.randint(0, 10), 'assists': rng.randint(0, 20),
+        'totalMinionsKilled': rng.randint(20, 250), 'neutralMinionsKilled': rng.randint(0, 80),
+        'goldEarned': rng.randint(6000, 16000), 'visionScore': rng.randint(5, 80),
+        'totalDamageDealtToChampions': rng.randint(5000, 40000),
+    } for i in range(10)] if with_participants else []
+    return {
+        'metadata': {'matchId': match_id, 'participants': [p['puuid'] for p in participants]},
+        'info': {'gameCreation': game_creation, 'gameDuration': 1800, 'queueId': 420, 'gameVersion': '14.1.1',
+                 'participants': participants},
+    }
+
+
+class _FakeMatchIds:
+    """ids エンドポイントの代わり（新しい順の試合IDを start/count/startTime で返す）"""
+
+    def __init__(self):
+        self.matches = []  # (試合ID, 開始時刻ミリ秒) の新しい順
+        self.calls = []
+
+    def add(self, match_id: str, game_creation: int):
+        self.matches.insert(0, (match_id, game_creation))
+
+    def __call__(self, start, count, start_time=None):
+        self.calls.append((start, count, start_time))
+        ids = [match_id for match_id, creation in self.matches
+               if start_time is None or creation // 1000 >= start_time]
+        return ids[start:start + count]
+
+
+class _FakeRiot(Transport):
+    """Riot APIの代わり（revokedに入れたキーには403を返す）"""
+
+    def __init__(self, revoked):
+        self.revoked = set(revoked)
+        self.keys_seen = []
+
+    def get(self, url, headers=None, timeout=None):
+        key = (headers or {}).get('X-Riot-Token')
+        self.keys_seen.append(key)
+        if key in self.revoked:
+            return TransportResponse(url, 403, {}, b'{"status": {"status_code": 403}}')
+        return TransportResponse(url, 200, {}, json.dumps({'puuid': 'p1'}).encode('utf-8'))
+
+
+def test_match_sync_watermark():
+    """試合IDの差分同期: 2回目以降は最新の既知の試合の開始時刻をstartTimeに指定する"""
+    print("\n=== 試合IDの差分同期 テスト ===\n")
+    store = _temp_store()
+    server = _FakeMatchIds()
+    for i in range(1, 4):
+        creation = 1700000000000 + i * 60000
+        server.add(f'JP1_{i}', creation)
+        store.put(_match(f'JP1_{i}', creation))
+    sync = MatchIdSync(store, refresh_interval=0)
+
+    assert sync.recent('p1', (), 3, server) == ['JP1_3', 'JP1_2', 'JP1_1']
+    assert server.calls[-1] == (0, 3, None)
+    print("✓ 初回は先頭から取得")
+
+    server.add('JP1_4', 1700000000000 + 4 * 60000)
+    server.add('JP1_5', 1700000000000 + 5 * 60000)
+    assert sync.recent('p1', (), 3, server) == ['JP1_5', 'JP1_4', 'JP1_3']
+    watermark = (1700000000000 + 3 * 60000) // 1000
+    assert server.calls[-1][2] == watermark
+    print(f"✓ 2回目は startTime={watermark}（JP1_3の開始時刻）以降だけを取得")
+
+    # startTime以降のページには既知の試合（JP1_3）も含まれるが、重複させない
+    status = sync.get_status('p1')
+    assert status['known_ids'] == 5 and status['newest'] == 'JP1_5'
+    print("✓ 既知の試合IDと重複せずに統合")
+
+
+def test_match_sync_dedupes_pages():
+    """試合IDの差分同期: ページ内・ページ間の重複を除く"""
+    print("\n=== 試合IDの重複除去 テスト ===\n")
+    # 2ページ目の取得前に新しい試合が終わり、開始位置が1つずれた状態
+    pages = {0: ['JP1_3', 'JP1_3', 'JP1_2'], 2: ['JP1_2', 'JP1_1']}
+
+    def fetch_page(start, count, start_time=None):
+        return pages.get(start, [])
+
+    sync = MatchIdSync(None, refresh_interval=0)
+    ids = sync.recent('p1', (), 3, fetch_page)
+    assert ids == ['JP1_3', 'JP1_2', 'JP1_1'], ids
+    print(f"✓ 重複なし: {ids}")
+
+
+def test_continuation_token_tamper():
+    """continuationトークン: 本体・署名を書き換えたトークンは受け付けない"""
+    print("\n=== continuationトークンの改ざん テスト ===\n")
+    data = {'puuid': 'p1', 'match_ids': ['JP1_1', 'JP1_2']}
+    token = encode_continuation_token(data)
+    assert decode_continuation_token(token) == data
+    print("✓ 署名どおりのトークンは復元できる")
+
+    payload, _, signature = token.partition('.')
+    forged = encode_continuation_token({'puuid': 'p2', 'match_ids': ['JP1_9']}).partition('.')[0]
+    flipped = payload[:-1] + ('A' if payload[-1] != 'A' else 'B')
+    for bad in (f"{forged}.{signature}", f"{flipped}.{signature}", f"{payload}.{signature[:-1]}x",
+                payload, 'zzz', ''):
+        assert decode_continuation_token(bad) is None, bad
+    print("✓ 本体・署名を書き換えたトークンは拒否")
+
+
+def test_continuation_token_replay():
+    """continuationトークン: 有効期間を過ぎたトークンは使い回せない"""
+    print("\n=== continuationトークンの再利用 テスト ===\n")
+    data = {'puuid': 'p1', 'match_ids': ['JP1_1']}
+    assert decode_continuation_token(encode_continuation_token(data, ttl=60)) == data
+    assert decode_continuation_token(encode_continuation_token(data, ttl=-1)) is None
+    print("✓ 期限切れのトークンは拒否")
+
+
+def test_kll_rank_error():
+    """KLLスケッチ: 順位の誤差が精度パラメータkに見合う範囲に収まる（統合後も）"""
+    print("\n=== KLLスケッチの誤差 テスト ===\n")
+    rng = random.Random(1)
+    values = [rng.gauss(50, 15) for _ in range(20000)]
+    ordered = sorted(values)
+    k = 200
+    bound = 2 * 1.7 / k
+
+    def max_error(sketch):
+        errors = []
+        for i in range(1, 100):
+            value = ordered[i * len(ordered) // 100]
+            errors.append(abs(sketch.rank(value) - bisect.bisect_right(ordered, value) / len(ordered)))
+        return max(errors)
+
+    sketch = KLLSketch(k)
+    for value in values:
+        sketch.update(value)
+    assert sketch.count == len(values)
+    error = max_error(sketch)
+    assert error <= bound, error
+    print(f"✓ 1つのスケッチ: 最大誤差 {error:.4f}（上限 {bound:.4f}）")
+
+    first, second = KLLSketch(k), KLLSketch(k)
+    for value in values[:10000]:
+        first.update(value)
+    for value in values[10000:]:
+        second.update(value)
+    first.merge(second)
+    error = max_error(first)
+    assert first.count == len(values) and error <= bound, error
+    print(f"✓ 統合したスケッチ: 最大誤差 {error:.4f}")
+
+
+def test_percentile_save_race():
+    """パーセンタイル分布: 他のプロセスが先に保存した場合は保存せず、読み込み直して二重に数えない"""
+    print("\n=== パーセンタイル分布の保存競合 テスト ===\n")
+    store = _temp_store()
+    for i in range(40):
+        store.put(_match(f'JP1_{i}', 1700000000000 + i * 60000, with_participants=True))
+    first = PercentileIndex(store, refresh_budget=None)
+    second = PercentileIndex(store, refresh_budget=None)
+
+    # secondが取り込みを始めた後に、firstが同じ試合を取り込んで先に保存する
+    second._load()
+    rows = store.get_matches_after(second.last_rowid, second.refresh_batch)
+    assert first.refresh(force=True) == 40
+    second._ingest([match_data for _, match_data in rows])
+    second._save(rows[-1][0])
+    assert store.get_percentile_watermark() == rows[-1][0]
+    assert not second._loaded
+    print("✓ 後から保存しようとしたプロセスは保存しない")
+
+    assert second.refresh(force=True) == 0
+    expected = {key: sketch.count for key, sketch in first._sketches.items()}
+    assert {key: sketch.count for key, sketch in second._sketches.items()} == expected
+    assert expected['*|*|*'] == 400
+    print("✓ 読み込み直した分布は先に保存された分布と一致（二重に数えない）")
+
+
+def test_key_pool_auth_failure():
+    """キープール: 401/403がしきい値に達したキーは外し、成功で連続回数を戻す（最後の1つは外さない）"""
+    print("\n=== キープールの自動除外 テスト ===\n")
+    pool = KeyPool(['key-a', 'key-b'], auth_failure_threshold=2)
+    key_a, key_b = pool.active_keys()
+
+    assert not pool.record_auth_failure(key_a, 401)
+    pool.record_success(key_a)
+    assert not pool.record_auth_failure(key_a, 401)
+    print("✓ 成功を挟んだ401は連続として数えない")
+
+    assert pool.record_auth_failure(key_a, 403)
+    assert pool.active_keys() == [key_b] and key_a.disabled_reason == 'HTTP 403'
+    print("✓ 連続した401/403でキーを外す")
+
+    for _ in range(3):
+        assert not pool.record_auth_failure(key_b, 403)
+    assert pool.active_keys() == [key_b]
+    print("✓ 最後の1つのキーは外さない")
+
+
+def test_client_skips_revoked_key():
+    """クライアント: 403を返したキーから残りのキーに切り替え、外したキーでは送信しない"""
+    print("\n=== 失効したキーの切り替え テスト ===\n")
+    transport = _FakeRiot(revoked=['key-a'])
+    client = RiotAPIClient(api_keys=['key-a', 'key-b'], transport=transport, rate_limiter=RateLimiter(),
+                           cache=ResponseCache(), match_store=_temp_store(), breakers=CircuitBreakerRegistry(),
+                           metrics=ClientMetrics())
+    client.key_pool.auth_failure_threshold = 1
+    client.backoff_base = 0
+    url = f"{client.routing_url}/riot/account/v1/accounts/by-riot-id/a/b"
+
+    assert client._make_request(url) == {'puuid': 'p1'}
+    assert [k.key for k in client.key_pool.active_keys()] == ['key-b']
+    print(f"✓ 403のキーを外して再試行: {transport.keys_seen}")
+
+    transport.keys_seen.clear()
+    assert client._make_request(url + 'c') == {'puuid': 'p1'}
+    assert transport.keys_seen == ['key-b']
+    print("✓ 以降は外したキーで送信しない")
+
+
+def main():
+    """メインテスト実行"""
+    print("=" * 60)
+    print("League of Legends 汎用ツール - APIモジュール テストスクリプト")
+    print("=" * 60)
+
+    tests = [
+        test_match_sync_watermark,
+        test_match_sync_dedupes_pages,
+        test_continuation_token_tamper,
+        test_continuation_token_replay,
+        test_kll_rank_error,
+        test_percentile_save_race,
+        test_key_pool_auth_failure,
+        test_client_skips_revoked_key,
+    ]
+    failed = []
+    for test in tests:
+        try:
+            test()
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e}")
+            failed.append(test.__name__)
+
+    print("\n" + "=" * 60)
+    if failed:
+        print(f"⚠ 一部のテストに問題がありました: {', '.join(failed)}")
+    else:
+        print("✓ すべてのテストが完了しました")
+    print("=" * 60)
+    return not failed
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)